@@ -0,0 +1,215 @@
+import hmac
+import io
+from datetime import datetime, timedelta
+
+import dateutil.parser
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from werkzeug.exceptions import abort
+
+from availability import availability
+from bulk import MODELS, FORMATS, read_rows, import_rows, export_rows
+from cache import cached, venue_key, artist_key
+from http_cache import conditional, listing_validator, venue_validator, artist_validator
+from models import Artist, Venue, Show
+from queries import venue_listing, venue_page, artist_listing, artist_page, show_listing, \
+    venue_search_results, artist_search_results, show_search_results
+from recommend import recommendations
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+# ----------------------------------------------------------------------------#
+# Serialisation.
+# ----------------------------------------------------------------------------#
+
+def plain(value):
+    # ISO 8601 datetimes instead of the HTTP dates Flask's encoder produces
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(item) for item in value]
+    return value
+
+
+def select_fields(item):
+    # ?fields=id,name keeps only the named keys
+    fields = request.args.get('fields')
+    if not fields:
+        return item
+    wanted = {field.strip() for field in fields.split(',')}
+    return {key: value for key, value in item.items() if key in wanted}
+
+
+def json_response(body):
+    response = jsonify(plain(body))
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def page_response(page, count=None):
+    body = {
+        "data": [select_fields(item) for item in page['items']],
+        "next": page['next_url'],
+        "prev": page['prev_url'],
+    }
+    if count is not None:
+        body["count"] = count
+    return json_response(body)
+
+
+def recommendation_response(kind, entity_id):
+    limit = min(max(request.args.get('limit', 10, type=int), 1), current_app.config['RECOMMEND_MAX_LIMIT'])
+    data = recommendations(kind, entity_id, limit)
+    if data is None:
+        abort(404)
+    return json_response({"data": [select_fields(item) for item in data]})
+
+
+@api.errorhandler(400)
+@api.errorhandler(401)
+@api.errorhandler(404)
+@api.errorhandler(415)
+def api_error(error):
+    return jsonify({"error": error.code, "message": error.description}), error.code
+
+
+# ----------------------------------------------------------------------------#
+# Endpoints.
+# ----------------------------------------------------------------------------#
+
+@api.route('/venues')
+@conditional(listing_validator(Venue, Show))
+def venues():
+    return page_response(venue_listing())
+
+
+@api.route('/venues/<int:venue_id>')
+@conditional(venue_validator)
+def venue(venue_id):
+    data = cached(venue_key(venue_id), lambda: venue_page(venue_id))
+    if data is None:
+        abort(404)
+    return json_response(select_fields(data))
+
+
+@api.route('/venues/<int:venue_id>/recommended-artists')
+@conditional(listing_validator(Venue, Artist, Show))
+def venue_recommendations(venue_id):
+    return recommendation_response('venues', venue_id)
+
+
+@api.route('/venues/search')
+@conditional(listing_validator(Venue, Show))
+def search_venues():
+    count, page = venue_search_results(request.args.get('search_term', ''))
+    return page_response(page, count)
+
+
+@api.route('/artists')
+@conditional(listing_validator(Artist))
+def artists():
+    return page_response(artist_listing())
+
+
+@api.route('/artists/<int:artist_id>')
+@conditional(artist_validator)
+def artist(artist_id):
+    data = cached(artist_key(artist_id), lambda: artist_page(artist_id))
+    if data is None:
+        abort(404)
+    return json_response(select_fields(data))
+
+
+@api.route('/artists/<int:artist_id>/recommended-venues')
+@conditional(listing_validator(Venue, Artist, Show))
+def artist_recommendations(artist_id):
+    return recommendation_response('artists', artist_id)
+
+
+@api.route('/artists/search')
+@conditional(listing_validator(Artist, Show))
+def search_artists():
+    count, page = artist_search_results(request.args.get('search_term', ''))
+    return page_response(page, count)
+
+
+@api.route('/shows')
+@conditional(listing_validator(Show, Venue, Artist))
+def shows():
+    return page_response(show_listing())
+
+
+@api.route('/shows/search')
+@conditional(listing_validator(Show, Venue, Artist))
+def search_shows():
+    count, page = show_search_results(request.args.get('search_term', ''))
+    return page_response(page, count)
+
+
+def datetime_arg(name):
+    try:
+        return dateutil.parser.isoparse(request.args[name]).astimezone()
+    except (KeyError, ValueError):
+        abort(400, 'Expected an ISO 8601 %s.' % name)
+
+
+@api.route('/availability')
+@conditional(listing_validator(Show))
+def venue_availability():
+    # ?venue_ids=1,2&start=...&end=...&duration=90 (minimum free minutes)
+    try:
+        venue_ids = [int(venue_id) for venue_id in request.args.get('venue_ids', '').split(',') if venue_id.strip()]
+    except ValueError:
+        abort(400, 'venue_ids must be a comma separated list of ids.')
+    start, end = datetime_arg('start'), datetime_arg('end')
+    duration = request.args.get('duration', type=int)
+    if not venue_ids or len(venue_ids) > current_app.config['AVAILABILITY_MAX_VENUES']:
+        abort(400, 'Between 1 and %s venue ids are required.' % current_app.config['AVAILABILITY_MAX_VENUES'])
+    if not start < end <= start + timedelta(days=current_app.config['AVAILABILITY_MAX_DAYS']):
+        abort(400, 'end must be after start and within %s days of it.' % current_app.config['AVAILABILITY_MAX_DAYS'])
+    min_duration = timedelta(minutes=duration) if duration else None
+    return json_response({"data": availability(list(dict.fromkeys(venue_ids)), start, end, min_duration)})
+
+
+# The import body's Content-Type and its format. Both need a CORS preflight,
+# so another site's page cannot post one with a plain form
+IMPORT_MIMETYPES = {'text/csv': 'csv', 'application/x-ndjson': 'jsonl'}
+
+
+def bulk_allowed():
+    token = current_app.config['IMPORT_TOKEN']
+    if not token:
+        abort(404)
+    sent = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(sent.encode(), ('Bearer %s' % token).encode()):
+        abort(401)
+
+
+@api.route('/import/<kind>', methods=['POST'])
+def import_data(kind):
+    # The body is a CSV (text/csv) or JSON Lines document, read as it arrives
+    bulk_allowed()
+    if kind not in MODELS:
+        abort(404)
+    format = IMPORT_MIMETYPES.get(request.mimetype)
+    if format is None:
+        abort(415, 'Send text/csv or application/x-ndjson.')
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+    summary = import_rows(kind, read_rows(stream, format), request.args.get('batch_size', 500, type=int))
+    return jsonify(summary)
+
+
+@api.route('/export/<kind>')
+def export_data(kind):
+    bulk_allowed()
+    if kind not in MODELS:
+        abort(404)
+    format = request.args.get('format', 'jsonl')
+    if format not in FORMATS:
+        abort(400)
+    mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(export_rows(kind, format)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, format)
+    return response
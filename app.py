@@ -5,23 +5,53 @@
 import logging
 from logging import Formatter, FileHandler
 
-import babel
-import dateutil.parser
 from flask import Flask, render_template, request, flash, redirect, url_for, jsonify
 from flask_moment import Moment
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.exceptions import abort
 
+from api import api, json_response
+from assets import assets_cli, assets_setup
+from autocomplete import KINDS as AUTOCOMPLETE_KINDS, suggestions
+from availability import BookingConflict, check_booking
+from bulk import data_cli
+from compression import compression_setup
+from counters import counters_cli
+from jobs import jobs_cli, jobs_setup
 from forms import *
+from formatting import formatting_setup
+from helpers import form_error_message
+from metrics import metrics_setup
+from replicas import replica_setup
+from images import images_setup
+from http_cache import cache_control, conditional, listing_validator, venue_validator, artist_validator, \
+    static_validator
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
-from helpers import get_datetime_now, convert_string_to_datetime
-from models import Artist, Venue, Show, db_setup
+from models import Artist, Venue, Show, db_setup, DEFAULT_SHOW_DURATION
+from pagination import stream_page
+from cache import cache_setup, cached, venue_key, artist_key, invalidate_venue, invalidate_artist, invalidate_show
+from queries import venue_areas, venue_page, artist_page, venue_search_results, artist_search_results, \
+    artist_listing, show_listing, show_search_results
 
 app = Flask(__name__)
 moment = Moment(app)
 db = db_setup(app=app)
+cache_setup(app)
+metrics_setup(app)
+replica_setup(app, db)
+formatting_setup(app)
+app.jinja_env.globals['genres'] = GENRES
+jobs_setup(app)
+assets_setup(app)
+compression_setup(app)
+images_setup(app)
+app.register_blueprint(api)
+app.cli.add_command(data_cli)
+app.cli.add_command(counters_cli)
+app.cli.add_command(jobs_cli)
+app.cli.add_command(assets_cli)
 
 
 #
@@ -29,16 +59,7 @@ db = db_setup(app=app)
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
-
-
-app.jinja_env.filters['datetime'] = format_datetime
+# `datetime` is registered by formatting_setup
 
 
 # ----------------------------------------------------------------------------#
@@ -46,6 +67,7 @@ app.jinja_env.filters['datetime'] = format_datetime
 # ----------------------------------------------------------------------------#
 
 @app.route('/')
+@conditional(static_validator)
 def index():
     return render_template('pages/home.html')
 
@@ -54,114 +76,33 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(listing_validator(Venue, Show))
 def venues():
-    # Get all city and state exits on venue rows
-    city_state_list = Venue.query.with_entities(Venue.city, Venue.state).distinct().all()
-    data = []
-    # Get all venues match with  city and state  on venue rows
-
-    for item in city_state_list:
-        venues_list = []
-        venue_query_list = Venue.query.filter_by(city=item[0], state=item[1]).all()
-        for venue in venue_query_list:
-            venues_list.append({
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": len(
-                    [show for show in venue.shows if
-                     convert_string_to_datetime(show.start_time) >= get_datetime_now()]) if len(
-                    venue.shows) != 0 else 0,
-            })
-        data.append({
-            "city": item[0],
-            "state": item[1],
-            "venues": venues_list
-        })
-
-    return render_template('pages/venues.html', areas=data)
-
-
-@app.route('/venues/search', methods=['POST'])
+    # Venues grouped by city and state with their upcoming show counts
+    data, page = venue_areas()
+    return render_template('pages/venues.html', areas=data, page=page)
+
+
+@app.route('/venues/search', methods=['GET', 'POST'])
+@conditional(listing_validator(Venue, Show))
 def search_venues():
-    data = []
-    venue_search_term = request.form['search_term']
-    if ',' in venue_search_term:
-        city_search_term = venue_search_term.split(',')[0]
-        state_search_term = venue_search_term.split(',')[1]
-        venue_list = Venue.query.filter(Venue.city.ilike('%' + city_search_term + '%'),
-                                        Venue.state.ilike('%' + state_search_term + '%')).all()
-    else:
-        venue_list = Venue.query.filter(Venue.name.ilike('%' + venue_search_term + '%')).all()
-    for venue in venue_list:
-        data.append({
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": len(
-                [show for show in venue.shows if
-                 convert_string_to_datetime(show.start_time) >= get_datetime_now()]) if len(
-                venue.shows) != 0 else 0,
-        })
+    venue_search_term = request.values.get('search_term', '')
+    count, page = venue_search_results(venue_search_term)
     response = {
-        "count": len(venue_list),
-        "data": data
+        "count": count,
+        "data": page['items']
     }
-    return render_template('pages/search_venues.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+    return render_template('pages/search_venues.html', results=response, page=page,
+                           search_term=venue_search_term)
 
 
 @app.route('/venues/<int:venue_id>', methods=['GET'])
+@conditional(venue_validator)
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
-    venue_details = Venue.query.get(venue_id)
-    upcoming_shows_list = []
-    past_shows_list = []
-
-    upcoming_shows = [show for show in venue_details.shows if
-                      convert_string_to_datetime(show.start_time) > get_datetime_now()] if len(
-        venue_details.shows) != 0 else []
-    past_shows = [show for show in venue_details.shows if
-                  convert_string_to_datetime(show.start_time) < get_datetime_now()] if len(
-        venue_details.shows) != 0 else []
-    for show in upcoming_shows:
-        upcoming_shows_list.append({
-            "artist_id": show.artist_id,
-            "artist_name": show.Artist.name,
-            "artist_image_link": show.Artist.image_link,
-            "start_time": show.start_time,
-            "title": show.show_title,
-            "register_link": show.register_link,
-            "description": show.description
-
-        })
-    for show in past_shows:
-        past_shows_list.append({
-            "artist_id": show.artist_id,
-            "artist_name": show.Artist.name,
-            "artist_image_link": show.Artist.image_link,
-            "start_time": show.start_time,
-            "title": show.show_title,
-            "register_link": show.register_link,
-            "description": show.description
-        })
-
-    data = {
-        "id": venue_details.id,
-        "name": venue_details.name,
-        "genres": venue_details.genres,
-        "address": venue_details.address,
-        "city": venue_details.city,
-        "state": venue_details.state,
-        "phone": venue_details.phone,
-        "facebook_link": venue_details.facebook_link,
-        "seeking_talent": venue_details.seeking_talent,
-        "seeking_description": venue_details.seeking_description,
-        "image_link": venue_details.image_link,
-        "past_shows": past_shows_list,
-        "upcoming_shows": upcoming_shows_list,
-        "past_shows_count": len(past_shows_list),
-        "upcoming_shows_count": len(upcoming_shows_list),
-    }
-
+    data = cached(venue_key(venue_id), lambda: venue_page(venue_id))
+    if data is None:
+        abort(404)
     return render_template('pages/show_venue.html', venue=data)
 
 
@@ -219,6 +160,7 @@ def delete_venue(venue_id):
     try:
         Venue.query.filter_by(id=venue_id).delete()
         db.session.commit()
+        invalidate_venue(venue_id)
     except:
         error = True
         db.session.rollback()
@@ -233,100 +175,32 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional(listing_validator(Artist))
 def artists():
-    artists_list = Artist.query.all()
-    data = []
-    for artist in artists_list:
-        data.append({
-            "id": artist.id,
-            "name": artist.name
-        })
-    return render_template('pages/artists.html', artists=data)
+    page = artist_listing(stream=True)
+    return stream_page('pages/artists.html', artists=page['items'], page=page)
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
+@conditional(listing_validator(Artist, Show))
 def search_artists():
-    data = []
-    artist_search_term = request.form['search_term']
-
-    if ',' in artist_search_term:
-        city_search_term = artist_search_term.split(',')[0]
-        state_search_term = artist_search_term.split(',')[1]
-        artist_list = Artist.query.filter(Artist.city.ilike('%' + city_search_term + '%'),
-                                          Artist.state.ilike('%' + state_search_term + '%')).all()
-    else:
-        artist_list = Artist.query.filter(Artist.name.ilike('%' + artist_search_term + '%')).all()
-    for artist in artist_list:
-        data.append({
-            "id": artist.id,
-            "name": artist.name,
-            "num_upcoming_shows": len(
-                [show for show in artist.shows if
-                 convert_string_to_datetime(show.start_time) >= get_datetime_now()]) if len(
-                artist.shows) != 0 else 0
-        })
+    artist_search_term = request.values.get('search_term', '')
+    count, page = artist_search_results(artist_search_term)
     response = {
-        "count": len(artist_list),
-        "data": data
+        "count": count,
+        "data": page['items']
     }
-    return render_template('pages/search_artists.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+    return render_template('pages/search_artists.html', results=response, page=page,
+                           search_term=artist_search_term)
 
 
 @app.route('/artists/<int:artist_id>')
+@conditional(artist_validator)
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
-    artist_details = Artist.query.get(artist_id)
-    upcoming_shows_list = []
-    past_shows_list = []
-
-    upcoming_shows = [show for show in artist_details.shows if
-                      convert_string_to_datetime(show.start_time) > get_datetime_now()] if len(
-        artist_details.shows) != 0 else []
-    past_shows = [show for show in artist_details.shows if
-                  convert_string_to_datetime(show.start_time) < get_datetime_now()] if len(
-        artist_details.shows) != 0 else []
-    for show in upcoming_shows:
-        upcoming_shows_list.append({
-            "venue_id": show.venue_id,
-            "venue_name": show.Venue.name,
-            "venue_image_link": show.Venue.image_link,
-            "start_time": show.start_time,
-            "title": show.show_title,
-            "register_link": show.register_link,
-            "description": show.description
-
-        })
-    for show in past_shows:
-        past_shows_list.append({
-            "venue_id": show.venue_id,
-            "venue_name": show.Venue.name,
-            "venue_image_link": show.Venue.image_link,
-            "start_time": show.start_time,
-            "title": show.show_title,
-            "register_link": show.register_link,
-            "description": show.description
-        })
-
-    data = {
-        "id": artist_details.id,
-        "name": artist_details.name,
-        "genres": artist_details.genres,
-        "address": artist_details.address,
-        "city": artist_details.city,
-        "state": artist_details.state,
-        "phone": artist_details.phone,
-        'website': artist_details.website,
-        "facebook_link": artist_details.facebook_link,
-        "seeking_talent": artist_details.seeking_talent,
-        "seeking_description": artist_details.seeking_description,
-        "image_link": artist_details.image_link,
-        "past_shows": past_shows_list,
-        "upcoming_shows": upcoming_shows_list,
-        "past_shows_count": len(past_shows_list),
-        "upcoming_shows_count": len(upcoming_shows_list),
-    }
-
+    data = cached(artist_key(artist_id), lambda: artist_page(artist_id))
+    if data is None:
+        abort(404)
     return render_template('pages/show_artist.html', artist=data)
 
 
@@ -387,6 +261,7 @@ def edit_artist_submission(artist_id):
             artist.seeking_talent = seeking_talent_value if seeking_talent_value is not None else False
             artist.seeking_description = request.form['seeking_description']
             db.session.commit()
+            invalidate_artist(artist_id)
 
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -447,6 +322,7 @@ def edit_venue_submission(venue_id):
             venue.seeking_talent = seeking_talent_value if seeking_talent_value is not None else False
             venue.seeking_description = request.form['seeking_description']
             db.session.commit()
+            invalidate_venue(venue_id)
 
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -467,14 +343,18 @@ def edit_show(show_id):
         "venue_id": show_details.venue_id,
         "register_link": show_details.register_link,
         "description": show_details.description,
-        "start_time": convert_string_to_datetime(show_details.start_time),
+        "start_time": show_details.start_time,
+        "end_time": show_details.end_time,
     }
     form.title.data = show_details.show_title
     form.artist_id.data = show_details.artist_id
+    form.artist_name.data = show_details.Artist.name
     form.venue_id.data = show_details.venue_id
+    form.venue_name.data = show_details.Venue.name
     form.register_link.data = show_details.register_link
     form.description.data = show_details.description
-    form.start_time.data = convert_string_to_datetime(show_details.start_time)
+    form.start_time.data = show_details.start_time
+    form.end_time.data = show_details.end_time
     return render_template('forms/edit_show.html', form=form, show=show)
 
 
@@ -484,14 +364,26 @@ def edit_show_submission(show_id):
     try:
         form = ShowForm(request.form)
         if form.validate_on_submit():
+            end_time = form.end_time.data or form.start_time.data + DEFAULT_SHOW_DURATION
+            check_booking(request.form['venue_id'], form.start_time.data, end_time, show_id=show_id)
+            previous = show.venue_id, show.artist_id
             show.show_title = request.form['title']
             show.artist_id = request.form['artist_id']
             show.venue_id = request.form['venue_id']
             show.register_link = request.form['register_link']
-            show.start_time = request.form['start_time']
+            show.start_time = form.start_time.data
+            show.end_time = end_time
             show.description = request.form['description']
             db.session.commit()
+            invalidate_show(previous, (show.venue_id, show.artist_id))
+        else:
+            flash('Show could not be updated. ' + form_error_message(form))
+            return redirect(url_for('edit_show', show_id=show_id))
 
+    except BookingConflict as e:
+        db.session.rollback()
+        flash(str(e))
+        return redirect(url_for('edit_show', show_id=show_id))
     except SQLAlchemyError as e:
         db.session.rollback()
     finally:
@@ -556,6 +448,7 @@ def delete_artist(artist_id):
     try:
         Artist.query.filter_by(id=artist_id).delete()
         db.session.commit()
+        invalidate_artist(artist_id)
     except:
         error = True
         db.session.rollback()
@@ -571,24 +464,11 @@ def delete_artist(artist_id):
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(listing_validator(Show, Venue, Artist))
 def shows():
-    # displays list of shows at /shows
-    shows_list = Show.query.all()
-    data = []
-    for show in shows_list:
-        data.append({
-            "id": show.id,
-            "title": show.show_title,
-            "venue_id": show.venue_id,
-            "venue_name": show.Venue.name,
-            "artist_id": show.artist_id,
-            "artist_name": show.Artist.name,
-            "artist_image_link": show.Artist.image_link,
-            "start_time": show.start_time,
-            "description": show.description,
-            "register_link": show.register_link
-        })
-    return render_template('pages/shows.html', shows=data)
+    # displays list of shows at /shows, streamed as the rows are read
+    page = show_listing(stream=True)
+    return stream_page('pages/shows.html', shows=page['items'], page=page)
 
 
 @app.route('/shows/create')
@@ -607,20 +487,30 @@ def create_show_submission():
         if form.validate_on_submit():
             artist_id = request.form['artist_id']
             venue_id = request.form['venue_id']
-            start_time = request.form['start_time']
+            start_time = form.start_time.data
+            end_time = form.end_time.data or start_time + DEFAULT_SHOW_DURATION
             description = request.form['description']
-            register_link = request.form.getlist('register_link')
+            register_link = request.form['register_link']
+            check_booking(venue_id, start_time, end_time)
             show = Show(show_title=show_title, artist_id=artist_id, venue_id=venue_id, description=description,
-                        start_time=start_time, register_link=register_link)
+                        start_time=start_time, end_time=end_time, register_link=register_link)
             db.session.add(show)
             db.session.commit()
+            invalidate_show((venue_id, artist_id))
+        else:
+            error = form_error_message(form)
 
+    except BookingConflict as e:
+        error = str(e)
+        db.session.rollback()
     except SQLAlchemyError as e:
         error = True
         db.session.rollback()
     finally:
         db.session.close()
-        if error:
+        if isinstance(error, str):
+            flash('Show with title ' + show_title + ' could not be listed. ' + error)
+        elif error:
             flash('An error occurred. Show with title ' + show_title + ' could not be listed.')
         else:
             flash('Show ' + show_title + ' was successfully listed!')
@@ -632,8 +522,13 @@ def create_show_submission():
 def delete_show(show_id):
     error = False
     try:
-        Show.query.filter_by(id=show_id).delete()
-        db.session.commit()
+        # Deleted through the session so the show counters are adjusted
+        show = Show.query.get(show_id)
+        if show is not None:
+            show_pages = show.venue_id, show.artist_id
+            db.session.delete(show)
+            db.session.commit()
+            invalidate_show(show_pages)
     except:
         error = True
         db.session.rollback()
@@ -645,30 +540,32 @@ def delete_show(show_id):
             return jsonify({'success': True})
 
 
-@app.route('/shows/search', methods=['POST'])
+@app.route('/shows/search', methods=['GET', 'POST'])
+@conditional(listing_validator(Show, Venue, Artist))
 def search_shows():
-    data = []
-    show_search_term = request.form['search_term']
-    shows_list = Show.query.filter(Show.show_title.ilike('%' + show_search_term + '%')).all()
-    for show in shows_list:
-        data.append({
-            "id": show.id,
-            "title": show.show_title,
-            "venue_id": show.venue_id,
-            "venue_name": show.Venue.name,
-            "artist_id": show.artist_id,
-            "artist_name": show.Artist.name,
-            "artist_image_link": show.Artist.image_link,
-            "start_time": show.start_time,
-            "description": show.description,
-            "register_link": show.register_link
-        })
+    show_search_term = request.values.get('search_term', '')
+    count, page = show_search_results(show_search_term)
     response = {
-        "count": len(shows_list),
-        "data": data
+        "count": count,
+        "data": page['items']
     }
-    return render_template('pages/search_shows.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+    return render_template('pages/search_shows.html', results=response, page=page,
+                           search_term=show_search_term)
+
+
+#  Autocomplete
+#  ----------------------------------------------------------------
+
+@app.route('/autocomplete')
+def autocomplete():
+    # ?type=artists|venues|cities&q=<prefix>&limit=<n>
+    kind = request.args.get('type', '')
+    if kind not in AUTOCOMPLETE_KINDS:
+        abort(400)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), app.config['AUTOCOMPLETE_MAX_LIMIT'])
+    response = json_response({"data": suggestions(kind, request.args.get('q', ''), limit)})
+    response.headers['Cache-Control'] = cache_control('autocomplete')
+    return response
 
 
 @app.errorhandler(404)
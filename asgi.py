@@ -0,0 +1,294 @@
+import asyncio
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import g, render_template, request, request_started
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException, abort
+
+from app import app
+from cache import cache_version, page_cache, venue_key, artist_key
+from http_cache import validates, validation, not_modified, validated
+from models import Artist, Venue, engine_options, set_local_statement_timeout
+from pagination import page_limit, page_result, page_statement
+from queries import VENUE_AREA_SORT_KEYS, SHOW_SORT_KEYS, venue_listing_statement, group_areas, \
+    venue_shows_statement, venue_data, artist_shows_statement, artist_data, show_cards, search_statements, \
+    show_search_statements
+
+# ----------------------------------------------------------------------------#
+# Async serving mode.
+# ----------------------------------------------------------------------------#
+# Run with an ASGI server, e.g. `uvicorn asgi:application --workers 4`.
+# GET requests for the read routes below run as coroutines over an async
+# engine, so a worker keeps serving other requests while it waits for the
+# database, and detail pages run their queries concurrently. Every other
+# request (forms, writes, the API) goes to the WSGI app on a thread pool.
+# Async reads always use the primary (or ASYNC_DATABASE_URI), not replicas.
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+psycopg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_url(uri):
+    url = make_url(uri)
+    if url.get_backend_name() in ASYNC_DRIVERS and url.get_driver_name() not in ('asyncpg', 'psycopg', 'aiosqlite'):
+        url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+    return url
+
+
+def create_engine(config):
+    uri = config['ASYNC_DATABASE_URI'] or config['SQLALCHEMY_DATABASE_URI']
+    try:
+        engine = create_async_engine(async_url(uri), **engine_options(config, uri))
+    except ImportError as error:
+        # No async driver installed: serve everything through WSGI
+        app.logger.warning('Async mode disabled, no async driver for %s (%s)', make_url(uri).get_backend_name(),
+                           error)
+        return None
+    if config['DB_POOLER'] == 'transaction' and config['DB_STATEMENT_TIMEOUT'] \
+            and engine.dialect.name == 'postgresql':
+        set_local_statement_timeout(engine.sync_engine, config['DB_STATEMENT_TIMEOUT'])
+    return engine
+
+
+engine = create_engine(app.config)
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+# Each query checks out its own connection, so queries gathered with
+# asyncio.gather run at the same time.
+
+async def fetch_rows(statement):
+    async with engine.connect() as connection:
+        return [dict(row) for row in (await connection.execute(statement)).mappings()]
+
+
+async def fetch_first(statement):
+    async with engine.connect() as connection:
+        return (await connection.execute(statement)).first()
+
+
+async def fetch_scalar(statement):
+    async with engine.connect() as connection:
+        return (await connection.execute(statement)).scalar()
+
+
+async def paginate(statement, sort_keys, maximum=None):
+    limit = page_limit(maximum)
+    statement, forward, cursor = page_statement(statement, sort_keys, limit)
+    return page_result(await fetch_rows(statement), sort_keys, limit, forward, cursor)
+
+
+async def cached(key, build):
+    # Like cache.cached, building the value with a coroutine
+    version = cache_version()
+    entry = page_cache().get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    value = await build()
+    if value is not None:
+        page_cache().set(key, (version, value))
+    return value
+
+
+# ----------------------------------------------------------------------------#
+# Views.
+# ----------------------------------------------------------------------------#
+# Async versions of the app.py views with the same endpoint names; the
+# templates, ETag validators and request hooks are the app's own.
+
+VIEWS = {}
+
+
+def async_view(endpoint):
+    def decorator(view):
+        VIEWS[endpoint] = view
+        return view
+    return decorator
+
+
+@async_view('venues')
+async def venues():
+    page = await paginate(venue_listing_statement(), VENUE_AREA_SORT_KEYS)
+    return render_template('pages/venues.html', areas=group_areas(page['items']), page=page)
+
+
+async def load_venue(venue_id):
+    venue_details, upcoming_shows_list, past_shows_list = await asyncio.gather(
+        fetch_first(select(Venue.__table__).where(Venue.id == venue_id)),
+        fetch_rows(venue_shows_statement(venue_id, upcoming=True)),
+        fetch_rows(venue_shows_statement(venue_id, upcoming=False)))
+    if venue_details is None:
+        return None
+    return venue_data(venue_details, upcoming_shows_list, past_shows_list)
+
+
+@async_view('show_venue')
+async def show_venue(venue_id):
+    data = await cached(venue_key(venue_id), lambda: load_venue(venue_id))
+    if data is None:
+        abort(404)
+    return render_template('pages/show_venue.html', venue=data)
+
+
+async def load_artist(artist_id):
+    artist_details, upcoming_shows_list, past_shows_list = await asyncio.gather(
+        fetch_first(select(Artist.__table__).where(Artist.id == artist_id)),
+        fetch_rows(artist_shows_statement(artist_id, upcoming=True)),
+        fetch_rows(artist_shows_statement(artist_id, upcoming=False)))
+    if artist_details is None:
+        return None
+    return artist_data(artist_details, upcoming_shows_list, past_shows_list)
+
+
+@async_view('show_artist')
+async def show_artist(artist_id):
+    data = await cached(artist_key(artist_id), lambda: load_artist(artist_id))
+    if data is None:
+        abort(404)
+    return render_template('pages/show_artist.html', artist=data)
+
+
+@async_view('shows')
+async def shows():
+    # Up to the page size the streamed WSGI view allows, so ?limit= means the same in both modes
+    page = await paginate(show_cards(), SHOW_SORT_KEYS, app.config['MAX_STREAM_PAGE_SIZE'])
+    return render_template('pages/shows.html', shows=page['items'], page=page)
+
+
+async def search_results(statements, search_term):
+    # The in-memory search backend may load its index with the sync session,
+    # so the statements are built on a thread (with this request's context)
+    statement, sort_keys, count = await asyncio.to_thread(*statements, search_term)
+    count, page = await asyncio.gather(fetch_scalar(count), paginate(statement, sort_keys))
+    return {"count": count, "data": page['items']}, page
+
+
+@async_view('search_venues')
+async def search_venues():
+    search_term = request.values.get('search_term', '')
+    results, page = await search_results((search_statements, Venue), search_term)
+    return render_template('pages/search_venues.html', results=results, page=page, search_term=search_term)
+
+
+@async_view('search_artists')
+async def search_artists():
+    search_term = request.values.get('search_term', '')
+    results, page = await search_results((search_statements, Artist), search_term)
+    return render_template('pages/search_artists.html', results=results, page=page, search_term=search_term)
+
+
+@async_view('search_shows')
+async def search_shows():
+    search_term = request.values.get('search_term', '')
+    results, page = await search_results((show_search_statements,), search_term)
+    return render_template('pages/search_shows.html', results=results, page=page, search_term=search_term)
+
+
+async def conditional(endpoint, view, view_args):
+    # http_cache.conditional with the validator query run on the async engine
+    validator = getattr(app.view_functions[endpoint], 'validator', None)
+    if validator is None or not validates():
+        return await view(**view_args)
+    statement = validator(**view_args)
+    g._validator_values = () if statement is None else tuple(await fetch_first(statement))
+    etag = validation(g._validator_values)
+    if etag is None:
+        return await view(**view_args)
+    if not_modified(etag):
+        return validated(app.response_class(status=304), etag)
+    response = app.make_response(await view(**view_args))
+    if response.status_code != 200:
+        return response
+    return validated(response, etag)
+
+
+# ----------------------------------------------------------------------------#
+# ASGI application.
+# ----------------------------------------------------------------------------#
+
+wsgi = WsgiToAsgi(app)
+
+
+def wsgi_environ(scope):
+    environ = {
+        "REQUEST_METHOD": scope['method'],
+        "SCRIPT_NAME": scope.get('root_path', '').encode('utf8').decode('latin1'),
+        "PATH_INFO": scope['path'][len(scope.get('root_path', '')):].encode('utf8').decode('latin1'),
+        "QUERY_STRING": scope['query_string'].decode('ascii'),
+        "SERVER_NAME": scope['server'][0] if scope.get('server') else 'localhost',
+        "SERVER_PORT": str(scope['server'][1]) if scope.get('server') else '80',
+        "SERVER_PROTOCOL": 'HTTP/%s' % scope['http_version'],
+        "REMOTE_ADDR": scope['client'][0] if scope.get('client') else None,
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get('scheme', 'http'),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+async def dispatch(environ, endpoint):
+    # Flask's full_dispatch_request, awaiting the view; finalize_request
+    # sends request_finished
+    with app.request_context(environ):
+        try:
+            try:
+                request_started.send(app, _async_wrapper=app.ensure_sync)
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await conditional(endpoint, VIEWS[endpoint], request.view_args)
+            except Exception as error:
+                rv = app.handle_user_exception(error)
+            response = app.finalize_request(rv)
+        except Exception as error:
+            response = app.handle_exception(error)
+        body = b'' if environ['REQUEST_METHOD'] == 'HEAD' else b''.join(response.iter_encoded())
+        response.close()
+    return response, body
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({"type": 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if engine is not None:
+                await engine.dispose()
+            await send({"type": 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    endpoint = None
+    if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD') and engine is not None:
+        environ = wsgi_environ(scope)
+        try:
+            endpoint = app.url_map.bind_to_environ(environ).match()[0]
+        except HTTPException:
+            pass
+    if endpoint not in VIEWS:
+        return await wsgi(scope, receive, send)
+    response, body = await dispatch(environ, endpoint)
+    await send({
+        "type": 'http.response.start',
+        "status": response.status_code,
+        "headers": [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.items()],
+    })
+    await send({"type": 'http.response.body', "body": body})
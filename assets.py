@@ -0,0 +1,192 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+import click
+from flask import current_app, request, send_file, url_for
+from flask.cli import AppGroup, with_appcontext
+from werkzeug.exceptions import abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # only the gzip variants are built
+    brotli = None
+
+try:
+    import rcssmin
+    import rjsmin
+except ImportError:  # the conservative built-in minifiers are used instead
+    rcssmin = rjsmin = None
+
+
+# ----------------------------------------------------------------------------#
+# Bundles.
+# ----------------------------------------------------------------------------#
+# `flask assets build` concatenates and minifies each bundle's files (paths
+# in the static folder) into static/<ASSETS_DIRECTORY>/<name>.<hash>.<ext>,
+# with .gz and .br variants next to it, and records the file names in the
+# manifest there. Scripts keep their load order: head.js runs before the
+# page is parsed, defer.js after it.
+
+BUNDLES = {
+    'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css', 'css/main.responsive.css',
+                 'css/main.quickfix.css'],
+    'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    'defer.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+
+MANIFEST = 'manifest.json'
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def minify_css(source):
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    # Not around ':' or '+', which are significant in selectors and calc()
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+    # Without a real parser only blank lines and trailing whitespace are safe to drop
+    return '\n'.join(line.rstrip() for line in source.splitlines() if line.strip())
+
+
+def rebase_urls(source, path, directory):
+    # Relative url()s point from the source file's folder; rewrite them to
+    # point from the bundle's folder instead
+    def rebase(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', url):
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(path), url))
+        return 'url(%s%s%s)' % (quote, posixpath.relpath(target, directory), quote)
+    return CSS_URL.sub(rebase, source)
+
+
+def bundle(static_folder, name, paths, directory):
+    parts = []
+    for path in paths:
+        with open(os.path.join(static_folder, path), encoding='utf-8') as source:
+            content = source.read()
+        if name.endswith('.css'):
+            parts.append(minify_css(rebase_urls(content, path, directory)))
+        else:
+            # A file without a trailing semicolon must not run into the next one
+            parts.append(minify_js(content).rstrip().rstrip(';') + ';')
+    return '\n'.join(parts).encode('utf-8')
+
+
+def write(path, content):
+    with open(path, 'wb') as output:
+        output.write(content)
+
+
+def build(static_folder, directory, compress_min_size=256):
+    """Write every bundle and its compressed variants to `directory` (in the
+    static folder) and return the manifest {bundle name: static path}."""
+    os.makedirs(os.path.join(static_folder, directory), exist_ok=True)
+    manifest = {}
+    for name, paths in BUNDLES.items():
+        content = bundle(static_folder, name, paths, directory)
+        stem, extension = os.path.splitext(name)
+        filename = posixpath.join(directory, '%s.%s%s' % (stem, hashlib.sha256(content).hexdigest()[:12], extension))
+        path = os.path.join(static_folder, filename)
+        write(path, content)
+        if len(content) >= compress_min_size:
+            # mtime=0 so rebuilding the same content gives the same file
+            write(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                write(path + '.br', brotli.compress(content, quality=11))
+        manifest[name] = filename
+    write(os.path.join(static_folder, directory, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(static_folder, directory):
+    try:
+        with open(os.path.join(static_folder, directory, MANIFEST)) as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+
+
+# ----------------------------------------------------------------------------#
+# Templates.
+# ----------------------------------------------------------------------------#
+
+def asset_urls(name):
+    """URLs to include for a bundle: the fingerprinted bundle once built, or
+    its source files (e.g. in development, or with ASSETS_ENABLED off)."""
+    manifest = current_app.extensions['assets']
+    if current_app.config['ASSETS_ENABLED'] and name in manifest:
+        return [url_for('assets', filename=posixpath.relpath(manifest[name], current_app.config['ASSETS_DIRECTORY']))]
+    return [url_for('static', filename=path) for path in BUNDLES.get(name, [name])]
+
+
+# ----------------------------------------------------------------------------#
+# Serving.
+# ----------------------------------------------------------------------------#
+
+# Content-Encoding and file suffix, most preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def serve_asset(filename):
+    # Fingerprinted files never change, so they can be cached for good
+    directory = os.path.join(current_app.static_folder, current_app.config['ASSETS_DIRECTORY'])
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            encoding, path = name, path + suffix
+            break
+    response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], conditional=True, etag=True,
+                         max_age=current_app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def assets_setup(app):
+    directory = app.config['ASSETS_DIRECTORY']
+    app.extensions['assets'] = load_manifest(app.static_folder, directory)
+    app.add_url_rule('%s/%s/<path:filename>' % (app.static_url_path, directory), 'assets', serve_asset)
+    app.jinja_env.globals['asset_urls'] = asset_urls
+
+
+# ----------------------------------------------------------------------------#
+# CLI.
+# ----------------------------------------------------------------------------#
+
+assets_cli = AppGroup('assets', help='Build the static asset bundles.')
+
+
+@assets_cli.command('build')
+@with_appcontext
+def build_command():
+    """Bundle, minify, fingerprint and precompress the static assets."""
+    app = current_app._get_current_object()
+    manifest = build(app.static_folder, app.config['ASSETS_DIRECTORY'], app.config['ASSETS_COMPRESS_MIN_SIZE'])
+    app.extensions['assets'] = manifest
+    for name, filename in sorted(manifest.items()):
+        sizes = ['%s %d' % (suffix or 'raw', os.path.getsize(os.path.join(app.static_folder, filename + suffix)))
+                 for suffix in ('', '.gz', '.br') if os.path.isfile(os.path.join(app.static_folder, filename + suffix))]
+        click.echo('%-10s %s (%s bytes)' % (name, filename, ', '.join(sizes)))
+    if brotli is None:
+        click.echo('brotli is not installed, only gzip variants were written.', err=True)
@@ -0,0 +1,265 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+
+from models import Artist, Venue, Show, db
+
+
+# ----------------------------------------------------------------------------#
+# Prefix index.
+# ----------------------------------------------------------------------------#
+# Every word of a name is a key in one sorted array, so the entries with a
+# word starting with the typed prefix are one contiguous slice found with
+# bisect. Results are ranked whole-name matches first, then by weight (shows
+# booked, or venues and artists in a city), and kept per prefix until the
+# next write.
+
+def normalize(text):
+    # Case and accent insensitive, punctuation as spaces: "Café-Bar" -> "cafe bar"
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', text.casefold()))
+
+
+def word_keys(normalized):
+    # "the musical hop" -> "the musical hop", "musical hop", "hop"
+    words = normalized.split(' ') if normalized else []
+    return [' '.join(words[index:]) for index in range(len(words))]
+
+
+class PrefixIndex(object):
+    """Sorted (key, id) pairs. Writes insert into and delete from the array
+    in place, so an edit never rebuilds the index."""
+
+    def __init__(self, max_limit, cache_size):
+        self.max_limit = max_limit
+        self.cache_size = cache_size
+        self.keys = []
+        self.entries = {}
+        self.cache = {}
+
+    def entry(self, entry_id, name, weight, item):
+        normalized = normalize(name)
+        self.entries[entry_id] = (normalized, word_keys(normalized), weight, item)
+        return self.entries[entry_id][1]
+
+    def load(self, rows):
+        # (id, name, weight, item) rows, sorted once
+        self.entries = {}
+        self.keys = sorted((key, entry_id) for entry_id, name, weight, item in rows
+                           for key in self.entry(entry_id, name, weight, item))
+        self.cache.clear()
+
+    def put(self, entry_id, name, weight, item):
+        self.remove(entry_id)
+        for key in self.entry(entry_id, name, weight, item):
+            bisect.insort(self.keys, (key, entry_id))
+        self.cache.clear()
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in entry[1]:
+            index = bisect.bisect_left(self.keys, (key, entry_id))
+            if index < len(self.keys) and self.keys[index] == (key, entry_id):
+                del self.keys[index]
+        self.cache.clear()
+
+    def search(self, prefix, limit):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        ranked = self.cache.get(prefix)
+        if ranked is None:
+            start = bisect.bisect_left(self.keys, (prefix,))
+            end = bisect.bisect_left(self.keys, (prefix + '\U0010ffff',), start)
+            found = {entry_id for _, entry_id in self.keys[start:end]}
+            ranked = [self.entries[entry_id][3] for entry_id in
+                      heapq.nsmallest(self.max_limit, found, key=lambda entry_id: self.rank(entry_id, prefix))]
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[prefix] = ranked
+        return ranked[:limit]
+
+    def rank(self, entry_id, prefix):
+        normalized, _, weight, _ = self.entries[entry_id]
+        return not normalized.startswith(prefix), -weight, normalized, entry_id
+
+
+# ----------------------------------------------------------------------------#
+# Artists, venues and cities.
+# ----------------------------------------------------------------------------#
+
+MODELS = {'venues': Venue, 'artists': Artist}
+
+KINDS = ('artists', 'venues', 'cities')
+
+
+class Autocomplete(object):
+    """Prefix indexes for artist and venue names and for the cities they are
+    in, kept in process memory. Rows written through the ORM are reloaded on
+    the next query, and everything every AUTOCOMPLETE_MAX_AGE seconds to pick
+    up writes made by other processes."""
+
+    def __init__(self, max_age, max_limit, cache_size):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.indexes = {kind: PrefixIndex(max_limit, cache_size) for kind in KINDS}
+        self.loaded_at = None
+        # (kind, id) -> city key, venues plus artists per city key, and its display spelling
+        self.located = {}
+        self.cities = {}
+        self.spelling = {}
+        self.dirty = {'venues': set(), 'artists': set()}
+
+    def touch(self, kind, ids):
+        with self.lock:
+            self.dirty[kind].update(int(entity_id) for entity_id in ids if entity_id is not None)
+
+    def refresh(self, venue_ids=None, artist_ids=None):
+        if venue_ids is None and artist_ids is None:
+            with self.lock:
+                self.loaded_at = None
+            return
+        self.touch('venues', venue_ids or ())
+        self.touch('artists', artist_ids or ())
+
+    def rows(self, kind, ids=None):
+        model = MODELS[kind]
+        statement = select(model.id, model.name, model.city, model.state, model.upcoming_shows_count,
+                           model.past_shows_count)
+        if ids is not None:
+            statement = statement.where(model.id.in_(ids))
+        # Flushing pending writes would call touch() under the lock
+        with db.session.no_autoflush:
+            result = db.session.execute(statement).all()
+        for entity_id, name, city, state, upcoming, past in result:
+            yield entity_id, name, (upcoming or 0) + (past or 0), \
+                {"id": entity_id, "name": name, "city": city, "state": state}
+
+    def locate(self, kind, entity_id, item):
+        # Moves a venue or artist between cities, returning the cities whose
+        # counts changed
+        changed = set()
+        old = self.located.pop((kind, entity_id), None)
+        if old is not None:
+            self.cities[old] -= 1
+            changed.add(old)
+        if item is not None and normalize(item["city"]):
+            key = (normalize(item["city"]), (item["state"] or '').upper())
+            self.located[(kind, entity_id)] = key
+            self.cities[key] = self.cities.get(key, 0) + 1
+            # Spelled as by the first venue or artist found there
+            self.spelling.setdefault(key, (item["city"], item["state"]))
+            changed.add(key)
+        return changed
+
+    def city_entry(self, key):
+        count = self.cities.get(key, 0)
+        if not count:
+            self.cities.pop(key, None)
+            self.spelling.pop(key, None)
+            return None
+        city, state = self.spelling[key]
+        return key, city, count, {"city": city, "state": state, "count": count}
+
+    def load(self):
+        self.located, self.cities, self.spelling = {}, {}, {}
+        for kind in MODELS:
+            rows = list(self.rows(kind))
+            for entity_id, _, _, item in rows:
+                self.locate(kind, entity_id, item)
+            self.indexes[kind].load(rows)
+        self.indexes['cities'].load([self.city_entry(key) for key in self.cities])
+        self.loaded_at = time.monotonic()
+        self.dirty = {kind: set() for kind in MODELS}
+
+    def update(self, kind, ids):
+        cities = set()
+        found = set()
+        for entity_id, name, weight, item in self.rows(kind, ids):
+            self.indexes[kind].put(entity_id, name, weight, item)
+            cities |= self.locate(kind, entity_id, item)
+            found.add(entity_id)
+        for entity_id in set(ids) - found:
+            self.indexes[kind].remove(entity_id)
+            cities |= self.locate(kind, entity_id, None)
+        for key in cities:
+            entry = self.city_entry(key)
+            if entry is None:
+                self.indexes['cities'].remove(key)
+            else:
+                self.indexes['cities'].put(*entry)
+
+    def sync(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.max_age:
+            self.load()
+        for kind, ids in self.dirty.items():
+            if ids:
+                self.update(kind, sorted(ids))
+                ids.clear()
+
+    def suggest(self, kind, prefix, limit):
+        with self.lock:
+            self.sync()
+            return self.indexes[kind].search(prefix, limit)
+
+
+# ----------------------------------------------------------------------------#
+# Writes.
+# ----------------------------------------------------------------------------#
+# Registered once for the process; the indexes of the app handling the write
+# (if it has built them yet) reload the rows on their next query.
+
+def touch(kind, ids):
+    engine = current_app.extensions.get('autocomplete') if has_app_context() else None
+    if engine is not None:
+        engine.touch(kind, ids)
+
+
+def touch_entity(mapper, connection, target):
+    touch('venues' if mapper.class_ is Venue else 'artists', [target.id])
+
+
+def touch_show(mapper, connection, show):
+    # Shows booked rank names, including those of the venue and artist a show
+    # was moved away from
+    state = inspect(show)
+    touch('venues', [show.venue_id] + list(state.attrs.venue_id.history.deleted))
+    touch('artists', [show.artist_id] + list(state.attrs.artist_id.history.deleted))
+
+
+for name in ('after_insert', 'after_update', 'after_delete'):
+    for model in MODELS.values():
+        event.listen(model, name, touch_entity)
+    event.listen(Show, name, touch_show)
+
+
+def autocomplete():
+    engine = current_app.extensions.get('autocomplete')
+    if engine is None:
+        config = current_app.config
+        engine = Autocomplete(config['AUTOCOMPLETE_MAX_AGE'], config['AUTOCOMPLETE_MAX_LIMIT'],
+                              config['AUTOCOMPLETE_CACHE_SIZE'])
+        current_app.extensions['autocomplete'] = engine
+    return engine
+
+
+def refresh(venue_ids=None, artist_ids=None):
+    # Bulk writes skip the mapper events the indexes listen to
+    engine = current_app.extensions.get('autocomplete')
+    if engine is not None:
+        engine.refresh(venue_ids, artist_ids)
+
+
+def suggestions(kind, prefix, limit=10):
+    """Up to `limit` artists, venues or cities (`kind`) with a word of their
+    name starting with `prefix`, best first."""
+    return autocomplete().suggest(kind, prefix, limit)
@@ -0,0 +1,219 @@
+import threading
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+
+from models import Show, db
+
+
+# ----------------------------------------------------------------------------#
+# Venue schedules.
+# ----------------------------------------------------------------------------#
+# A show books its venue for [start_time, end_time). Times are compared as
+# local aware datetimes, like helpers.get_datetime_now, since SQLite hands
+# back the naive local times it stored.
+
+class BookingConflict(ValueError):
+    pass
+
+
+def as_local(value):
+    return value.astimezone()
+
+
+class IntervalTree(object):
+    """Static interval tree over (start, end, show id) tuples. The intervals
+    sorted by start form an implicit balanced search tree, and each node keeps
+    the latest end in its subtree so overlap queries skip whole subtrees."""
+
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals)
+        self.max_end = [None] * len(self.intervals)
+        self.build(0, len(self.intervals) - 1)
+
+    def build(self, low, high):
+        if low > high:
+            return None
+        middle = (low + high) // 2
+        ends = [self.intervals[middle][1], self.build(low, middle - 1), self.build(middle + 1, high)]
+        self.max_end[middle] = max(end for end in ends if end is not None)
+        return self.max_end[middle]
+
+    def overlapping(self, start, end):
+        found = []
+        stack = [(0, len(self.intervals) - 1)]
+        while stack:
+            low, high = stack.pop()
+            if low > high:
+                continue
+            middle = (low + high) // 2
+            if self.max_end[middle] <= start:
+                continue
+            stack.append((low, middle - 1))
+            if self.intervals[middle][0] < end:
+                if self.intervals[middle][1] > start:
+                    found.append(self.intervals[middle])
+                stack.append((middle + 1, high))
+        return sorted(found)
+
+
+def busy_rows(venue_ids, criterion):
+    schedules = {venue_id: [] for venue_id in venue_ids}
+    statement = select(Show.venue_id, Show.start_time, Show.end_time, Show.id) \
+        .where(Show.venue_id.in_(venue_ids), criterion)
+    for venue_id, start_time, end_time, show_id in db.session.execute(statement):
+        schedules[venue_id].append((as_local(start_time), as_local(end_time), show_id))
+    return schedules
+
+
+class PostgresSchedule(object):
+    """Overlaps are range queries answered by the GiST index behind the
+    ex_Show_venue_id_schedule exclusion constraint."""
+
+    def overlap(self, start, end):
+        return func.tstzrange(Show.start_time, Show.end_time).op('&&')(func.tstzrange(start, end))
+
+    def busy(self, venue_ids, start, end):
+        schedules = busy_rows(venue_ids, self.overlap(start, end))
+        return {venue_id: sorted(intervals) for venue_id, intervals in schedules.items()}
+
+    def refresh(self, venue_ids=None):
+        pass
+
+
+class MemorySchedule(object):
+    """One interval tree per venue, kept in process memory for databases
+    without range types. A venue's tree is rebuilt on the next query after
+    one of its shows was inserted, updated or deleted."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.trees = {}
+
+    def refresh(self, venue_ids=None):
+        with self.lock:
+            if venue_ids is None:
+                self.trees.clear()
+            for venue_id in venue_ids or ():
+                self.trees.pop(venue_id, None)
+
+    def overlap(self, start, end):
+        return (Show.start_time < end) & (Show.end_time > start)
+
+    def busy(self, venue_ids, start, end):
+        with self.lock:
+            missing = [venue_id for venue_id in venue_ids if venue_id not in self.trees]
+        if missing:
+            # Whole schedules, so later windows for these venues need no query
+            loaded = {venue_id: IntervalTree(intervals)
+                      for venue_id, intervals in busy_rows(missing, Show.id.isnot(None)).items()}
+            with self.lock:
+                self.trees.update(loaded)
+        with self.lock:
+            trees = {venue_id: self.trees.get(venue_id) or IntervalTree([]) for venue_id in venue_ids}
+        return {venue_id: tree.overlapping(start, end) for venue_id, tree in trees.items()}
+
+
+def invalidate(mapper, connection, show):
+    # Registered once for the process, for the backend of the app handling
+    # the write (if it has one yet); moved shows free their old venue too
+    backend = current_app.extensions.get('schedule') if has_app_context() else None
+    if backend is not None:
+        venue_ids = [show.venue_id] + list(inspect(show).attrs.venue_id.history.deleted)
+        backend.refresh([int(venue_id) for venue_id in venue_ids if venue_id is not None])
+
+
+for name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Show, name, invalidate)
+
+
+def schedule_backend():
+    backend = current_app.extensions.get('schedule')
+    if backend is None:
+        name = current_app.config.get('SCHEDULE_BACKEND') or db.engine.dialect.name
+        backend = PostgresSchedule() if name == 'postgresql' else MemorySchedule()
+        current_app.extensions['schedule'] = backend
+    return backend
+
+
+def reschedule(venue_ids=None):
+    # Bulk writes skip the mapper events the in-memory trees listen to
+    schedule_backend().refresh(venue_ids)
+
+
+# ----------------------------------------------------------------------------#
+# Bookings and availability.
+# ----------------------------------------------------------------------------#
+
+def conflicts(venue_id, start, end, show_id=None):
+    """Shows at `venue_id` overlapping [start, end), other than `show_id`.
+    Always read from the database, which is authoritative for writes."""
+    statement = select(Show.id, Show.show_title, Show.start_time, Show.end_time) \
+        .where(Show.venue_id == venue_id, schedule_backend().overlap(as_local(start), as_local(end))) \
+        .order_by(Show.start_time)
+    if show_id is not None:
+        statement = statement.where(Show.id != show_id)
+    return db.session.execute(statement).all()
+
+
+def check_booking(venue_id, start, end, show_id=None):
+    if end <= start:
+        raise BookingConflict('A show must end after it starts.')
+    clashes = conflicts(venue_id, start, end, show_id)
+    if clashes:
+        raise BookingConflict('Venue %s is already booked: %s.' % (venue_id, ', '.join(
+            '%s (%s to %s)' % (title, as_local(start_time).strftime('%Y-%m-%d %H:%M'),
+                               as_local(end_time).strftime('%Y-%m-%d %H:%M'))
+            for _, title, start_time, end_time in clashes)))
+
+
+def batch_conflicts(rows):
+    """Indexes of `rows` (dicts with venue_id, start_time and end_time) that
+    overlap an existing show or an earlier row, for bulk imports."""
+    if not rows:
+        return set()
+    start = min(as_local(row['start_time']) for row in rows)
+    end = max(as_local(row['end_time']) for row in rows)
+    existing = {venue_id: IntervalTree(intervals) for venue_id, intervals in
+                schedule_backend().busy({row['venue_id'] for row in rows}, start, end).items()}
+    accepted = {}
+    rejected = set()
+    for index, row in enumerate(rows):
+        row_start, row_end = as_local(row['start_time']), as_local(row['end_time'])
+        earlier = accepted.setdefault(row['venue_id'], [])
+        if existing[row['venue_id']].overlapping(row_start, row_end) \
+                or any(other_start < row_end and other_end > row_start for other_start, other_end in earlier):
+            rejected.add(index)
+        else:
+            earlier.append((row_start, row_end))
+    return rejected
+
+
+def free_slots(busy, start, end, min_duration=None):
+    # Gaps between the (sorted) busy intervals inside [start, end)
+    slots = []
+    cursor = start
+    for busy_start, busy_end, _ in busy:
+        if busy_start > cursor:
+            slots.append((cursor, min(busy_start, end)))
+        cursor = max(cursor, busy_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        slots.append((cursor, end))
+    return [(slot_start, slot_end) for slot_start, slot_end in slots
+            if min_duration is None or slot_end - slot_start >= min_duration]
+
+
+def availability(venue_ids, start, end, min_duration=None):
+    """Busy and free time for each venue in [start, end), from one schedule
+    lookup for all of them."""
+    start, end = as_local(start), as_local(end)
+    schedules = schedule_backend().busy(venue_ids, start, end)
+    return [{
+        "venue_id": venue_id,
+        "busy": [{"show_id": show_id, "start": max(busy_start, start), "end": min(busy_end, end)}
+                 for busy_start, busy_end, show_id in schedules[venue_id]],
+        "free": [{"start": slot_start, "end": slot_end}
+                 for slot_start, slot_end in free_slots(schedules[venue_id], start, end, min_duration)],
+    } for venue_id in venue_ids]
@@ -0,0 +1,249 @@
+import csv
+import io
+import json
+from itertools import islice
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+
+import autocomplete
+import recommend
+import search
+from availability import batch_conflicts, reschedule
+from cache import invalidate_show
+from counters import enqueue_rollover, rebuild_counters
+from forms import VenueForm, ArtistForm, ShowForm
+from models import Artist, Venue, Show, db, DEFAULT_SHOW_DURATION
+
+
+# ----------------------------------------------------------------------------#
+# Import and export formats.
+# ----------------------------------------------------------------------------#
+
+FORMATS = ('csv', 'jsonl')
+
+# Columns written on export and accepted on import, in form field names
+FIELDS = {
+    'venues': ['id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'facebook_link',
+               'seeking_talent', 'seeking_description'],
+    'artists': ['id', 'name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link', 'address',
+                'website', 'seeking_talent', 'seeking_description'],
+    'shows': ['id', 'title', 'artist_id', 'venue_id', 'start_time', 'end_time', 'description', 'register_link'],
+}
+
+MODELS = {'venues': Venue, 'artists': Artist, 'shows': Show}
+
+FORMS = {'venues': VenueForm, 'artists': ArtistForm, 'shows': ShowForm}
+
+FALSE_VALUES = ('', '0', 'n', 'no', 'false', 'off')
+
+
+def detect_format(filename, default='jsonl'):
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return default
+
+
+def read_rows(stream, format):
+    # Yields (line number, dict) pairs without reading the whole input
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            if row.get('genres') is not None:
+                row['genres'] = [genre.strip() for genre in row['genres'].split(',') if genre.strip()]
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield line_num, json.loads(line)
+                except ValueError:
+                    yield line_num, None
+
+
+def model_columns(kind):
+    model = MODELS[kind]
+    return [model.show_title.label('title') if field == 'title' else getattr(model, field)
+            for field in FIELDS[kind]]
+
+
+def export_value(value):
+    if hasattr(value, 'astimezone'):
+        # The same format ShowForm.start_time accepts, so exports import back
+        return value.astimezone().strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def export_rows(kind, format, batch_size=1000):
+    """Yield the table as CSV or JSON Lines chunks, one per batch, streaming
+    rows from the database instead of loading the table."""
+    statement = select(*model_columns(kind)).order_by(MODELS[kind].id).execution_options(yield_per=batch_size)
+    rows = db.session.execute(statement).mappings()
+    fields = FIELDS[kind]
+    if format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields)
+        writer.writeheader()
+        for batch in iter(lambda: list(islice(rows, batch_size)), []):
+            for row in batch:
+                writer.writerow({field: ','.join(row[field]) if field == 'genres' else export_value(row[field])
+                                 for field in fields})
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.getvalue():
+            yield buffer.getvalue()
+    else:
+        for batch in iter(lambda: list(islice(rows, batch_size)), []):
+            yield ''.join(json.dumps({field: export_value(row[field]) for field in fields}) + '\n'
+                          for row in batch)
+
+
+# ----------------------------------------------------------------------------#
+# Validation and bulk insert.
+# ----------------------------------------------------------------------------#
+
+def form_data(row):
+    formdata = MultiDict()
+    for key, value in row.items():
+        if key == 'genres' and isinstance(value, list):
+            for genre in value:
+                formdata.add(key, genre)
+        elif key == 'seeking_talent':
+            formdata.add(key, '' if str(value).strip().lower() in FALSE_VALUES or value is False else 'y')
+        elif value is not None:
+            formdata.add(key, str(value))
+    return formdata
+
+
+def validate_row(kind, row):
+    # The same rules as the create forms, without CSRF since there is no session
+    form = FORMS[kind](formdata=form_data(row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    values = {field: form[field].data for field in FIELDS[kind] if field != 'id' and field in form}
+    if kind == 'shows':
+        values['show_title'] = values.pop('title')
+        for key in ('artist_id', 'venue_id'):
+            try:
+                values[key] = int(values[key])
+            except ValueError:
+                return None, {key: ['Not a valid id.']}
+        if values['end_time'] is None:
+            values['end_time'] = values['start_time'] + DEFAULT_SHOW_DURATION
+    return values, None
+
+
+def missing_references(values):
+    # Rows pointing at unknown artists or venues would fail the whole batch
+    errors = {}
+    for key, model in (('artist_id', Artist), ('venue_id', Venue)):
+        wanted = {row[key] for row in values}
+        found = set(db.session.execute(select(model.id).where(model.id.in_(wanted))).scalars())
+        for missing in wanted - found:
+            errors.setdefault(key, set()).add(missing)
+    return errors
+
+
+def import_rows(kind, rows, batch_size=500, max_errors=1000):
+    """Validate `rows` (line number, dict) pairs with the create form for
+    `kind` and insert the valid ones with one multi-row INSERT and one
+    commit per batch. Returns a summary with per-row errors."""
+    model = MODELS[kind]
+    summary = {"inserted": 0, "error_count": 0, "errors": []}
+
+    def report(line_num, errors):
+        summary["error_count"] += 1
+        if len(summary["errors"]) < max_errors:
+            summary["errors"].append({"line": line_num, "errors": errors})
+
+    def flush(batch):
+        if kind == 'shows' and batch:
+            missing = missing_references([values for _, values in batch])
+            kept = []
+            for line_num, values in batch:
+                bad = {key: ['Unknown id %s.' % values[key]] for key, ids in missing.items() if values[key] in ids}
+                if bad:
+                    report(line_num, bad)
+                else:
+                    kept.append((line_num, values))
+            # Checked before inserting, since one overlapping row would make
+            # the exclusion constraint reject the whole batch
+            clashes = batch_conflicts([values for _, values in kept])
+            for index in sorted(clashes):
+                report(kept[index][0], {"start_time": ['The venue is already booked at this time.']})
+            batch = [row for index, row in enumerate(kept) if index not in clashes]
+        if not batch:
+            return
+        db.session.execute(insert(model), [values for _, values in batch])
+        if kind == 'shows':
+            # The multi-row INSERT skips the mapper events that queue these
+            for venue_id, artist_id, start_time in {(values['venue_id'], values['artist_id'], values['start_time'])
+                                                    for _, values in batch}:
+                enqueue_rollover(venue_id, artist_id, start_time)
+        db.session.commit()
+        summary["inserted"] += len(batch)
+        if kind == 'shows':
+            rebuild_counters({values['venue_id'] for _, values in batch},
+                             {values['artist_id'] for _, values in batch})
+            invalidate_show(*{(values['venue_id'], values['artist_id']) for _, values in batch})
+            reschedule({values['venue_id'] for _, values in batch})
+            recommend.refresh({values['venue_id'] for _, values in batch},
+                              {values['artist_id'] for _, values in batch})
+            autocomplete.refresh({values['venue_id'] for _, values in batch},
+                                 {values['artist_id'] for _, values in batch})
+
+    batch = []
+    for line_num, row in rows:
+        if not isinstance(row, dict):
+            report(line_num, {"row": ['Not a JSON object.']})
+            continue
+        values, errors = validate_row(kind, row)
+        if errors:
+            report(line_num, errors)
+            continue
+        batch.append((line_num, values))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    flush(batch)
+    search.reindex(model)
+    if kind != 'shows':
+        recommend.refresh()
+        autocomplete.refresh()
+    return summary
+
+
+# ----------------------------------------------------------------------------#
+# CLI.
+# ----------------------------------------------------------------------------#
+
+data_cli = AppGroup('data', help='Bulk import and export of venues, artists and shows.')
+
+
+@data_cli.command('import')
+@click.argument('kind', type=click.Choice(list(MODELS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--batch-size', default=500, show_default=True)
+def import_command(kind, source, format, batch_size):
+    """Import KIND rows from SOURCE (a CSV or JSON Lines file, or - for stdin)."""
+    summary = import_rows(kind, read_rows(source, format or detect_format(source.name)), batch_size)
+    for error in summary["errors"]:
+        click.echo('line %(line)s: %(errors)s' % error, err=True)
+    click.echo('%s %s imported, %s rows rejected.' % (summary["inserted"], kind, summary["error_count"]))
+
+
+@data_cli.command('export')
+@click.argument('kind', type=click.Choice(list(MODELS)))
+@click.argument('target', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'format', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--batch-size', default=1000, show_default=True)
+def export_command(kind, target, format, batch_size):
+    """Export KIND rows to TARGET (defaults to stdout)."""
+    for chunk in export_rows(kind, format or detect_format(target.name), batch_size):
+        target.write(chunk)
@@ -0,0 +1,153 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import select
+
+from models import Show, db
+
+
+# ----------------------------------------------------------------------------#
+# Cache backends.
+# ----------------------------------------------------------------------------#
+
+class MemoryCache(object):
+    """Per-process LRU cache whose entries also expire after a timeout."""
+
+    def __init__(self, max_entries=1024, default_timeout=60):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, timeout=None):
+        expires = time.monotonic() + (timeout or self.default_timeout)
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+class RedisCache(object):
+    """Cache stored in Redis, or any client exposing Redis' get, set(ex=) and
+    delete commands."""
+
+    def __init__(self, client, default_timeout=60, key_prefix='fyyur:'):
+        self.client = client
+        self.default_timeout = default_timeout
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.key_prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        self.client.set(self.key_prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        ex=timeout or self.default_timeout)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.key_prefix + key for key in keys])
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def cache_setup(app):
+    if app.config['CACHE_TYPE'] == 'redis':
+        client = app.config.get('CACHE_REDIS_CLIENT')
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+        cache = RedisCache(client, app.config['CACHE_DEFAULT_TIMEOUT'], app.config['CACHE_KEY_PREFIX'])
+    else:
+        cache = MemoryCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_DEFAULT_TIMEOUT'])
+    app.extensions['cache'] = cache
+    return cache
+
+
+def page_cache():
+    return current_app.extensions['cache']
+
+
+def cache_version():
+    # The values the request's ETag was derived from (set by
+    # http_cache.conditional): an entry built for other values is stale
+    return g.get('_validator_values') if has_request_context() else None
+
+
+def cached(key, build):
+    # Read-through: build and store the value on a miss. None is not cached
+    # so missing entities are looked up again next time.
+    version = cache_version()
+    entry = page_cache().get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    value = build()
+    if value is not None:
+        page_cache().set(key, (version, value))
+    return value
+
+
+# ----------------------------------------------------------------------------#
+# Entity page keys and invalidation.
+# ----------------------------------------------------------------------------#
+
+def venue_key(venue_id):
+    return 'venue:%s' % venue_id
+
+
+def artist_key(artist_id):
+    return 'artist:%s' % artist_id
+
+
+def invalidate_venue(venue_id):
+    # Artist pages show the name and image of every venue they played at
+    artist_ids = db.session.execute(
+        select(Show.artist_id).where(Show.venue_id == venue_id).distinct()).scalars()
+    page_cache().delete(venue_key(venue_id), *[artist_key(artist_id) for artist_id in artist_ids])
+
+
+def invalidate_artist(artist_id):
+    # Venue pages show the name and image of every artist that played there
+    venue_ids = db.session.execute(
+        select(Show.venue_id).where(Show.artist_id == artist_id).distinct()).scalars()
+    page_cache().delete(artist_key(artist_id), *[venue_key(venue_id) for venue_id in venue_ids])
+
+
+def invalidate_show(*shows):
+    # Accepts (venue_id, artist_id) pairs, e.g. a show before and after an edit
+    keys = set()
+    for venue_id, artist_id in shows:
+        keys.update([venue_key(venue_id), artist_key(artist_id)])
+    page_cache().delete(*keys)
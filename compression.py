@@ -0,0 +1,172 @@
+import threading
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # br is not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstd is not offered
+    zstandard = None
+
+
+# ----------------------------------------------------------------------------#
+# Encoders.
+# ----------------------------------------------------------------------------#
+# Each returns (compress, flush, finish) for one response body: compress and
+# flush return the bytes ready so far, flush emits everything written so the
+# client can render a streamed page as it arrives, finish ends the stream.
+
+def gzip_encoder(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def brotli_encoder(level):
+    compressor = brotli.Compressor(quality=level)
+    return compressor.process, compressor.flush, compressor.finish
+
+
+def zstd_encoder(level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), compressor.flush
+
+
+ENCODERS = {'gzip': gzip_encoder}
+if brotli is not None:
+    ENCODERS['br'] = brotli_encoder
+if zstandard is not None:
+    ENCODERS['zstd'] = zstd_encoder
+
+
+def negotiate(accept, preferred):
+    # The client's highest quality wins, the server's order breaks ties
+    best, best_quality = None, 0
+    for encoding in preferred:
+        quality = accept[encoding] if encoding in ENCODERS else 0
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+# ----------------------------------------------------------------------------#
+# Response hook.
+# ----------------------------------------------------------------------------#
+
+def compressible(response, config):
+    if response.status_code < 200 or response.status_code in (204, 206, 304) \
+            or response.direct_passthrough or 'Content-Encoding' in response.headers \
+            or 'Content-Range' in response.headers or response.cache_control.no_transform:
+        return False
+    return response.mimetype in config['COMPRESSION_MIMETYPES']
+
+
+def compress_response(response):
+    config = current_app.config
+    if not compressible(response, config):
+        return response
+    # Shared caches must keep one copy per encoding, compressed or not
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings, config['COMPRESSION_ENCODINGS'])
+    if encoding is None:
+        return response
+    if not response.is_streamed:
+        data = response.get_data()
+        if len(data) < config['COMPRESSION_MIN_SIZE']:
+            return response
+        compress, _, finish = ENCODERS[encoding](config['COMPRESSION_LEVELS'][encoding])
+        body = compress(data) + finish()
+        response.set_data(body)
+        current_app.extensions['compression'].record(request.endpoint, encoding, len(data), len(body))
+    else:
+        response.response = streamed(response.response, encoding, config['COMPRESSION_LEVELS'][encoding],
+                                     current_app.extensions['compression'], request.endpoint)
+        response.headers.pop('Content-Length', None)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # The compressed bytes differ, but If-None-Match compares weakly, so
+        # 304s still work
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def streamed(chunks, encoding, level, stats, endpoint):
+    # Streamed pages are compressed and flushed chunk by chunk, so the client
+    # still gets the top of the page while the rest renders
+    compress, flush, finish = ENCODERS[encoding](level)
+    size = compressed = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            size += len(chunk)
+            out = compress(chunk) + flush()
+            compressed += len(out)
+            yield out
+        out = finish()
+        compressed += len(out)
+        yield out
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        stats.record(endpoint, encoding, size, compressed)
+
+
+# ----------------------------------------------------------------------------#
+# Measurements.
+# ----------------------------------------------------------------------------#
+
+class CompressionStats(object):
+    """Bytes before and after compression by endpoint and encoding, per process."""
+
+    def __init__(self):
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, encoding, size, compressed):
+        with self.lock:
+            route = self.routes.setdefault((endpoint or 'unmatched', encoding), [0, 0, 0])
+            route[0] += 1
+            route[1] += size
+            route[2] += compressed
+
+    def snapshot(self):
+        with self.lock:
+            return {key: list(route) for key, route in self.routes.items()}
+
+
+def compression_metrics():
+    routes = sorted(current_app.extensions['compression'].snapshot().items())
+
+    def samples(value):
+        return [((('endpoint', endpoint), ('encoding', encoding)), value(*route))
+                for (endpoint, encoding), route in routes]
+
+    return [
+        ('fyyur_compressed_responses_total', 'counter', 'Responses compressed.',
+         samples(lambda count, size, compressed: count)),
+        ('fyyur_compression_input_bytes_total', 'counter', 'Response bytes before compression.',
+         samples(lambda count, size, compressed: size)),
+        ('fyyur_compression_output_bytes_total', 'counter', 'Response bytes sent after compression.',
+         samples(lambda count, size, compressed: compressed)),
+        ('fyyur_compression_saved_bytes_total', 'counter', 'Response bytes saved by compression.',
+         samples(lambda count, size, compressed: size - compressed)),
+    ]
+
+
+def compression_setup(app):
+    app.extensions['compression'] = CompressionStats()
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+    unknown = set(app.config['COMPRESSION_ENCODINGS']) - {'gzip', 'br', 'zstd'}
+    if unknown:
+        raise ValueError('Unknown encodings in COMPRESSION_ENCODINGS: %s' % ', '.join(sorted(unknown)))
+    app.after_request(compress_response)
+    app.extensions['metrics_collectors'].append(compression_metrics)
@@ -0,0 +1,152 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, or_, select, update
+
+from cache import invalidate_venue, invalidate_artist
+from helpers import get_datetime_now, is_upcoming
+from jobs import enqueue, task
+from models import Artist, Venue, Show, db
+
+
+# ----------------------------------------------------------------------------#
+# Upcoming and past show counters on Venue and Artist.
+# ----------------------------------------------------------------------------#
+# Show writes through the ORM adjust the counters in the same transaction,
+# and queue a job for the show's start time that recounts its venue and
+# artist once the show moves from upcoming to past. Writes that bypass the
+# ORM call rebuild_counters for the rows they touched, and
+# `flask counters rebuild` can still run on a schedule as a safety net.
+
+OWNERS = ((Venue, 'venue_id'), (Artist, 'artist_id'))
+
+
+def load_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+# Setting an expired attribute (e.g. on a show loaded before the last commit)
+# records no old value unless it is loaded first, and the old venue, artist
+# and start time are what the update has to uncount
+for attribute in (Show.venue_id, Show.artist_id, Show.start_time):
+    event.listen(attribute, 'set', load_old_value, active_history=True)
+
+
+def adjust(connection, model, entity_id, start_time, step):
+    column = 'upcoming_shows_count' if is_upcoming(start_time) else 'past_shows_count'
+    connection.execute(update(model).where(model.id == entity_id)
+                       .values({column: getattr(model, column) + step}))
+
+
+def enqueue_rollover(venue_id, artist_id, start_time, connection=None):
+    """Queue the recount of a venue and artist for when their show starting at
+    `start_time` moves from upcoming to past, in the current transaction (or
+    on `connection`). Past shows need none."""
+    if not is_upcoming(start_time):
+        return
+    venue_id, artist_id = int(venue_id), int(artist_id)
+    start_time = start_time.astimezone()
+    enqueue('counters.rollover', {"venue_ids": [venue_id], "artist_ids": [artist_id]},
+            key='rollover:%s:%s:%s' % (venue_id, artist_id, start_time.isoformat()),
+            run_at=start_time, connection=connection)
+
+
+def schedule_rollover(connection, show):
+    enqueue_rollover(show.venue_id, show.artist_id, show.start_time, connection)
+
+
+@task('counters.rollover')
+def rollover(venue_ids, artist_ids):
+    rebuild_counters(venue_ids, artist_ids)
+    for venue_id in venue_ids:
+        invalidate_venue(venue_id)
+    for artist_id in artist_ids:
+        invalidate_artist(artist_id)
+
+
+@event.listens_for(Show, 'after_insert')
+def count_inserted_show(mapper, connection, show):
+    for model, key in OWNERS:
+        adjust(connection, model, getattr(show, key), show.start_time, 1)
+    schedule_rollover(connection, show)
+
+
+@event.listens_for(Show, 'after_delete')
+def count_deleted_show(mapper, connection, show):
+    for model, key in OWNERS:
+        adjust(connection, model, getattr(show, key), show.start_time, -1)
+
+
+@event.listens_for(Show, 'after_update')
+def count_updated_show(mapper, connection, show):
+    state = inspect(show)
+    start_history = state.attrs.start_time.history
+    if not start_history.has_changes() and not any(state.attrs[key].history.has_changes() for _, key in OWNERS):
+        return
+    old_start_time = start_history.deleted[0] if start_history.deleted else show.start_time
+    for model, key in OWNERS:
+        history = state.attrs[key].history
+        old_id = history.deleted[0] if history.deleted else getattr(show, key)
+        adjust(connection, model, old_id, old_start_time, -1)
+        adjust(connection, model, getattr(show, key), show.start_time, 1)
+    schedule_rollover(connection, show)
+
+
+def true_counts(model, key, now):
+    # Ground truth from the Show table, as correlated subqueries
+    shows = select(func.count(Show.id)).where(getattr(Show, key) == model.id)
+    return {
+        'upcoming_shows_count': shows.where(Show.start_time >= now).scalar_subquery(),
+        'past_shows_count': shows.where(Show.start_time < now).scalar_subquery(),
+    }
+
+
+def rebuild_counters(venue_ids=None, artist_ids=None):
+    """Recount every venue and artist, or only the given ids. Returns the
+    number of rows whose counters were wrong."""
+    now = get_datetime_now()
+    fixed = 0
+    for (model, key), ids in zip(OWNERS, (venue_ids, artist_ids)):
+        if ids is not None and not ids:
+            continue
+        counts = true_counts(model, key, now)
+        statement = update(model).values(counts).where(or_(*[
+            getattr(model, column) != count for column, count in counts.items()]))
+        if ids is not None:
+            statement = statement.where(model.id.in_(ids))
+        fixed += db.session.execute(statement.execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    return fixed
+
+
+def check_counters():
+    # (model name, id, stored counts, true counts) for every row that is off
+    now = get_datetime_now()
+    mismatches = []
+    for model, key in OWNERS:
+        counts = true_counts(model, key, now)
+        statement = select(model.id, model.upcoming_shows_count, model.past_shows_count,
+                           counts['upcoming_shows_count'], counts['past_shows_count']) \
+            .where(or_(*[getattr(model, column) != count for column, count in counts.items()]))
+        for row in db.session.execute(statement):
+            mismatches.append((model.__name__, row[0], tuple(row[1:3]), tuple(row[3:5])))
+    return mismatches
+
+
+counters_cli = AppGroup('counters', help='Maintain the denormalised show counters.')
+
+
+@counters_cli.command('rebuild')
+def rebuild_command():
+    """Recount upcoming and past shows for every venue and artist."""
+    click.echo('%s rows corrected.' % rebuild_counters())
+
+
+@counters_cli.command('check')
+def check_command():
+    """Report venues and artists whose counters disagree with the shows."""
+    mismatches = check_counters()
+    for name, entity_id, stored, truth in mismatches:
+        click.echo('%s %s: stored %s, actual %s' % (name, entity_id, stored, truth))
+    if mismatches:
+        raise SystemExit(1)
+    click.echo('All counters agree with the Show table.')
@@ -1,3 +1,5 @@
+import os
+
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
@@ -13,6 +15,17 @@ def test():
         abort("Aborted at user request.")
 
 
+def bench(baseline="benchmarks/baseline.json"):
+    # Latencies only compare on the same machine, so the first run there
+    # records the baseline instead of comparing against one
+    if not os.path.exists(baseline):
+        local("python benchmark.py --baseline {} --save-baseline".format(baseline))
+        return
+    result = local("python benchmark.py --baseline {}".format(baseline))
+    if result.failed:
+        abort("Benchmark regressed against {}.".format(baseline))
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -0,0 +1,172 @@
+from datetime import datetime
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale, UnknownLocaleError
+from babel.dates import DateTimeFormat, parse_pattern, tokenize_pattern
+from flask import current_app, g, has_request_context, request
+from jinja2 import pass_context
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+
+# ----------------------------------------------------------------------------#
+# Datetime formatting.
+# ----------------------------------------------------------------------------#
+# Babel resolves every field of a pattern through its locale data on each
+# call, which dominates rendering long listings. Patterns are compiled once
+# per locale into plain lookups (names precomputed with Babel itself), and
+# formatted strings are memoised by (value, pattern, locale, timezone).
+
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+# Numeric fields by pattern character
+NUMBERS = {
+    'y': lambda date: date.year,
+    'M': lambda date: date.month,
+    'd': lambda date: date.day,
+    'H': lambda date: date.hour,
+    'h': lambda date: date.hour % 12 or 12,
+    'm': lambda date: date.minute,
+    's': lambda date: date.second,
+}
+
+# Named fields: a key function and one sample datetime per key
+NAMES = {
+    'E': (lambda date: date.weekday(), [datetime(2024, 1, day) for day in range(1, 8)]),
+    'M': (lambda date: date.month, [datetime(2024, month, 1) for month in range(1, 13)]),
+    'L': (lambda date: date.month, [datetime(2024, month, 1) for month in range(1, 13)]),
+    'a': (lambda date: date.hour >= 12, [datetime(2024, 1, 1, 0), datetime(2024, 1, 1, 12)]),
+}
+
+
+@lru_cache(maxsize=None)
+def locale_for(name):
+    return Locale.parse(name)
+
+
+def number_field(value, width, two_digit_year=False):
+    if two_digit_year:
+        return lambda date: '%02d' % (value(date) % 100)
+    return lambda date: '%0*d' % (width, value(date))
+
+
+def name_field(key, table):
+    return lambda date: table[key(date)]
+
+
+@lru_cache(maxsize=None)
+def compiled_formatter(format, locale):
+    # Falls back to Babel for patterns using fields not handled here
+    pattern = parse_pattern(PATTERNS.get(format, format))
+    locale = locale_for(locale)
+    parts = []
+    for kind, token in tokenize_pattern(pattern.pattern):
+        if kind == 'chars':
+            parts.append(token)
+            continue
+        char, width = token
+        if char in NUMBERS and not (char == 'M' and width > 2):
+            parts.append(number_field(NUMBERS[char], width, char == 'y' and width == 2))
+        elif char in NAMES:
+            key, samples = NAMES[char]
+            parts.append(name_field(key, {key(sample): DateTimeFormat(sample, locale)[char * width]
+                                          for sample in samples}))
+        else:
+            return lambda date: pattern.apply(date, locale)
+    return lambda date: ''.join([part if isinstance(part, str) else part(date) for part in parts])
+
+
+@lru_cache(maxsize=256)
+def timezone_for(name):
+    if not name or ZoneInfo is None:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    # Strings from older rows and templates are still accepted
+    return dateutil.parser.parse(value)
+
+
+def render(value, format, locale, timezone):
+    date = as_datetime(value)
+    # Naive values are local time, like helpers.is_upcoming assumes
+    date = date.astimezone(timezone_for(timezone))
+    return compiled_formatter(format, locale)(date)
+
+
+# ----------------------------------------------------------------------------#
+# Per-request locale and timezone.
+# ----------------------------------------------------------------------------#
+
+def request_locale():
+    if not has_request_context():
+        return current_app.config['DATETIME_DEFAULT_LOCALE']
+    if '_locale' not in g:
+        supported = current_app.config['DATETIME_LOCALES']
+        chosen = request.cookies.get('locale')
+        if chosen not in supported:
+            chosen = request.accept_languages.best_match([name.replace('_', '-') for name in supported])
+        g._locale = chosen.replace('-', '_') if chosen else current_app.config['DATETIME_DEFAULT_LOCALE']
+    return g._locale
+
+
+def request_timezone():
+    # An IANA name from the tz cookie, else the configured zone (None is the server's)
+    if not has_request_context():
+        return current_app.config['DATETIME_DEFAULT_TIMEZONE']
+    if '_timezone' not in g:
+        chosen = request.cookies.get('tz')
+        g._timezone = chosen if timezone_for(chosen) is not None \
+            else current_app.config['DATETIME_DEFAULT_TIMEZONE']
+    return g._timezone
+
+
+def datetime_settings():
+    return current_app.extensions['format_datetime'], request_locale(), request_timezone()
+
+
+def datetime_context():
+    # Resolved once per render, so the filter does not go through the
+    # request and app proxies for every value
+    return {"_datetime_settings": datetime_settings()}
+
+
+@pass_context
+def format_datetime(context, value, format='medium'):
+    if value is None:
+        return ''
+    formatter, locale, timezone = context.get('_datetime_settings') or datetime_settings()
+    return formatter(value, format, locale, timezone)
+
+
+def vary_on_locale(response):
+    if response.mimetype == 'text/html':
+        response.vary.add('Accept-Language')
+        response.vary.add('Cookie')
+    return response
+
+
+def formatting_setup(app):
+    for name in app.config['DATETIME_LOCALES']:
+        try:
+            locale_for(name)
+        except (UnknownLocaleError, ValueError):
+            raise ValueError('Unknown locale in DATETIME_LOCALES: %s' % name)
+    app.extensions['format_datetime'] = lru_cache(maxsize=app.config['DATETIME_CACHE_SIZE'])(render)
+    app.jinja_env.filters['datetime'] = format_datetime
+    app.context_processor(datetime_context)
+    app.after_request(vary_on_locale)
@@ -1,7 +1,7 @@
 from datetime import datetime
-from flask_wtf import Form
+from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, ValidationError, \
-    SubmitField
+    SubmitField, HiddenField
 from wtforms.validators import DataRequired, AnyOf, URL, Length, Optional
 import re
 
@@ -79,17 +79,32 @@ genres_choices = [
     ('Other', 'Other'),
 ]
 
+# The stored genre values: form validation, genre filters (queries.py) and
+# recommendations (recommend.py) all read them from here
+GENRES = [value for value, _ in genres_choices]
+
+
+class ShowForm(FlaskForm):
+    def validate_end_time(form, field):
+        if field.data is not None and form.start_time.data is not None and field.data <= form.start_time.data:
+            raise ValidationError('The show must end after it starts.')
 
-class ShowForm(Form):
     title = StringField(
         'title', validators=[DataRequired()]
     )
-    artist_id = StringField(
-        'artist_id', validators=[DataRequired()],
+    # The names are typed with autocomplete, which fills in the ids
+    artist_name = StringField(
+        'artist_name'
+    )
+    artist_id = HiddenField(
+        'artist_id', validators=[DataRequired(message='Choose an artist from the suggestions.')],
 
     )
-    venue_id = StringField(
-        'venue_id', validators=[DataRequired()],
+    venue_name = StringField(
+        'venue_name'
+    )
+    venue_id = HiddenField(
+        'venue_id', validators=[DataRequired(message='Choose a venue from the suggestions.')],
 
     )
     start_time = DateTimeField(
@@ -97,6 +112,10 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
     description = StringField(
         'description', validators=[Length(max=500)]
     )
@@ -106,15 +125,14 @@ class ShowForm(Form):
     submit = SubmitField('submit')
 
 
-class VenueForm(Form):
+class VenueForm(FlaskForm):
     def validate_phone(form, field):
         if not re.search(r"^[0-9]{3}-[0-9]{3}-[0-9]{4}$", field.data):
             raise ValidationError("Invalid phone number.")
 
     def validate_genres(form, field):
-        genres_values = [choice[1] for choice in genres_choices]
         for value in field.data:
-            if value not in genres_values:
+            if value not in GENRES:
                 raise ValidationError('Invalid genres value.')
 
     name = StringField(
@@ -153,15 +171,14 @@ class VenueForm(Form):
     submit = SubmitField('submit')
 
 
-class ArtistForm(Form):
+class ArtistForm(FlaskForm):
     def validate_phone(form, field):
         if not re.search(r"^[0-9]{3}-[0-9]{3}-[0-9]{4}$", field.data):
             raise ValidationError("Invalid phone number.")
 
     def validate_genres(form, field):
-        genres_values = [choice[1] for choice in genres_choices]
         for value in field.data:
-            if value not in genres_values:
+            if value not in GENRES:
                 raise ValidationError('Invalid genres value.')
 
     name = StringField(
@@ -2,8 +2,18 @@ import datetime
 
 
 def get_datetime_now():
-    return datetime.datetime.now()
+    # Timezone aware so it compares correctly with Show.start_time
+    return datetime.datetime.now().astimezone()
 
 
-def convert_string_to_datetime(value, format='%Y-%m-%d %H:%S:%M'):
-    return datetime.datetime.strptime(value, format)
+def is_upcoming(start_time):
+    # Naive datetimes, as parsed from forms, are in local time
+    if start_time.tzinfo is None:
+        start_time = start_time.astimezone()
+    return start_time >= get_datetime_now()
+
+
+def form_error_message(form):
+    # "Artist id: Choose an artist from the suggestions. Start time: ..." for flash()
+    return ' '.join('%s: %s' % (form[name].label.text.replace('_', ' ').capitalize(), ' '.join(messages))
+                    for name, messages in form.errors.items())
@@ -0,0 +1,116 @@
+import hashlib
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from sqlalchemy import func, select
+from werkzeug.http import is_resource_modified
+
+from formatting import request_locale, request_timezone
+from helpers import get_datetime_now
+from models import Artist, CacheVersion, Venue, Show, db
+
+
+# ----------------------------------------------------------------------------#
+# Validators.
+# ----------------------------------------------------------------------------#
+# A validator builds one cheap query (None for static pages) for the values a
+# page depends on: table versions or latest updated_at timestamps, row counts
+# (so deletes change the ETag) and the next or upcoming shows (so the ETag
+# changes once a show starts). The query is run by `conditional`, or by
+# asgi.py on its engine. Pages are validated by ETag alone: a latest
+# updated_at misses deletes and shows starting, so it makes no Last-Modified.
+
+def scalars(*statements):
+    return select(*[statement.scalar_subquery() for statement in statements])
+
+
+def listing_validator(*models):
+    # Primary key lookups plus one index seek, however many rows are listed
+    versions = [select(CacheVersion.version).where(CacheVersion.table_name == model.__tablename__)
+                for model in models]
+
+    def validator(**kwargs):
+        return scalars(*versions, select(func.min(Show.start_time)).where(Show.start_time >= get_datetime_now()))
+    return validator
+
+
+def venue_validator(venue_id, **kwargs):
+    shows = Show.venue_id == venue_id
+    return scalars(select(Venue.updated_at).where(Venue.id == venue_id),
+                   select(func.max(Show.updated_at)).where(shows),
+                   select(func.max(Artist.updated_at)).join(Show, Show.artist_id == Artist.id).where(shows),
+                   select(func.count(Show.id)).where(shows),
+                   select(func.count(Show.id)).where(shows, Show.start_time >= get_datetime_now()))
+
+
+def artist_validator(artist_id, **kwargs):
+    shows = Show.artist_id == artist_id
+    return scalars(select(Artist.updated_at).where(Artist.id == artist_id),
+                   select(func.max(Show.updated_at)).where(shows),
+                   select(func.max(Venue.updated_at)).join(Show, Show.venue_id == Venue.id).where(shows),
+                   select(func.count(Show.id)).where(shows),
+                   select(func.count(Show.id)).where(shows, Show.start_time >= get_datetime_now()))
+
+
+def static_validator(**kwargs):
+    return None
+
+
+# ----------------------------------------------------------------------------#
+# Conditional GET.
+# ----------------------------------------------------------------------------#
+
+def cache_control(endpoint):
+    policies = current_app.config['HTTP_CACHE_POLICIES']
+    return policies.get(endpoint, policies['default'])
+
+
+def validates():
+    # Pending flash messages are rendered into the page, so it must be sent
+    return current_app.config['HTTP_CACHE_ENABLED'] and request.method in ('GET', 'HEAD') \
+        and not session.get('_flashes')
+
+
+def validation(values):
+    """The ETag for the values a validator query returned, or None if the
+    entity does not exist so the view should answer 404."""
+    if values and values[0] is None:
+        return None
+    # Pages render dates in the client's locale and timezone
+    return hashlib.sha1(repr((request.full_path, current_app.config['HTTP_CACHE_VERSION'],
+                              request_locale(), request_timezone(), tuple(values))).encode()).hexdigest()
+
+
+def not_modified(etag):
+    return not is_resource_modified(request.environ, etag=etag)
+
+
+def validated(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control(request.endpoint)
+    return response
+
+
+def conditional(validator):
+    """Answer If-None-Match with 304 before running the view, using the ETag
+    derived from `validator`, which is called with the view arguments."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not validates():
+                return view(*args, **kwargs)
+            statement = validator(**kwargs)
+            g._validator_values = () if statement is None else tuple(db.session.execute(statement).one())
+            etag = validation(g._validator_values)
+            if etag is None:
+                return view(*args, **kwargs)
+            if not_modified(etag):
+                return validated(current_app.response_class(status=304), etag)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            return validated(response, etag)
+        wrapper.validator = validator
+        return wrapper
+    return decorator
@@ -0,0 +1,365 @@
+import hashlib
+import hmac
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from flask import current_app, redirect, request, send_file, url_for
+from werkzeug.exceptions import abort
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pages link the source images directly
+    Image = ImageOps = None
+
+
+# ----------------------------------------------------------------------------#
+# Image proxy.
+# ----------------------------------------------------------------------------#
+# Venue and artist images are remote URLs of any size. Templates link
+#   /images/<digest>/<width>.<format>?src=<image_link>
+# instead, where the digest is an HMAC of the source URL (so only URLs the
+# app rendered are fetched). The first request fetches the source, keeps it
+# in the disk cache and stores a thumbnail IMAGES_WIDTHS pixels wide; later
+# requests, for any width, are served from the cache.
+
+FORMATS = {'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+
+class FetchError(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------------#
+# Fetchers.
+# ----------------------------------------------------------------------------#
+# A fetcher is a callable taking the source URL and returning its bytes, or
+# raising FetchError. IMAGES_FETCHER is 'http', 'directory' (files under
+# IMAGES_SOURCE_DIR/<host>/<path>, for development and tests) or a callable.
+
+def public_address(host):
+    # Image links are user input; never fetch from the internal network. The
+    # address checked here is the one connected to, so a second DNS lookup
+    # cannot point elsewhere
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)]
+    except (socket.gaierror, UnicodeError) as error:
+        raise FetchError('Cannot resolve %s: %s' % (host, error))
+    if not addresses or not all(ipaddress.ip_address(address.split('%')[0]).is_global for address in addresses):
+        raise FetchError('Not a public address: %s' % host)
+    return addresses[0]
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection):
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        # The certificate is still checked against the host name
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+CONNECTIONS = {'http': PinnedHTTPConnection, 'https': PinnedHTTPSConnection}
+
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+def http_fetcher(timeout, max_bytes, max_redirects=5):
+    def get(url):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in CONNECTIONS or not parts.hostname:
+            raise FetchError('Not an http(s) URL: %s' % url)
+        connection = CONNECTIONS[parts.scheme](parts.hostname, public_address(parts.hostname), port=parts.port,
+                                               timeout=timeout)
+        try:
+            connection.request('GET', (parts.path or '/') + ('?' + parts.query if parts.query else ''),
+                               headers={'User-Agent': 'fyyur-images'})
+            response = connection.getresponse()
+            if response.status in REDIRECTS:
+                return response.status, urllib.parse.urljoin(url, response.getheader('Location', ''))
+            return response.status, response.read(max_bytes + 1)
+        except (OSError, http.client.HTTPException, ValueError) as error:
+            raise FetchError('Cannot fetch %s: %s' % (url, error))
+        finally:
+            connection.close()
+
+    def fetch(url):
+        # Redirects are followed here, so every hop's address is checked
+        for _ in range(max_redirects + 1):
+            status, body = get(url)
+            if status not in REDIRECTS:
+                break
+            url = body
+        else:
+            raise FetchError('Too many redirects: %s' % url)
+        if status != 200:
+            raise FetchError('HTTP %d: %s' % (status, url))
+        if len(body) > max_bytes:
+            raise FetchError('Larger than %d bytes: %s' % (max_bytes, url))
+        return body
+    return fetch
+
+
+def directory_fetcher(root, max_bytes):
+    root = os.path.abspath(root)
+
+    def fetch(url):
+        parts = urllib.parse.urlsplit(url)
+        path = os.path.abspath(os.path.join(root, parts.netloc, urllib.parse.unquote(parts.path).lstrip('/')))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            raise FetchError('No such image: %s' % url)
+        if os.path.getsize(path) > max_bytes:
+            raise FetchError('Larger than %d bytes: %s' % (max_bytes, url))
+        with open(path, 'rb') as source:
+            return source.read()
+    return fetch
+
+
+def make_fetcher(config):
+    fetcher = config['IMAGES_FETCHER']
+    if callable(fetcher):
+        return fetcher
+    if fetcher == 'directory':
+        return directory_fetcher(config['IMAGES_SOURCE_DIR'], config['IMAGES_MAX_SOURCE_BYTES'])
+    if fetcher == 'http':
+        return http_fetcher(config['IMAGES_FETCH_TIMEOUT'], config['IMAGES_MAX_SOURCE_BYTES'])
+    raise ValueError('Unknown IMAGES_FETCHER: %r' % (fetcher,))
+
+
+# ----------------------------------------------------------------------------#
+# Disk cache.
+# ----------------------------------------------------------------------------#
+
+class DiskCache(object):
+    """Files under `directory`, evicted least recently used first once they
+    add up to more than `max_bytes`. Processes sharing the directory share
+    the cache; each one evicts by scanning it."""
+
+    # Reads refresh a file's mtime at most this often (seconds)
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = None
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - modified > self.TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:  # evicted meanwhile
+                return None
+        return path
+
+    def read(self, key):
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as cached:
+                return cached.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written whole or not at all, so readers never see a partial file
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+        with os.fdopen(handle, 'wb') as output:
+            output.write(data)
+        os.replace(temporary, path)
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.files())
+            else:
+                self.size += len(data)
+            if self.size > self.max_bytes:
+                self.evict()
+        return path
+
+    def files(self):
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def evict(self):
+        # Down to 90% of the limit, so eviction does not run on every write
+        files = sorted(self.files())
+        self.size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+
+# ----------------------------------------------------------------------------#
+# Thumbnails.
+# ----------------------------------------------------------------------------#
+
+def thumbnail(data, width, image_format, quality, max_pixels):
+    image = Image.open(io.BytesIO(data))
+    if image.width * image.height > max_pixels:
+        raise ValueError('Image too large: %dx%d' % image.size)
+    # JPEG sources are decoded at a reduced scale that keeps both sides at
+    # least `width`, whichever way the EXIF orientation turns them
+    image.draft('RGB', (width, width))
+    image = ImageOps.exif_transpose(image)
+    # Never upscaled
+    width = min(width, image.width)
+    height = max(1, round(image.height * width / image.width))
+    transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    if image_format == 'webp' and transparent:
+        image = image.convert('RGBA')
+    elif transparent:
+        # JPEG has no alpha channel
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    else:
+        image = image.convert('RGB')
+    image = image.resize((width, height), Image.LANCZOS)
+    output = io.BytesIO()
+    if image_format == 'jpeg':
+        image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(output, 'WEBP', quality=quality, method=4)
+    return output.getvalue()
+
+
+class Images(object):
+
+    def __init__(self, config):
+        self.widths = sorted(config['IMAGES_WIDTHS'])
+        self.quality = config['IMAGES_QUALITY']
+        self.max_pixels = config['IMAGES_MAX_PIXELS']
+        self.max_age = config['IMAGES_MAX_AGE']
+        self.cache = DiskCache(config['IMAGES_CACHE_DIR'], config['IMAGES_CACHE_MAX_BYTES'])
+        self.fetcher = make_fetcher(config)
+        self.secret = (config['IMAGES_SECRET'] or self.shared_secret()).encode()
+        # Striped, so concurrent requests for one image fetch and resize it once
+        self.locks = [threading.Lock() for _ in range(64)]
+
+    def shared_secret(self):
+        # Every process using the cache directory signs URLs with the same key
+        path = os.path.join(self.cache.directory, '.secret')
+        try:
+            with open(path, 'x') as output:
+                output.write(os.urandom(32).hex())
+        except FileExistsError:
+            pass
+        with open(path) as secret:
+            return secret.read().strip()
+
+    def digest(self, src):
+        return hmac.new(self.secret, src.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def source(self, digest, src):
+        data = self.cache.read(digest + '.src')
+        if data is None:
+            data = self.fetcher(src)
+            self.cache.put(digest + '.src', data)
+        return data
+
+    def render(self, digest, src, width, image_format):
+        """The cached thumbnail's path, made on first use."""
+        key = '%s-%d.%s' % (digest, width, image_format)
+        path = self.cache.get(key)
+        if path is not None:
+            return path
+        with self.locks[int(digest[:8], 16) % len(self.locks)]:
+            path = self.cache.get(key)
+            if path is None:
+                data = thumbnail(self.source(digest, src), width, image_format, self.quality, self.max_pixels)
+                path = self.cache.put(key, data)
+        return path
+
+
+def images():
+    return current_app.extensions.get('images')
+
+
+def thumbnail_url(src, width, image_format='jpeg'):
+    """The proxied URL for image `src` at `width` pixels (one of IMAGES_WIDTHS),
+    or `src` itself when the proxy is off or it is not a remote URL."""
+    proxy = images()
+    if proxy is None or not src or not src.startswith(('http://', 'https://')):
+        return src
+    return url_for('image', digest=proxy.digest(src), width=width, image_format=image_format, src=src)
+
+
+def image_view(digest, width, image_format):
+    proxy = images()
+    if proxy is None or width not in proxy.widths or image_format not in FORMATS:
+        abort(404)
+    src = request.args.get('src', '')
+    if not hmac.compare_digest(proxy.digest(src), digest):
+        abort(404)
+    try:
+        path = proxy.render(digest, src, width, image_format)
+    except (FetchError, OSError, ValueError, Image.DecompressionBombError) as error:
+        # Let the browser try the source itself
+        current_app.logger.warning('Image proxy failed for %s: %s', src, error)
+        response = redirect(src)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    # The URL names the content: a new image_link gets a new digest
+    response = send_file(path, mimetype=FORMATS[image_format], conditional=True, etag=True, max_age=proxy.max_age)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def images_setup(app):
+    app.jinja_env.globals['thumbnail_url'] = thumbnail_url
+    app.jinja_env.globals['image_widths'] = app.config['IMAGES_WIDTHS']
+    if not app.config['IMAGES_ENABLED']:
+        return
+    if Image is None:
+        app.logger.warning('Image proxy disabled, Pillow is not installed')
+        return
+    app.extensions['images'] = Images(app.config)
+    app.add_url_rule('/images/<digest>/<int:width>.<image_format>', 'image', image_view)
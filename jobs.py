@@ -0,0 +1,220 @@
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from helpers import get_datetime_now
+from models import Job, db
+
+
+# ----------------------------------------------------------------------------#
+# Tasks.
+# ----------------------------------------------------------------------------#
+# Jobs live in the Job table, so they survive restarts and are committed
+# together with the write that enqueued them. They are run by worker threads
+# inside the web process (JOBS_IN_PROCESS_WORKERS) and/or `flask jobs work`.
+
+TASKS = {}
+
+
+def task(name):
+    """Register a function as the task `name`. It is called with the job
+    payload as keyword arguments inside an app context."""
+
+    def decorator(function):
+        TASKS[name] = function
+        return function
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, run_at=None, max_attempts=None, connection=None):
+    """Queue task `name` in the current transaction (or on `connection`, e.g.
+    from a flush event). A job whose idempotency `key` already exists is not
+    queued again."""
+    if name not in TASKS:
+        raise KeyError('Unknown task: %s' % name)
+    executor = db.session if connection is None else connection
+    values = {
+        "name": name,
+        "payload": payload or {},
+        "idempotency_key": key,
+        "status": 'queued',
+        "attempts": 0,
+        "max_attempts": max_attempts or current_app.config['JOBS_MAX_ATTEMPTS'],
+        "run_at": run_at or get_datetime_now(),
+    }
+    dialect = (db.session.get_bind(Job) if connection is None else connection).dialect.name
+    if key is not None and dialect in ('postgresql', 'sqlite'):
+        module = postgresql if dialect == 'postgresql' else sqlite
+        statement = module.insert(Job).values(values).on_conflict_do_nothing(index_elements=['idempotency_key'])
+    else:
+        if key is not None and executor.execute(select(Job.id).where(Job.idempotency_key == key)).first():
+            return
+        statement = insert(Job).values(values)
+    executor.execute(statement)
+
+
+# ----------------------------------------------------------------------------#
+# Workers.
+# ----------------------------------------------------------------------------#
+
+def backoff(attempts):
+    # Exponential with jitter: ~base, 2x base, 4x base... capped
+    config = current_app.config
+    delay = min(config['JOBS_BACKOFF_MAX'], config['JOBS_BACKOFF_BASE'] * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(worker_id):
+    """Lock the next due job for `worker_id` and return it, or None. Jobs whose
+    worker died are taken over once their lock is JOBS_LOCK_TIMEOUT old."""
+    now = get_datetime_now()
+    stale = now - timedelta(seconds=current_app.config['JOBS_LOCK_TIMEOUT'])
+    due = or_(Job.status == 'queued', (Job.status == 'running') & (Job.locked_at < stale))
+    candidates = db.session.execute(select(Job.id, Job.status, Job.locked_at).where(due, Job.run_at <= now)
+                                    .order_by(Job.run_at, Job.id).limit(10)).all()
+    db.session.rollback()
+    for job_id, status, locked_at in candidates:
+        # Only one worker's update matches the status it read
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == status,
+                              Job.locked_at == locked_at if locked_at is not None else Job.locked_at.is_(None))
+            .values(status='running', locked_at=now, locked_by=worker_id, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+
+def execute(job):
+    try:
+        TASKS[job.name](**job.payload)
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.last_error = traceback.format_exc()[-4000:]
+        if job.name not in TASKS or job.attempts >= job.max_attempts:
+            job.status = 'failed'
+        else:
+            job.status = 'queued'
+            job.run_at = get_datetime_now() + timedelta(seconds=backoff(job.attempts))
+        job.locked_at = job.locked_by = None
+        db.session.commit()
+        current_app.logger.warning('Job %s (%s) attempt %s failed', job.id, job.name, job.attempts)
+        return False
+    job.status = 'done'
+    job.locked_at = job.locked_by = None
+    job.last_error = None
+    db.session.commit()
+    return True
+
+
+def work(app, worker_id, stop=None, burst=False):
+    """Run due jobs until `stop` is set, or until none are due if `burst`."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        with app.app_context():
+            try:
+                job = claim(worker_id)
+                if job is not None:
+                    execute(job)
+            except Exception:
+                app.logger.exception('Job worker %s failed', worker_id)
+                job = None
+            finally:
+                db.session.remove()
+        if job is None:
+            if burst:
+                return
+            stop.wait(app.config['JOBS_POLL_INTERVAL'])
+
+
+def worker_name(index):
+    return '%s:%d:%d' % (socket.gethostname(), os.getpid(), index)
+
+
+def start_workers(app, count):
+    stop = threading.Event()
+    threads = [threading.Thread(target=work, args=(app, worker_name(index), stop), daemon=True,
+                                name='jobs-%d' % index) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return stop, threads
+
+
+def jobs_setup(app):
+    # In-process workers start with the first request rather than at import,
+    # so CLI commands (migrations, imports) never run jobs
+    if not app.config['JOBS_IN_PROCESS_WORKERS']:
+        return
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_in_process_workers():
+        if 'job_workers' not in app.extensions:
+            with lock:
+                if 'job_workers' not in app.extensions:
+                    app.extensions['job_workers'] = start_workers(app, app.config['JOBS_IN_PROCESS_WORKERS'])
+
+
+# ----------------------------------------------------------------------------#
+# CLI.
+# ----------------------------------------------------------------------------#
+
+jobs_cli = AppGroup('jobs', help='Run and inspect background jobs.')
+
+
+@jobs_cli.command('work')
+@click.option('--workers', default=1, show_default=True, help='Worker threads.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due.')
+@with_appcontext
+def work_command(workers, burst):
+    """Run queued jobs."""
+    app = current_app._get_current_object()
+    if burst:
+        threads = [threading.Thread(target=work, args=(app, worker_name(index)), kwargs={"burst": True})
+                   for index in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return
+    stop, threads = start_workers(app, workers)
+    click.echo('%d worker(s) running, Ctrl+C to stop.' % workers)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Count jobs by task and status."""
+    rows = db.session.execute(select(Job.name, Job.status, func.count(Job.id))
+                              .group_by(Job.name, Job.status).order_by(Job.name, Job.status)).all()
+    for name, status, count in rows:
+        click.echo('%-30s %-8s %d' % (name, status, count))
+    if not rows:
+        click.echo('No jobs.')
+
+
+@jobs_cli.command('retry')
+def retry_command():
+    """Queue failed jobs again."""
+    retried = db.session.execute(update(Job).where(Job.status == 'failed')
+                                 .values(status='queued', attempts=0, run_at=get_datetime_now())).rowcount
+    db.session.commit()
+    click.echo('%s jobs queued again.' % retried)
@@ -0,0 +1,241 @@
+import hmac
+import threading
+import time
+
+from flask import abort, current_app, g, has_request_context, request, request_finished, request_started, \
+    before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+
+# ----------------------------------------------------------------------------#
+# Per-request timings.
+# ----------------------------------------------------------------------------#
+# SQL time is measured around every cursor execute, template time between
+# Flask's render signals (minus the SQL run while rendering, e.g. lazy loads)
+# and Python time is whatever is left of the request.
+
+def timings():
+    return g.get('_timings') if has_request_context() else None
+
+
+def start_request(sender, **extra):
+    g._timings = {"started": time.perf_counter(), "queries": 0, "sql": 0.0, "template": 0.0,
+                  "template_sql": 0.0, "rendering": [], "slowest": 0.0}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    if timings() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_query(conn, cursor, statement, parameters, context, executemany):
+    current = timings()
+    if current is None or not conn.info.get('query_started'):
+        return
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    current["queries"] += 1
+    current["sql"] += elapsed
+    if current["rendering"]:
+        current["template_sql"] += elapsed
+    current["slowest"] = max(current["slowest"], elapsed)
+
+
+def start_render(sender, template, context, **extra):
+    current = timings()
+    if current is not None:
+        current["rendering"].append(time.perf_counter())
+
+
+def end_render(sender, template, context, **extra):
+    current = timings()
+    if current is not None and current["rendering"]:
+        started = current["rendering"].pop()
+        # Only the outermost render counts, includes are part of it
+        if not current["rendering"]:
+            current["template"] += time.perf_counter() - started
+
+
+def record(app, endpoint, status, current):
+    total = time.perf_counter() - current["started"]
+    template = max(0.0, current["template"] - current["template_sql"])
+    python = max(0.0, total - current["sql"] - template)
+    app.extensions['metrics'].record(endpoint, status, total, current["queries"], current["sql"], template,
+                                     python, current["slowest"])
+    return total, template, python
+
+
+def recorded(app, chunks, endpoint, status, current):
+    # Streamed bodies run their queries and templates after the view returns
+    try:
+        for chunk in chunks:
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        record(app, endpoint, status, current)
+
+
+def finish_request(sender, response, **extra):
+    current = g.get('_timings')
+    if current is None:
+        return
+    endpoint = request.endpoint or 'unmatched'
+    if response.is_streamed:
+        # Left on g so the queries run while streaming are counted
+        response.response = recorded(sender, response.response, endpoint, response.status_code, current)
+        return
+    g.pop('_timings')
+    total, template, python = record(sender, endpoint, response.status_code, current)
+    if sender.config['SERVER_TIMING_ENABLED']:
+        response.headers['Server-Timing'] = ', '.join([
+            'sql;dur=%.2f;desc="%d queries"' % (current["sql"] * 1000, current["queries"]),
+            'tpl;dur=%.2f' % (template * 1000),
+            'app;dur=%.2f' % (python * 1000),
+            'total;dur=%.2f' % (total * 1000),
+        ])
+
+
+# ----------------------------------------------------------------------------#
+# Aggregation and exposition.
+# ----------------------------------------------------------------------------#
+
+class Metrics(object):
+    """Per-process totals by endpoint. Under gunicorn every worker keeps its
+    own, so scrape each worker or aggregate in Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, status, total, queries, sql, template, python, slowest):
+        with self.lock:
+            route = self.routes.get(endpoint)
+            if route is None:
+                route = self.routes[endpoint] = {
+                    "requests": {}, "duration": 0.0, "buckets": [0] * len(self.buckets), "queries": 0,
+                    "sql": 0.0, "template": 0.0, "python": 0.0, "slowest": 0.0}
+            route["requests"][status] = route["requests"].get(status, 0) + 1
+            route["duration"] += total
+            for index, bound in enumerate(self.buckets):
+                if total <= bound:
+                    route["buckets"][index] += 1
+            route["queries"] += queries
+            route["sql"] += sql
+            route["template"] += template
+            route["python"] += python
+            route["slowest"] = max(route["slowest"], slowest)
+
+    def snapshot(self):
+        with self.lock:
+            return {endpoint: dict(route, requests=dict(route["requests"]), buckets=list(route["buckets"]))
+                    for endpoint, route in self.routes.items()}
+
+
+def label(value):
+    return '"%s"' % str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def exposition(metrics, collectors=()):
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in samples:
+            rendered = ','.join('%s=%s' % (key, label(item)) for key, item in labels)
+            lines.append('%s{%s} %s' % (name, rendered, repr(float(value))) if rendered
+                         else '%s %s' % (name, repr(float(value))))
+
+    routes = sorted(metrics.snapshot().items())
+    family('fyyur_requests_total', 'counter', 'Requests handled.',
+           [((('endpoint', endpoint), ('status', status)), count)
+            for endpoint, route in routes for status, count in sorted(route["requests"].items())])
+    histogram = []
+    for endpoint, route in routes:
+        count = sum(route["requests"].values())
+        for bound, bucket in zip(metrics.buckets, route["buckets"]):
+            histogram.append(((('endpoint', endpoint), ('le', bound)), bucket))
+        histogram.append(((('endpoint', endpoint), ('le', '+Inf')), count))
+    lines.append('# HELP fyyur_request_duration_seconds Request duration.')
+    lines.append('# TYPE fyyur_request_duration_seconds histogram')
+    for labels, value in histogram:
+        lines.append('fyyur_request_duration_seconds_bucket{%s} %d' % (
+            ','.join('%s=%s' % (key, label(item)) for key, item in labels), value))
+    for endpoint, route in routes:
+        lines.append('fyyur_request_duration_seconds_sum{endpoint=%s} %r' % (label(endpoint), route["duration"]))
+        lines.append('fyyur_request_duration_seconds_count{endpoint=%s} %d' % (
+            label(endpoint), sum(route["requests"].values())))
+    family('fyyur_sql_queries_total', 'counter', 'SQL statements executed.',
+           [((('endpoint', endpoint),), route["queries"]) for endpoint, route in routes])
+    for name, key, help_text in (('fyyur_sql_seconds_total', 'sql', 'Time spent executing SQL.'),
+                                 ('fyyur_template_seconds_total', 'template',
+                                  'Time spent rendering templates, excluding SQL.'),
+                                 ('fyyur_python_seconds_total', 'python',
+                                  'Request time outside SQL and templates.')):
+        family(name, 'counter', help_text, [((('endpoint', endpoint),), route[key]) for endpoint, route in routes])
+    # Statement text stays out of the labels: it would leak table and column
+    # names to scrapers and make a series per distinct statement
+    family('fyyur_slowest_query_seconds', 'gauge', 'Slowest SQL statement seen for the endpoint.',
+           [((('endpoint', endpoint),), route["slowest"]) for endpoint, route in routes if route["queries"]])
+    for collector in collectors:
+        for name, kind, help_text, samples in collector():
+            family(name, kind, help_text, samples)
+    return '\n'.join(lines) + '\n'
+
+
+def cache_metrics():
+    stats = current_app.extensions['cache'].stats()
+    return [('fyyur_cache_%s_total' % key, 'counter', 'Detail page cache %s.' % key, [((), stats[key])])
+            for key in ('hits', 'misses')]
+
+
+def pool_metrics():
+    # Connection pool saturation per bind; pools without a size (NullPool
+    # behind an external pooler, SQLite's) are skipped
+    families = {
+        'size': ('fyyur_db_pool_size', 'gauge', 'Connections the pool keeps open.', []),
+        'checked_out': ('fyyur_db_pool_checked_out', 'gauge', 'Connections in use.', []),
+        'overflow': ('fyyur_db_pool_overflow', 'gauge', 'Connections open beyond the pool size.', []),
+        'saturation': ('fyyur_db_pool_saturation', 'gauge',
+                       'Connections in use over the pool size plus max overflow.', []),
+    }
+    for bind, engine in db.engines.items():
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            continue
+        labels = (('bind', bind or 'default'),)
+        limit = pool.size() + max(pool._max_overflow, 0)
+        for key, value in (('size', pool.size()), ('checked_out', pool.checkedout()),
+                           ('overflow', max(pool.overflow(), 0)),
+                           ('saturation', pool.checkedout() / float(limit or 1))):
+            families[key][3].append((labels, value))
+    return [family for family in families.values() if family[3]]
+
+
+def metrics_view():
+    # Like api.bulk_allowed, a bearer token when METRICS_TOKEN is set
+    token = current_app.config['METRICS_TOKEN']
+    sent = request.headers.get('Authorization', '')
+    if token and not hmac.compare_digest(sent.encode(), ('Bearer %s' % token).encode()):
+        abort(401)
+    body = exposition(current_app.extensions['metrics'], current_app.extensions['metrics_collectors'])
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+
+def metrics_setup(app):
+    app.extensions['metrics'] = Metrics(app.config['METRICS_BUCKETS'])
+    # Callables returning (name, type, help, [(labels, value)]) families, see cache_metrics
+    app.extensions['metrics_collectors'] = [cache_metrics, pool_metrics]
+    if not app.config['METRICS_ENABLED']:
+        return
+    request_started.connect(start_request, app)
+    request_finished.connect(finish_request, app)
+    before_render_template.connect(start_render, app)
+    template_rendered.connect(end_render, app)
+    app.add_url_rule(app.config['METRICS_PATH'], 'metrics', metrics_view)
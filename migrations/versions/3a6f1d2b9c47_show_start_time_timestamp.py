@@ -0,0 +1,43 @@
+"""Show.start_time as timestamp with time zone
+
+Revision ID: 3a6f1d2b9c47
+Revises: 85c689e122f8
+Create Date: 2026-10-18 10:02:11.418230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a6f1d2b9c47'
+down_revision = '85c689e122f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    show_columns = [column['name'] for column in sa.inspect(op.get_bind()).get_columns('Show')]
+    if 'start_time' in show_columns:
+        op.alter_column('Show', 'start_time',
+                   existing_type=sa.String(),
+                   type_=sa.DateTime(timezone=True),
+                   existing_nullable=False,
+                   postgresql_using='start_time::timestamp with time zone')
+    else:
+        # start_time was never part of a revision on databases created by these migrations
+        op.add_column('Show', sa.Column('start_time', sa.DateTime(timezone=True), nullable=False))
+    op.create_index(op.f('ix_Show_start_time'), 'Show', ['start_time'], unique=False)
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.drop_index(op.f('ix_Show_start_time'), table_name='Show')
+    op.alter_column('Show', 'start_time',
+               existing_type=sa.DateTime(timezone=True),
+               type_=sa.String(),
+               existing_nullable=False,
+               postgresql_using="to_char(start_time, 'YYYY-MM-DD HH24:MI:SS')")
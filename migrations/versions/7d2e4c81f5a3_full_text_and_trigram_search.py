@@ -0,0 +1,52 @@
+"""full-text and trigram search indexes
+
+Revision ID: 7d2e4c81f5a3
+Revises: 3a6f1d2b9c47
+Create Date: 2026-10-18 11:24:37.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e4c81f5a3'
+down_revision = '3a6f1d2b9c47'
+branch_labels = None
+depends_on = None
+
+# search_vector is generated by PostgreSQL and read only by search.PostgresSearch
+SEARCH_VECTORS = {
+    'Venue': "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(city, '') || ' ' || coalesce(state, ''))",
+    'Artist': "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(city, '') || ' ' || coalesce(state, ''))",
+    'Show': "to_tsvector('simple', coalesce(show_title, '') || ' ' || coalesce(description, ''))",
+}
+
+TRIGRAM_COLUMNS = {
+    'Venue': ['name', 'city'],
+    'Artist': ['name', 'city'],
+    'Show': ['show_title'],
+}
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, expression in SEARCH_VECTORS.items():
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(),
+                                       sa.Computed(expression, persisted=True), nullable=True))
+        op.create_index('ix_%s_search_vector' % table, table, ['search_vector'], unique=False,
+                        postgresql_using='gin')
+    for table, columns in TRIGRAM_COLUMNS.items():
+        for column in columns:
+            op.create_index('ix_%s_%s_trgm' % (table, column), table, [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table, columns in TRIGRAM_COLUMNS.items():
+        for column in columns:
+            op.drop_index('ix_%s_%s_trgm' % (table, column), table_name=table)
+    for table in SEARCH_VECTORS:
+        op.drop_index('ix_%s_search_vector' % table, table_name=table)
+        op.drop_column(table, 'search_vector')
@@ -0,0 +1,43 @@
+"""cache versions bumped by triggers
+
+Revision ID: a7c3e1f9b5d2
+Revises: f4c8a2d6e913
+Create Date: 2026-10-18 21:04:17.338210
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e1f9b5d2'
+down_revision = 'f4c8a2d6e913'
+branch_labels = None
+depends_on = None
+
+# Matches models.VERSIONED_TABLES
+VERSIONED_TABLES = ['Venue', 'Artist', 'Show']
+
+
+def upgrade():
+    op.create_table('CacheVersion',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.execute('INSERT INTO "CacheVersion" (table_name, version) VALUES %s'
+               % ', '.join("('%s', 0)" % table for table in VERSIONED_TABLES))
+    # Statement level, so a bulk insert or delete bumps the version once
+    op.execute('CREATE FUNCTION bump_cache_version() RETURNS trigger AS $$ BEGIN '
+               'UPDATE "CacheVersion" SET version = version + 1 WHERE table_name = TG_TABLE_NAME; '
+               'RETURN NULL; END $$ LANGUAGE plpgsql')
+    for table in VERSIONED_TABLES:
+        op.execute('CREATE TRIGGER "bump_%s_version" AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "%s" '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION bump_cache_version()' % (table, table))
+
+
+def downgrade():
+    for table in VERSIONED_TABLES:
+        op.execute('DROP TRIGGER "bump_%s_version" ON "%s"' % (table, table))
+    op.execute('DROP FUNCTION bump_cache_version()')
+    op.drop_table('CacheVersion')
@@ -0,0 +1,27 @@
+"""updated_at columns for HTTP validators
+
+Revision ID: b41c9e07a6d2
+Revises: 7d2e4c81f5a3
+Create Date: 2026-10-18 12:40:05.214776
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41c9e07a6d2'
+down_revision = '7d2e4c81f5a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True),
+                                       server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
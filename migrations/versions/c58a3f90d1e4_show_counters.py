@@ -0,0 +1,34 @@
+"""upcoming and past show counters on Venue and Artist
+
+Revision ID: c58a3f90d1e4
+Revises: b41c9e07a6d2
+Create Date: 2026-10-18 13:52:48.660172
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c58a3f90d1e4'
+down_revision = 'b41c9e07a6d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{key} = "{table}".id AND "Show".start_time >= now()), '
+            'past_shows_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{key} = "{table}".id AND "Show".start_time < now())'.format(table=table, key=key))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
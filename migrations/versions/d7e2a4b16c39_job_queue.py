@@ -0,0 +1,44 @@
+"""background job queue
+
+Revision ID: d7e2a4b16c39
+Revises: c58a3f90d1e4
+Create Date: 2026-10-18 15:06:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e2a4b16c39'
+down_revision = 'c58a3f90d1e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Job',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.String(length=120), nullable=False),
+                    sa.Column('payload', sa.JSON(), nullable=False),
+                    sa.Column('idempotency_key', sa.String(length=255), nullable=True),
+                    sa.Column('status', sa.String(length=20), server_default='queued', nullable=False),
+                    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+                    sa.Column('max_attempts', sa.Integer(), server_default='5', nullable=False),
+                    sa.Column('run_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+                    sa.Column('locked_by', sa.String(length=255), nullable=True),
+                    sa.Column('last_error', sa.Text(), nullable=True),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                              nullable=False),
+                    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                              nullable=False),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('idempotency_key')
+                    )
+    op.create_index('ix_Job_status_run_at', 'Job', ['status', 'run_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Job_status_run_at', table_name='Job')
+    op.drop_table('Job')
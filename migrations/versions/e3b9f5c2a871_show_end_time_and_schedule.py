@@ -0,0 +1,41 @@
+"""show end time and venue schedule exclusion constraint
+
+Revision ID: e3b9f5c2a871
+Revises: d7e2a4b16c39
+Create Date: 2026-10-18 16:21:40.552917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b9f5c2a871'
+down_revision = 'd7e2a4b16c39'
+branch_labels = None
+depends_on = None
+
+# Matches models.DEFAULT_SHOW_DURATION
+DEFAULT_DURATION = "interval '2 hours'"
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(timezone=True), nullable=True))
+    op.execute('UPDATE "Show" SET end_time = start_time + %s' % DEFAULT_DURATION)
+    op.alter_column('Show', 'end_time', nullable=False)
+
+    # btree_gist lets the GiST index combine venue_id equality with range overlap
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    overlapping = op.get_bind().execute(sa.text(
+        'SELECT a.id, b.id FROM "Show" a JOIN "Show" b ON a.venue_id = b.venue_id AND a.id < b.id '
+        'AND tstzrange(a.start_time, a.end_time) && tstzrange(b.start_time, b.end_time) LIMIT 20')).fetchall()
+    if overlapping:
+        raise RuntimeError('Shows already double-booked, reschedule them before upgrading: %s'
+                           % ', '.join('%s/%s' % pair for pair in overlapping))
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_venue_id_schedule" '
+               'EXCLUDE USING gist (venue_id WITH =, tstzrange(start_time, end_time) WITH &&)')
+
+
+def downgrade():
+    op.execute('ALTER TABLE "Show" DROP CONSTRAINT "ex_Show_venue_id_schedule"')
+    op.drop_column('Show', 'end_time')
@@ -0,0 +1,47 @@
+"""GIN indexes on genres
+
+Revision ID: f4c8a2d6e913
+Revises: e3b9f5c2a871
+Create Date: 2026-10-18 19:12:45.610284
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c8a2d6e913'
+down_revision = 'e3b9f5c2a871'
+branch_labels = None
+depends_on = None
+
+# The default array_ops GIN operator class answers the && (any of) and
+# @> (all of) genre filters in queries.genre_criterion
+GENRE_TABLES = ['Venue', 'Artist']
+
+
+def upgrade():
+    # Artist.genres is still the VARCHAR(120) of the first revision, holding
+    # the array literal ('{Jazz,Folk}') the ORM wrote into it, or a plain
+    # comma separated list; GIN has no default operator class for it
+    genres = [column for column in sa.inspect(op.get_bind()).get_columns('Artist') if column['name'] == 'genres']
+    if genres and not isinstance(genres[0]['type'], sa.ARRAY):
+        op.alter_column('Artist', 'genres',
+                   existing_type=sa.VARCHAR(length=120),
+                   type_=postgresql.ARRAY(sa.String()),
+                   existing_nullable=False,
+                   postgresql_using="CASE WHEN genres LIKE '{%}' THEN genres::varchar[] "
+                                    "ELSE string_to_array(genres, ',') END")
+    for table in GENRE_TABLES:
+        op.create_index('ix_%s_genres' % table, table, ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    for table in GENRE_TABLES:
+        op.drop_index('ix_%s_genres' % table, table_name=table)
+    op.alter_column('Artist', 'genres',
+               existing_type=postgresql.ARRAY(sa.String()),
+               type_=sa.VARCHAR(length=120),
+               existing_nullable=False,
+               postgresql_using='genres::varchar(120)')
@@ -1,14 +1,72 @@
+from datetime import timedelta
+
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ARRAY, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ARRAY, ForeignKey, JSON, DDL, event, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# PostgreSQL arrays, stored as JSON lists on the SQLite databases used in development
+GenreList = ARRAY(String).with_variant(JSON, 'sqlite')
+
+# Shows listed without an end time are booked for this long
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+
+
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
 
-db = SQLAlchemy()
+
+def engine_options(config, uri):
+    url = make_url(uri)
+    if url.get_backend_name() != 'postgresql':
+        return {}
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if config['DB_POOLER'] == 'transaction':
+        options = {"poolclass": NullPool, "pool_pre_ping": False}
+        if url.get_driver_name() == 'psycopg':
+            # psycopg 3 prepares repeated statements server-side, which breaks
+            # once the pooler hands the next transaction another backend
+            options["connect_args"] = {"prepare_threshold": None}
+        return options
+    options = {
+        "pool_size": config['DB_POOL_SIZE'],
+        "max_overflow": config['DB_MAX_OVERFLOW'],
+        "pool_timeout": config['DB_POOL_TIMEOUT'],
+        "pool_recycle": config['DB_POOL_RECYCLE'],
+        "pool_pre_ping": config['DB_POOL_PRE_PING'],
+    }
+    if timeout:
+        options["connect_args"] = {"options": '-c statement_timeout=%d' % timeout}
+    return options
+
+
+def set_local_statement_timeout(engine, timeout):
+    # Behind a transaction pooler session settings leak to other clients, so
+    # the timeout is set again at the start of every transaction
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.exec_driver_sql('SET LOCAL statement_timeout = %d' % timeout)
 
 
 def db_setup(app):
     app.config.from_object('config')
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI']))
+    app.config.setdefault('SQLALCHEMY_BINDS', {
+        'replica_%d' % index: dict(engine_options(app.config, uri), url=uri)
+        for index, uri in enumerate(app.config['REPLICA_URIS'])})
     db.app = app
     db.init_app(app)
+    if app.config['DB_POOLER'] == 'transaction' and app.config['DB_STATEMENT_TIMEOUT']:
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == 'postgresql':
+                    set_local_statement_timeout(engine, app.config['DB_STATEMENT_TIMEOUT'])
     migrate = Migrate(app, db)
     return db
 
@@ -28,9 +86,12 @@ class Venue(db.Model):
     phone = db.Column(db.String(120), nullable=False)
     image_link = db.Column(db.String(500), nullable=True)
     facebook_link = db.Column(db.String(500), nullable=True)
-    genres = db.Column(ARRAY(String), nullable=False)
+    genres = db.Column(GenreList, nullable=False)
     seeking_talent = db.Column(db.Boolean, default=False, nullable=True)
     seeking_description = db.Column(db.String(500), nullable=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
     shows = db.relationship('Show', backref='Venue', lazy=True)
 
 
@@ -44,16 +105,23 @@ class Artist(db.Model):
     phone = db.Column(db.String(120), nullable=False)
     image_link = db.Column(db.String(500), nullable=True)
     facebook_link = db.Column(db.String(120), nullable=True)
-    genres = db.Column(ARRAY(String), nullable=False)
+    genres = db.Column(GenreList, nullable=False)
     address = db.Column(db.String(120), nullable=True)
     website = db.Column(db.String(500), nullable=True)
     seeking_talent = db.Column(db.Boolean, default=False, nullable=True)
     seeking_description = db.Column(db.String(500), nullable=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
     shows = db.relationship('Show', backref='Artist', lazy=True)
 
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     show_title = db.Column(db.String(), nullable=False)
@@ -61,4 +129,61 @@ class Show(db.Model):
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     description = db.Column(db.String(500), nullable=True)
     register_link = db.Column(db.String(500), nullable=True)
-    start_time = db.Column(String(), nullable=False)
+    start_time = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+    # On PostgreSQL an exclusion constraint on (venue_id, tstzrange(start_time,
+    # end_time)) rejects overlapping shows at a venue, see availability.py
+    end_time = db.Column(db.DateTime(timezone=True), nullable=False, default=default_end_time)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+
+class Job(db.Model):
+    __tablename__ = 'Job'
+    __table_args__ = (
+        db.Index('ix_Job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    payload = db.Column(JSON, nullable=False)
+    # Enqueueing twice with the same key is a no-op
+    idempotency_key = db.Column(db.String(255), nullable=True, unique=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', server_default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    max_attempts = db.Column(db.Integer, nullable=False, default=5, server_default='5')
+    run_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    locked_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    locked_by = db.Column(db.String(255), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+
+# ----------------------------------------------------------------------------
+# Cache versions.
+# ----------------------------------------------------------------------------#
+# One row per listed table, bumped by triggers in the transaction of every
+# insert, update or delete on it (bulk statements and deletes included), so
+# listing validators read a primary key instead of aggregating the table.
+# Migration a7c3e1f9b5d2 creates the PostgreSQL triggers; SQLite databases
+# made with create_all get row-level ones.
+
+VERSIONED_TABLES = ('Venue', 'Artist', 'Show')
+
+
+class CacheVersion(db.Model):
+    __tablename__ = 'CacheVersion'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+
+
+event.listen(CacheVersion.__table__, 'after_create', DDL(
+    'INSERT INTO "CacheVersion" (table_name, version) VALUES %s'
+    % ', '.join("('%s', 0)" % table_name for table_name in VERSIONED_TABLES)))
+
+for table_name in VERSIONED_TABLES:
+    for operation in ('INSERT', 'UPDATE', 'DELETE'):
+        event.listen(db.metadata.tables[table_name], 'after_create', DDL(
+            'CREATE TRIGGER "bump_%(table)s_version_on_%(name)s" AFTER %(operation)s ON "%(table)s" '
+            'BEGIN UPDATE "CacheVersion" SET version = version + 1 WHERE table_name = \'%(table)s\'; END'
+            % {'table': table_name, 'operation': operation, 'name': operation.lower()}).execute_if(dialect='sqlite'))
@@ -0,0 +1,198 @@
+import base64
+import binascii
+import json
+
+from flask import current_app, get_flashed_messages, request, stream_template, url_for
+from sqlalchemy import and_, or_, tuple_
+from werkzeug.exceptions import abort
+
+from models import db
+
+
+# ----------------------------------------------------------------------------#
+# Keyset pagination.
+# ----------------------------------------------------------------------------#
+
+def encode_cursor(values):
+    payload = json.dumps(values, default=lambda value: value.isoformat(), separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_keys):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(sort_keys):
+            raise ValueError(cursor)
+        return [column.type.python_type.fromisoformat(value)
+                if hasattr(column.type.python_type, 'fromisoformat') else value
+                for (column, _, _), value in zip(sort_keys, values)]
+    except (ValueError, TypeError, binascii.Error, NotImplementedError):
+        abort(400)
+
+
+def keyset_criterion(sort_keys, values, forward):
+    # Rows strictly after (or before) the cursor in the sort order
+    if len({descending for _, _, descending in sort_keys}) == 1:
+        columns = tuple_(*[column for column, _, _ in sort_keys])
+        greater = forward != sort_keys[0][2]
+        return columns > tuple_(*values) if greater else columns < tuple_(*values)
+    clauses = []
+    for position, (column, _, descending) in enumerate(sort_keys):
+        equal = [previous == value for (previous, _, _), value in zip(sort_keys[:position], values)]
+        greater = forward != descending
+        step = column > values[position] if greater else column < values[position]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def sort_order(sort_keys, forward):
+    return [column.desc() if descending == forward else column.asc()
+            for column, _, descending in sort_keys]
+
+
+def page_url(**cursor):
+    params = request.values.to_dict(flat=False)
+    params.pop('after', None)
+    params.pop('before', None)
+    params.pop('csrf_token', None)
+    params.update(cursor)
+    return url_for(request.endpoint, **request.view_args, **params)
+
+
+def page_limit(maximum=None):
+    limit = request.args.get('limit', type=int) or current_app.config['PAGE_SIZE']
+    return max(1, min(limit, maximum or current_app.config['MAX_PAGE_SIZE']))
+
+
+def page_statement(statement, sort_keys, limit):
+    # (statement for limit + 1 rows, forward, cursor) for the requested page
+    after = request.args.get('after')
+    before = request.args.get('before')
+    forward = before is None
+    cursor = after if forward else before
+    if cursor:
+        statement = statement.where(keyset_criterion(sort_keys, decode_cursor(cursor, sort_keys), forward))
+    return statement.order_by(*sort_order(sort_keys, forward)).limit(limit + 1), forward, cursor
+
+
+def page_links(sort_keys, first, last, has_more, forward, cursor):
+    def row_cursor(row):
+        return encode_cursor([row[key] for _, key, _ in sort_keys])
+
+    next_url = prev_url = None
+    if last is not None and (has_more if forward else True):
+        next_url = page_url(after=row_cursor(last))
+    if first is not None and (has_more if not forward else bool(cursor)):
+        prev_url = page_url(before=row_cursor(first))
+    return next_url, prev_url
+
+
+def paginate(statement, sort_keys, limit=None):
+    """Fetch one page of `statement` ordered by `sort_keys`.
+
+    `sort_keys` is a list of (column, row key, descending) tuples whose last
+    entry must be unique, e.g. [(Show.start_time, 'start_time', False),
+    (Show.id, 'id', False)]. The cursor for a page is the sort values of its
+    first or last row, passed back as ?after= or ?before=.
+    """
+    limit = limit or page_limit()
+    statement, forward, cursor = page_statement(statement, sort_keys, limit)
+    rows = [dict(row) for row in db.session.execute(statement).mappings()]
+    return page_result(rows, sort_keys, limit, forward, cursor)
+
+
+def page_result(rows, sort_keys, limit, forward, cursor):
+    # The page for the up to limit + 1 rows a page_statement returned
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not forward:
+        rows.reverse()
+
+    next_url, prev_url = page_links(sort_keys, rows[0] if rows else None, rows[-1] if rows else None,
+                                    has_more, forward, cursor)
+    return {
+        "items": rows,
+        "next_url": next_url,
+        "prev_url": prev_url,
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Streamed pages.
+# ----------------------------------------------------------------------------#
+
+class StreamedPage(object):
+    """A forward page whose rows are read from a server-side cursor while the
+    template renders. `items` can be iterated once; the pager links are known
+    once it has been, so templates render them after the rows."""
+
+    def __init__(self, statement, sort_keys, limit, cursor):
+        self.statement = statement
+        self.sort_keys = sort_keys
+        self.limit = limit
+        self.cursor = cursor
+        self.links = None
+
+    @property
+    def items(self):
+        first = last = None
+        count = 0
+        has_more = False
+        statement = self.statement.execution_options(yield_per=current_app.config['STREAM_BATCH_SIZE'])
+        result = db.session.execute(statement).mappings()
+        try:
+            for row in result:
+                if count == self.limit:
+                    has_more = True
+                    break
+                count += 1
+                last = dict(row)
+                if first is None:
+                    first = last
+                yield last
+        finally:
+            result.close()
+        self.links = page_links(self.sort_keys, first, last, has_more, True, self.cursor)
+
+    def __getitem__(self, key):
+        # Read like the dicts paginate returns
+        return getattr(self, key)
+
+    @property
+    def next_url(self):
+        return self.links[0] if self.links else None
+
+    @property
+    def prev_url(self):
+        return self.links[1] if self.links else None
+
+
+def stream_paginate(statement, sort_keys):
+    """Like paginate, but forward pages stream their rows and may be up to
+    MAX_STREAM_PAGE_SIZE long. Backward pages are reversed, so they are read
+    with paginate."""
+    limit = page_limit(current_app.config['MAX_STREAM_PAGE_SIZE'])
+    if request.args.get('before') is not None:
+        return paginate(statement, sort_keys, limit)
+    statement, forward, cursor = page_statement(statement, sort_keys, limit)
+    return StreamedPage(statement, sort_keys, limit, cursor)
+
+
+def stream_page(template_name, **context):
+    """Stream `template_name` in chunks of about STREAM_BUFFER_SIZE characters."""
+    # Flashes are popped from the session now, since it is saved before the body is sent
+    get_flashed_messages()
+    size = current_app.config['STREAM_BUFFER_SIZE']
+
+    def buffered(chunks):
+        buffer, length = [], 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                yield ''.join(buffer)
+                buffer, length = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    return current_app.response_class(buffered(stream_template(template_name, **context)))
@@ -0,0 +1,251 @@
+from itertools import groupby
+
+from flask import request
+from sqlalchemy import ARRAY, String, cast, func, select
+from sqlalchemy.dialects import postgresql
+from werkzeug.exceptions import abort
+
+import search
+from forms import GENRES
+from helpers import get_datetime_now
+from models import Artist, Venue, Show, db
+from pagination import paginate, stream_paginate
+
+
+# ----------------------------------------------------------------------------#
+# Genre filters.
+# ----------------------------------------------------------------------------#
+# ?genres=Jazz&genres=Blues (or ?genres=Jazz,Blues) keeps venues or artists
+# with any of the genres, and also &genre_match=all those with all of them.
+# On PostgreSQL these are the && and @> array operators, answered by the GIN
+# indexes on genres; SQLite stores genres as JSON and matches with json_each.
+
+def requested_genres():
+    genres = []
+    for value in request.values.getlist('genres'):
+        genres.extend(genre.strip() for genre in value.split(',') if genre.strip())
+    unknown = [genre for genre in genres if genre not in GENRES]
+    if unknown:
+        abort(400, 'Unknown genre: %s.' % ', '.join(unknown))
+    match = request.values.get('genre_match', 'any')
+    if match not in ('any', 'all'):
+        abort(400, 'genre_match must be any or all.')
+    return sorted(set(genres)), match
+
+
+def genre_criterion(model, genres, match='any'):
+    if db.engine.dialect.name == 'postgresql':
+        values = cast(postgresql.array(genres), ARRAY(String))
+        return model.genres.op('@>' if match == 'all' else '&&')(values)
+    genre = func.json_each(model.genres).table_valued('value').alias('genre')
+    if match == 'all':
+        found = select(func.count(func.distinct(genre.c.value))).where(genre.c.value.in_(genres))
+        return found.scalar_subquery() == len(genres)
+    return select(genre.c.value).where(genre.c.value.in_(genres)).exists()
+
+
+def filter_genres(statement, model):
+    genres, match = requested_genres()
+    if not genres:
+        return statement
+    return statement.where(genre_criterion(model, genres, match))
+
+
+# ----------------------------------------------------------------------------#
+# Query layer shared by the views.
+# ----------------------------------------------------------------------------#
+
+def ranked_sort_keys(model, rank):
+    return [(rank, 'rank', True), (model.id, 'id', False)]
+
+
+def search_statements(model, search_term):
+    # (page statement, sort keys, count statement) for a venue or artist search
+    criterion, rank = search.match(model, search_term)
+    statement = filter_genres(select(model.id, model.name, rank.label('rank'),
+                                     model.upcoming_shows_count.label('num_upcoming_shows')), model) \
+        .where(criterion)
+    count = filter_genres(select(func.count(model.id)), model).where(criterion)
+    return statement, ranked_sort_keys(model, rank), count
+
+
+def search_with_upcoming_counts(model, search_term):
+    statement, sort_keys, count = search_statements(model, search_term)
+    page = paginate(statement, sort_keys)
+    return db.session.execute(count).scalar(), page
+
+
+def venue_search_results(search_term):
+    return search_with_upcoming_counts(Venue, search_term)
+
+
+def artist_search_results(search_term):
+    return search_with_upcoming_counts(Artist, search_term)
+
+
+def name_sort_keys(model):
+    return [(model.name, 'name', False), (model.id, 'id', False)]
+
+
+SHOW_SORT_KEYS = [(Show.start_time, 'start_time', False), (Show.id, 'id', False)]
+
+
+def show_cards(*columns):
+    # Each show card needs its venue name and artist name and image
+    return select(Show.id, Show.show_title.label('title'), Show.venue_id,
+                       Venue.name.label('venue_name'), Show.artist_id,
+                       Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'),
+                       Show.start_time, Show.description, Show.register_link, *columns) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id)
+
+
+def show_listing(stream=False):
+    return (stream_paginate if stream else paginate)(show_cards(), SHOW_SORT_KEYS)
+
+
+def show_search_statements(search_term):
+    criterion, rank = search.match(Show, search_term)
+    return show_cards(rank.label('rank')).where(criterion), ranked_sort_keys(Show, rank), \
+        select(func.count(Show.id)).where(criterion)
+
+
+def show_search_results(search_term):
+    statement, sort_keys, count = show_search_statements(search_term)
+    page = paginate(statement, sort_keys)
+    return db.session.execute(count).scalar(), page
+
+
+def artist_listing(stream=False):
+    return (stream_paginate if stream else paginate)(filter_genres(select(Artist.id, Artist.name), Artist),
+                                                     name_sort_keys(Artist))
+
+
+def show_period(upcoming):
+    # The past/upcoming split happens in SQL on the (entity_id, start_time) index
+    now = get_datetime_now()
+    return Show.start_time >= now if upcoming else Show.start_time < now
+
+
+SHOW_DETAIL_COLUMNS = (Show.start_time, Show.show_title.label('title'), Show.register_link, Show.description)
+
+
+def venue_shows_statement(venue_id, upcoming):
+    # Shows are joined to only the artist columns the venue page renders
+    return select(Show.artist_id, Artist.name.label('artist_name'),
+                       Artist.image_link.label('artist_image_link'), *SHOW_DETAIL_COLUMNS) \
+        .join(Artist, Show.artist_id == Artist.id) \
+        .where(Show.venue_id == venue_id, show_period(upcoming)) \
+        .order_by(Show.start_time)
+
+
+def venue_shows(venue_id, upcoming):
+    return [dict(row) for row in db.session.execute(venue_shows_statement(venue_id, upcoming)).mappings()]
+
+
+def artist_shows_statement(artist_id, upcoming):
+    # Shows are joined to only the venue columns the artist page renders
+    return select(Show.venue_id, Venue.name.label('venue_name'),
+                       Venue.image_link.label('venue_image_link'), *SHOW_DETAIL_COLUMNS) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .where(Show.artist_id == artist_id, show_period(upcoming)) \
+        .order_by(Show.start_time)
+
+
+def artist_shows(artist_id, upcoming):
+    return [dict(row) for row in db.session.execute(artist_shows_statement(artist_id, upcoming)).mappings()]
+
+
+def venue_page(venue_id):
+    # The venue and its past and upcoming shows load in three queries
+    venue_details = db.session.get(Venue, venue_id)
+    if venue_details is None:
+        return None
+    return venue_data(venue_details, venue_shows(venue_id, upcoming=True), venue_shows(venue_id, upcoming=False))
+
+
+def venue_data(venue_details, upcoming_shows_list, past_shows_list):
+    data = {
+        "id": venue_details.id,
+        "name": venue_details.name,
+        "genres": venue_details.genres,
+        "address": venue_details.address,
+        "city": venue_details.city,
+        "state": venue_details.state,
+        "phone": venue_details.phone,
+        "facebook_link": venue_details.facebook_link,
+        "seeking_talent": venue_details.seeking_talent,
+        "seeking_description": venue_details.seeking_description,
+        "image_link": venue_details.image_link,
+        "past_shows": past_shows_list,
+        "upcoming_shows": upcoming_shows_list,
+        "past_shows_count": len(past_shows_list),
+        "upcoming_shows_count": len(upcoming_shows_list),
+    }
+    return data
+
+
+def artist_page(artist_id):
+    # The artist and its past and upcoming shows load in three queries
+    artist_details = db.session.get(Artist, artist_id)
+    if artist_details is None:
+        return None
+    return artist_data(artist_details, artist_shows(artist_id, upcoming=True),
+                       artist_shows(artist_id, upcoming=False))
+
+
+def artist_data(artist_details, upcoming_shows_list, past_shows_list):
+    data = {
+        "id": artist_details.id,
+        "name": artist_details.name,
+        "genres": artist_details.genres,
+        "address": artist_details.address,
+        "city": artist_details.city,
+        "state": artist_details.state,
+        "phone": artist_details.phone,
+        'website': artist_details.website,
+        "facebook_link": artist_details.facebook_link,
+        "seeking_talent": artist_details.seeking_talent,
+        "seeking_description": artist_details.seeking_description,
+        "image_link": artist_details.image_link,
+        "past_shows": past_shows_list,
+        "upcoming_shows": upcoming_shows_list,
+        "past_shows_count": len(past_shows_list),
+        "upcoming_shows_count": len(upcoming_shows_list),
+    }
+    return data
+
+
+VENUE_AREA_SORT_KEYS = [(Venue.city, 'city', False), (Venue.state, 'state', False),
+                        (Venue.name, 'name', False), (Venue.id, 'id', False)]
+
+
+def venue_listing_statement():
+    # Venues with their stored upcoming show counts, ordered so that rows of
+    # the same city and state are adjacent.
+    return filter_genres(select(Venue.city, Venue.state, Venue.id, Venue.name,
+                                Venue.upcoming_shows_count.label('num_upcoming_shows')), Venue)
+
+
+def venue_listing():
+    return paginate(venue_listing_statement(), VENUE_AREA_SORT_KEYS)
+
+
+def venue_areas():
+    page = venue_listing()
+    return group_areas(page['items']), page
+
+
+def group_areas(rows):
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row['city'], row['state'])):
+        areas.append({
+            "city": city,
+            "state": state,
+            "venues": [{
+                "id": venue['id'],
+                "name": venue['name'],
+                "num_upcoming_shows": venue['num_upcoming_shows'],
+            } for venue in venues]
+        })
+    return areas
@@ -0,0 +1,284 @@
+import heapq
+import math
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+
+from forms import GENRES
+from models import Artist, Venue, Show, db
+
+try:
+    import numpy
+except ImportError:  # scored in pure Python, fine for development databases
+    numpy = None
+
+
+# ----------------------------------------------------------------------------#
+# Matchmaking features.
+# ----------------------------------------------------------------------------#
+# Venues are recommended to artists and artists to venues by
+#   genre cosine similarity + same city + same state + seeking talent
+#   + experience (log of shows booked) + shows already played together,
+# weighted by RECOMMEND_WEIGHTS. Every feature except the last lives in one
+# row per venue/artist; with NumPy the genre indicators form an
+# (entities x genres) matrix, so scoring is a matrix-vector product.
+
+GENRE_INDEX = {genre: index for index, genre in enumerate(GENRES)}
+
+MODELS = {'venues': Venue, 'artists': Artist}
+
+COLUMNS = (Venue.id, Venue.city, Venue.state, Venue.genres, Venue.seeking_talent,
+           Venue.upcoming_shows_count, Venue.past_shows_count)
+
+
+def genre_vector(genres):
+    # Unit length, so the dot product of two vectors is their cosine similarity
+    indexes = sorted({GENRE_INDEX[genre] for genre in genres or () if genre in GENRE_INDEX})
+    weight = 1.0 / math.sqrt(len(indexes)) if indexes else 0.0
+    return indexes, weight
+
+
+class Features(object):
+    """Feature rows for every venue or every artist. Rows are written in place
+    and deleted rows are masked, so edits never rebuild the matrix."""
+
+    def __init__(self, model, locations):
+        self.model = model
+        self.locations = locations
+        self.rows = {}
+        self.ids = []
+        if numpy is None:
+            self.genres, self.city, self.state, self.seeking, self.experience, self.active = [], [], [], [], [], []
+        else:
+            self.allocate(1024)
+
+    def allocate(self, capacity):
+        old = (self.genres, self.city, self.state, self.seeking, self.experience, self.active) \
+            if hasattr(self, 'active') else None
+        self.genres = numpy.zeros((capacity, len(GENRES)), dtype=numpy.float32)
+        self.city = numpy.zeros(capacity, dtype=numpy.int32)
+        self.state = numpy.zeros(capacity, dtype=numpy.int32)
+        self.seeking = numpy.zeros(capacity, dtype=numpy.float32)
+        self.experience = numpy.zeros(capacity, dtype=numpy.float32)
+        self.active = numpy.zeros(capacity, dtype=bool)
+        if old is not None:
+            for column, values in zip((self.genres, self.city, self.state, self.seeking, self.experience,
+                                       self.active), old):
+                column[:len(values)] = values
+
+    def location(self, city, state):
+        key = ((city or '').strip().lower(), (state or '').strip().lower())
+        return self.locations.setdefault(key, len(self.locations) + 1), \
+            self.locations.setdefault(('', key[1]), len(self.locations) + 1)
+
+    def put(self, entity_id, city, state, genres, seeking_talent, upcoming_shows_count, past_shows_count):
+        row = self.rows.get(entity_id)
+        if row is None:
+            row = self.rows[entity_id] = len(self.ids)
+            self.ids.append(entity_id)
+            if numpy is None:
+                for column in (self.genres, self.city, self.state, self.seeking, self.experience, self.active):
+                    column.append(None)
+            elif row >= len(self.active):
+                self.allocate(2 * len(self.active))
+        indexes, weight = genre_vector(genres)
+        city_code, state_code = self.location(city, state)
+        experience = math.log1p((upcoming_shows_count or 0) + (past_shows_count or 0))
+        if numpy is None:
+            self.genres[row] = dict.fromkeys(indexes, weight)
+        else:
+            self.genres[row] = 0.0
+            self.genres[row, indexes] = weight
+        self.city[row], self.state[row] = city_code, state_code
+        self.seeking[row] = 1.0 if seeking_talent else 0.0
+        self.experience[row] = experience
+        self.active[row] = True
+
+    def remove(self, entity_id):
+        row = self.rows.get(entity_id)
+        if row is not None:
+            self.active[row] = False
+
+    def load(self, ids=None):
+        columns = [getattr(self.model, column.key) for column in COLUMNS]
+        statement = select(*columns)
+        if ids is not None:
+            statement = statement.where(self.model.id.in_(ids))
+        found = set()
+        # Loaded under the recommender's lock, which flushing would take again in touch()
+        with db.session.no_autoflush:
+            for row in db.session.execute(statement.execution_options(yield_per=5000)):
+                self.put(*row)
+                found.add(row[0])
+        for entity_id in set(ids or ()) - found:
+            self.remove(entity_id)
+
+    def query_vector(self, entity_id):
+        row = self.rows.get(entity_id)
+        if row is None or not self.active[row]:
+            return None
+        return {"genres": self.genres[row], "city": self.city[row], "state": self.state[row]}
+
+
+# ----------------------------------------------------------------------------#
+# Scoring.
+# ----------------------------------------------------------------------------#
+
+def top_numpy(candidates, query, weights, played, limit):
+    size = len(candidates.ids)
+    scores = weights['genre'] * (candidates.genres[:size] @ query["genres"])
+    scores += weights['city'] * (candidates.city[:size] == query["city"])
+    scores += weights['state'] * (candidates.state[:size] == query["state"])
+    scores += weights['seeking'] * candidates.seeking[:size]
+    experience = candidates.experience[:size]
+    if size and experience.max() > 0:
+        scores += weights['experience'] * experience / experience.max()
+    for row, count in played.items():
+        scores[row] += weights['history'] * min(1.0, math.log1p(count) / math.log1p(10))
+    scores[~candidates.active[:size]] = -numpy.inf
+    limit = min(limit, size)
+    if limit == 0:
+        return []
+    # Partial selection is O(n); only the top `limit` rows are sorted
+    best = numpy.argpartition(-scores, limit - 1)[:limit]
+    best = best[numpy.lexsort((best, -scores[best]))]
+    return [(candidates.ids[row], float(scores[row])) for row in best if numpy.isfinite(scores[row])]
+
+
+def top_python(candidates, query, weights, played, limit):
+    most = max([value for value, active in zip(candidates.experience, candidates.active) if active] or [0]) or 1.0
+    genres = query["genres"]
+
+    def score(row):
+        genre = sum(weight * genres.get(index, 0.0) for index, weight in candidates.genres[row].items())
+        return weights['genre'] * genre \
+            + weights['city'] * (candidates.city[row] == query["city"]) \
+            + weights['state'] * (candidates.state[row] == query["state"]) \
+            + weights['seeking'] * candidates.seeking[row] \
+            + weights['experience'] * candidates.experience[row] / most \
+            + weights['history'] * min(1.0, math.log1p(played.get(row, 0)) / math.log1p(10))
+
+    rows = [row for row, active in enumerate(candidates.active) if active]
+    return [(candidates.ids[row], value) for value, row in
+            heapq.nlargest(limit, ((score(row), row) for row in rows), key=lambda item: (item[0], -item[1]))]
+
+
+class Recommender(object):
+    """Venue and artist features kept in process memory. Rows are reloaded
+    on the next query after their venue or artist (or one of its shows) was
+    written, and everything is reloaded every RECOMMEND_MAX_AGE seconds to
+    pick up writes made by other processes."""
+
+    def __init__(self, weights, max_age):
+        self.weights = weights
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.features = None
+        self.loaded_at = 0.0
+        self.dirty = {'venues': set(), 'artists': set()}
+
+    def touch(self, kind, ids):
+        with self.lock:
+            self.dirty[kind].update(int(entity_id) for entity_id in ids if entity_id is not None)
+
+    def refresh(self, venue_ids=None, artist_ids=None):
+        if venue_ids is None and artist_ids is None:
+            with self.lock:
+                self.features = None
+            return
+        self.touch('venues', venue_ids or ())
+        self.touch('artists', artist_ids or ())
+
+    def sync(self):
+        # Called with the lock held
+        if self.features is None or time.monotonic() - self.loaded_at > self.max_age:
+            locations = {}
+            self.features = {kind: Features(model, locations) for kind, model in MODELS.items()}
+            for features in self.features.values():
+                features.load()
+            self.loaded_at = time.monotonic()
+            self.dirty = {kind: set() for kind in MODELS}
+        for kind, ids in self.dirty.items():
+            if ids:
+                self.features[kind].load(sorted(ids))
+                ids.clear()
+        return self.features
+
+    def recommend(self, kind, entity_id, limit):
+        """Up to `limit` (id, score) pairs of the other kind for the venue or
+        artist `entity_id`, best first, or None if it does not exist."""
+        other = 'artists' if kind == 'venues' else 'venues'
+        own, theirs = (Show.venue_id, Show.artist_id) if kind == 'venues' else (Show.artist_id, Show.venue_id)
+        played = db.session.execute(select(theirs, func.count(Show.id)).where(own == entity_id)
+                                    .group_by(theirs)).all()
+        # Scored under the lock: another request's sync() writes the same
+        # arrays in place, and may grow them
+        with self.lock:
+            features = self.sync()
+            query = features[kind].query_vector(entity_id)
+            if query is None:
+                return None
+            rows = features[other].rows
+            played = {rows[other_id]: count for other_id, count in played if other_id in rows}
+            top = top_python if numpy is None else top_numpy
+            return top(features[other], query, self.weights, played, limit)
+
+
+# ----------------------------------------------------------------------------#
+# Writes.
+# ----------------------------------------------------------------------------#
+# Registered once for the process; the features of the app handling the write
+# (if it has loaded them yet) reload the rows on their next query.
+
+def touch(kind, ids):
+    engine = current_app.extensions.get('recommender') if has_app_context() else None
+    if engine is not None:
+        engine.touch(kind, ids)
+
+
+def touch_entity(mapper, connection, target):
+    touch('venues' if mapper.class_ is Venue else 'artists', [target.id])
+
+
+def touch_show(mapper, connection, show):
+    # Show counts feed the experience feature, of the venue and artist a
+    # show was moved away from as well
+    state = inspect(show)
+    touch('venues', [show.venue_id] + list(state.attrs.venue_id.history.deleted))
+    touch('artists', [show.artist_id] + list(state.attrs.artist_id.history.deleted))
+
+
+for name in ('after_insert', 'after_update', 'after_delete'):
+    for model in MODELS.values():
+        event.listen(model, name, touch_entity)
+    event.listen(Show, name, touch_show)
+
+
+def recommender():
+    engine = current_app.extensions.get('recommender')
+    if engine is None:
+        engine = Recommender(current_app.config['RECOMMEND_WEIGHTS'], current_app.config['RECOMMEND_MAX_AGE'])
+        current_app.extensions['recommender'] = engine
+    return engine
+
+
+def refresh(venue_ids=None, artist_ids=None):
+    # Bulk writes skip the mapper events the features listen to
+    engine = current_app.extensions.get('recommender')
+    if engine is not None:
+        engine.refresh(venue_ids, artist_ids)
+
+
+def recommendations(kind, entity_id, limit=10):
+    """The best matches for a venue ('venues') or artist ('artists') as
+    dicts for display, or None if it does not exist."""
+    scored = recommender().recommend(kind, entity_id, limit)
+    if scored is None:
+        return None
+    model = MODELS['artists' if kind == 'venues' else 'venues']
+    rows = {row.id: row for row in db.session.execute(
+        select(model.id, model.name, model.city, model.state, model.genres, model.image_link, model.seeking_talent)
+        .where(model.id.in_([entity_id for entity_id, _ in scored])))}
+    return [dict(rows[match_id]._mapping, score=round(score, 4)) for match_id, score in scored if match_id in rows]
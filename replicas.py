@@ -0,0 +1,121 @@
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+# ----------------------------------------------------------------------------#
+# Replica selection.
+# ----------------------------------------------------------------------------#
+
+class ReplicaSet(object):
+    """Round-robin over the replica engines. A replica that fails its health
+    check (or drops a connection) is skipped until it passes again."""
+
+    def __init__(self, engines, check_interval=30, retry_interval=5, max_lag=0):
+        self.engines = engines
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.max_lag = max_lag
+        self.health = {key: {"healthy": True, "checked": 0.0} for key, _ in engines}
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def check(self, key, engine):
+        try:
+            with engine.connect() as connection:
+                if engine.dialect.name == 'postgresql' and self.max_lag:
+                    # NULL outside recovery; an idle primary also makes this grow
+                    lag = connection.execute(text(
+                        'SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())')).scalar()
+                    healthy = lag is None or lag <= self.max_lag
+                else:
+                    connection.execute(text('SELECT 1'))
+                    healthy = True
+        except SQLAlchemyError:
+            healthy = False
+        self.health[key] = {"healthy": healthy, "checked": time.monotonic()}
+        return healthy
+
+    def mark_down(self, key):
+        self.health[key] = {"healthy": False, "checked": time.monotonic()}
+
+    def choose(self):
+        # The next healthy replica, or None to fall back to the primary
+        for _ in range(len(self.engines)):
+            with self.lock:
+                key, engine = self.engines[self.next]
+                self.next = (self.next + 1) % len(self.engines)
+            health = self.health[key]
+            interval = self.check_interval if health["healthy"] else self.retry_interval
+            if time.monotonic() - health["checked"] >= interval:
+                if self.check(key, engine):
+                    return engine
+            elif health["healthy"]:
+                return engine
+        return None
+
+
+def read_replica():
+    # Chosen once per request so a page reads from a single replica
+    if not has_request_context() or 'replicas' not in current_app.extensions:
+        return None
+    if '_read_bind' not in g:
+        g._read_bind = None
+        if request.method in SAFE_METHODS and session.get('_primary_until', 0) <= time.time():
+            g._read_bind = current_app.extensions['replicas'].choose()
+    return g._read_bind
+
+
+class RoutingSession(Session):
+    """Reads during safe requests go to a replica; flushes, DML and every
+    query outside a request (CLI, jobs) go to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False):
+            replica = read_replica()
+            if replica is not None:
+                return replica
+        return super(RoutingSession, self).get_bind(mapper, clause, bind, **kwargs)
+
+
+# ----------------------------------------------------------------------------#
+# Setup.
+# ----------------------------------------------------------------------------#
+
+def stick_to_primary(response):
+    # Read-your-own-writes: after a write this client reads from the primary
+    # until the replicas have had time to catch up
+    if request.method not in SAFE_METHODS and response.status_code < 500:
+        session['_primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+    return response
+
+
+def replica_metrics():
+    replicas = current_app.extensions['replicas']
+    return [('fyyur_db_replica_healthy', 'gauge', 'Whether the replica passed its last health check.',
+             [((('bind', key),), int(health["healthy"])) for key, health in sorted(replicas.health.items())])]
+
+
+def replica_setup(app, db):
+    with app.app_context():
+        engines = [(key, engine) for key, engine in sorted(db.engines.items(), key=lambda item: str(item[0]))
+                   if key and key.startswith('replica_')]
+    if not engines:
+        return None
+    replicas = ReplicaSet(engines, app.config['REPLICA_CHECK_INTERVAL'], app.config['REPLICA_RETRY_INTERVAL'],
+                          app.config['REPLICA_MAX_LAG'])
+    for key, engine in engines:
+        def handle_error(context, key=key):
+            if context.is_disconnect:
+                replicas.mark_down(key)
+        event.listen(engine, 'handle_error', handle_error)
+    app.extensions['replicas'] = replicas
+    app.after_request(stick_to_primary)
+    app.extensions.get('metrics_collectors', []).append(replica_metrics)
+    return replicas
@@ -0,0 +1,209 @@
+import re
+import threading
+from collections import defaultdict
+
+from flask import current_app, has_app_context
+from sqlalchemy import Float, case, event, false, func, literal_column, or_, select, true, type_coerce
+
+from models import Artist, Venue, Show, db
+
+
+# ----------------------------------------------------------------------------#
+# Search terms.
+# ----------------------------------------------------------------------------#
+
+def parse_term(search_term, location=True):
+    # "city, state" searches by location, anything else by name
+    if location and ',' in search_term:
+        city_search_term, state_search_term = search_term.split(',', 1)
+        return None, city_search_term.strip(), state_search_term.strip()
+    return search_term.strip(), None, None
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def trigrams(text):
+    # Same padding rules as pg_trgm: each word is padded with two leading
+    # spaces and one trailing space before being cut into trigrams.
+    grams = set()
+    for word in tokenize(text):
+        padded = '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(left, right):
+    if not left or not right:
+        return 0.0
+    shared = len(left & right)
+    return shared / float(len(left) + len(right) - shared)
+
+
+# The text columns each searchable model is matched on: (name, city, state).
+# Shows have no location so only their title is searched.
+SEARCH_COLUMNS = {
+    Venue: (Venue.name, Venue.city, Venue.state),
+    Artist: (Artist.name, Artist.city, Artist.state),
+    Show: (Show.show_title, None, None),
+}
+
+
+# ----------------------------------------------------------------------------#
+# PostgreSQL full-text and trigram backend.
+# ----------------------------------------------------------------------------#
+
+class PostgresSearch(object):
+    """Matches against the generated `search_vector` tsvector columns and the
+    pg_trgm GIN indexes created by the search migration."""
+
+    def match(self, model, search_term):
+        name_column, city_column, state_column = SEARCH_COLUMNS[model]
+        name_term, city_term, state_term = parse_term(search_term, city_column is not None)
+        if name_term is None:
+            criterion = (city_column.ilike('%' + city_term + '%') | city_column.op('%')(city_term)) \
+                & state_column.ilike('%' + state_term + '%')
+            return criterion, type_coerce(func.similarity(city_column, city_term), Float)
+        if not name_term:
+            return true(), type_coerce(0.0, Float)
+
+        vector = literal_column('"%s".search_vector' % model.__tablename__)
+        query = func.websearch_to_tsquery('simple', name_term)
+        criterion = or_(vector.op('@@')(query),
+                        name_column.op('%')(name_term),
+                        name_column.ilike('%' + name_term + '%'))
+        rank = func.ts_rank_cd(vector, query) + func.similarity(name_column, name_term)
+        return criterion, type_coerce(rank, Float)
+
+    def refresh(self, model):
+        # search_vector is a generated column, PostgreSQL keeps it current
+        pass
+
+
+# ----------------------------------------------------------------------------#
+# In-memory fallback backend.
+# ----------------------------------------------------------------------------#
+
+class MemorySearch(object):
+    """Token and trigram index kept in process memory, for databases without
+    full-text search such as the SQLite databases used in development.
+
+    Each model's index is rebuilt on the first search after one of its rows
+    was inserted, updated or deleted."""
+
+    def __init__(self, threshold=0.3):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.indexes = {}
+        self.dirty = set(SEARCH_COLUMNS)
+
+    def refresh(self, model):
+        self.dirty.add(model)
+
+    def index(self, model):
+        with self.lock:
+            if model in self.dirty or model not in self.indexes:
+                self.dirty.discard(model)
+                self.indexes[model] = self.build(model)
+            return self.indexes[model]
+
+    def build(self, model):
+        columns = [column for column in SEARCH_COLUMNS[model] if column is not None]
+        entries = {}
+        tokens = defaultdict(set)
+        grams = defaultdict(set)
+        for row in db.session.execute(select(model.id, *columns)):
+            name = row[1]
+            location = tuple((value or '').lower() for value in row[2:])
+            entries[row.id] = (set(tokenize(name)), trigrams(name), (name or '').lower(), location)
+            for token in entries[row.id][0]:
+                tokens[token].add(row.id)
+            for gram in entries[row.id][1]:
+                grams[gram].add(row.id)
+        return entries, tokens, grams
+
+    def scores(self, model, search_term):
+        # None when every row matches, as an empty term does
+        name_term, city_term, state_term = parse_term(search_term, SEARCH_COLUMNS[model][1] is not None)
+        if name_term is not None and not name_term:
+            return None
+        entries, tokens, grams = self.index(model)
+        scores = {}
+        if name_term is None:
+            city_grams = trigrams(city_term)
+            for entity_id, (_, _, _, (city, state)) in entries.items():
+                city_score = similarity(city_grams, trigrams(city))
+                if (city_term.lower() in city or city_score >= self.threshold) and state_term.lower() in state:
+                    scores[entity_id] = city_score
+            return scores
+
+        term_tokens = set(tokenize(name_term))
+        term_grams = trigrams(name_term)
+        if any(len(token) >= 3 for token in term_tokens):
+            # A name containing the term shares the trigrams inside its longer words
+            candidates = set()
+            for token in term_tokens:
+                candidates |= tokens.get(token, set())
+            for gram in term_grams:
+                candidates |= grams.get(gram, set())
+        else:
+            # Too short for that ("rt" in "Artist"): scan every name, as the
+            # ILIKE on PostgreSQL does
+            candidates = entries.keys()
+        lowered = name_term.lower()
+        for entity_id in candidates:
+            entity_tokens, entity_grams, name, _ = entries[entity_id]
+            token_score = len(term_tokens & entity_tokens) / float(len(term_tokens) or 1)
+            trigram_score = similarity(term_grams, entity_grams)
+            if token_score or trigram_score >= self.threshold or lowered in name:
+                scores[entity_id] = token_score + trigram_score
+        return scores
+
+    def match(self, model, search_term):
+        scores = self.scores(model, search_term)
+        if scores is None:
+            return true(), type_coerce(0.0, Float)
+        if not scores:
+            return false(), type_coerce(0.0, Float)
+        rank = case(scores, value=model.id, else_=0.0)
+        return model.id.in_(scores), type_coerce(rank, Float)
+
+
+# ----------------------------------------------------------------------------#
+# Writes.
+# ----------------------------------------------------------------------------#
+# Registered once for the process, for the backend of the app handling the
+# write (if it has one yet).
+
+def invalidate(mapper, connection, target):
+    backend = current_app.extensions.get('search') if has_app_context() else None
+    if backend is not None:
+        backend.refresh(mapper.class_)
+
+
+for model in SEARCH_COLUMNS:
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, invalidate)
+
+
+def search_backend():
+    backend = current_app.extensions.get('search')
+    if backend is None:
+        name = current_app.config.get('SEARCH_BACKEND') or db.engine.dialect.name
+        if name == 'postgresql':
+            backend = PostgresSearch()
+        else:
+            backend = MemorySearch(current_app.config['SEARCH_SIMILARITY_THRESHOLD'])
+        current_app.extensions['search'] = backend
+    return backend
+
+
+def reindex(model):
+    # Bulk writes skip the mapper events the in-memory index listens to
+    search_backend().refresh(model)
+
+
+def match(model, search_term):
+    """Return a (criterion, rank) pair for `search_term` against `model`."""
+    return search_backend().match(model, search_term)
@@ -2,3 +2,54 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Typeahead for inputs with data-autocomplete="artists|venues|cities": the
+// suggestions fill the input's <datalist>, and picking one sets the hidden
+// input named by data-target to its id.
+window.autocomplete = function autocomplete(input) {
+  var list = document.getElementById(input.getAttribute('list'));
+  var target = input.form.elements[input.getAttribute('data-target')];
+  // No prototype, so typing "constructor" or "__proto__" is just another query
+  var results = Object.create(null);
+  var timer = null;
+
+  function show(items) {
+    list.innerHTML = '';
+    items.forEach(function (item) {
+      var option = document.createElement('option');
+      option.value = item.name || item.city;
+      option.label = item.city ? item.city + ', ' + item.state : '';
+      option.setAttribute('data-id', item.id);
+      list.appendChild(option);
+    });
+    pick();
+  }
+
+  function pick() {
+    if (!target) return;
+    var chosen = Array.prototype.find.call(list.options, function (option) {
+      return option.value === input.value;
+    });
+    target.value = chosen ? chosen.getAttribute('data-id') : '';
+  }
+
+  input.addEventListener('input', function () {
+    var query = input.value.trim();
+    pick();
+    clearTimeout(timer);
+    if (!query) return;
+    if (results[query]) return show(results[query]);
+    timer = setTimeout(function () {
+      fetch('/autocomplete?type=' + input.getAttribute('data-autocomplete') + '&q=' + encodeURIComponent(query))
+        .then(function (response) { return response.json(); })
+        .then(function (body) {
+          results[query] = body.data;
+          if (input.value.trim() === query) show(body.data);
+        });
+    }, 150);
+  });
+};
+
+document.addEventListener('DOMContentLoaded', function () {
+  Array.prototype.forEach.call(document.querySelectorAll('[data-autocomplete]'), window.autocomplete);
+});
@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+# The app is configured from the environment when config.py is imported
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['JOBS_IN_PROCESS_WORKERS'] = '0'
+os.environ['METRICS_ENABLED'] = '1'
+os.environ.setdefault('IMAGES_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fyyur-test-images'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        # Only the primary: test_replicas registers a replica bind on db
+        db.create_all(bind_key=None)
+        # Per-process state built from the previous test's rows
+        for name in ('search', 'schedule', 'recommender', 'autocomplete'):
+            flask_app.extensions.pop(name, None)
+        flask_app.extensions['cache'].entries.clear()
+        yield flask_app
+        db.session.remove()
+        db.drop_all(bind_key=None)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(app):
+    """The SQL statements run while the fixture is active, in order."""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = datetime.now().astimezone()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, delta):
+        self.now += delta
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Stands in for helpers.get_datetime_now wherever it was imported."""
+    fake = Clock()
+    for module in ('helpers', 'queries', 'jobs', 'http_cache', 'counters'):
+        monkeypatch.setattr('%s.get_datetime_now' % module, fake)
+    return fake
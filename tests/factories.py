@@ -0,0 +1,58 @@
+import re
+from datetime import datetime, timedelta
+
+from models import Artist, Venue, Show, db
+
+
+def add_venue(index, city='Austin', state='TX'):
+    venue = Venue(name='Venue %d' % index, city=city, state=state, phone='123-123-1234', genres=['Jazz'],
+                  image_link='https://example.com/venue-%d.png' % index)
+    db.session.add(venue)
+    return venue
+
+
+def add_artist(index, city='Austin', state='TX'):
+    artist = Artist(name='Artist %d' % index, city=city, state=state, phone='123-123-1234',
+                    genres=['Jazz', 'Rock n Roll'], image_link='https://example.com/artist-%d.png' % index)
+    db.session.add(artist)
+    return artist
+
+
+def add_show(venue, artist, days, title='Show'):
+    show = Show(show_title=title, venue_id=venue.id, artist_id=artist.id,
+                start_time=datetime.now() + timedelta(days=days))
+    db.session.add(show)
+    return show
+
+
+CITIES = [('Austin', 'TX'), ('Boston', 'MA'), ('Chicago', 'IL'), ('Denver', 'CO')]
+
+
+def seed_venues(venues, shows_per_venue):
+    """`venues` venues across CITIES with `shows_per_venue` past and upcoming
+    shows each, all by one artist. Returns (venue ids, artist id)."""
+    artist = add_artist(0)
+    rows = [add_venue(index, *CITIES[index % len(CITIES)]) for index in range(venues)]
+    db.session.flush()
+    for venue in rows:
+        for day in range(shows_per_venue):
+            add_show(venue, artist, day * 3 - shows_per_venue)
+    db.session.commit()
+    ids = [venue.id for venue in rows], artist.id
+    # Views must load from the database, not the session's identity map
+    db.session.expunge_all()
+    return ids
+
+
+def query_count(client, statements, path):
+    statements.clear()
+    response = client.get(path)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def csrf_token(client, path):
+    # Forms are posted as a browser would, with the token from their page
+    match = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', client.get(path).get_data(as_text=True))
+    assert match is not None
+    return match.group(1)
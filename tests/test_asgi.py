@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+asgi = pytest.importorskip('asgi')
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    statements = []
+
+    async def fetch_rows(statement):
+        statements.append(statement)
+        return []
+
+    monkeypatch.setattr(asgi, 'fetch_rows', fetch_rows)
+    return statements
+
+
+@pytest.mark.parametrize('path, view, maximum', [
+    ('/shows?limit=10000', asgi.shows, 'MAX_STREAM_PAGE_SIZE'),
+    ('/venues?limit=10000', asgi.venues, 'MAX_PAGE_SIZE'),
+])
+def test_page_size_clamped_like_the_wsgi_view(app, fetched, path, view, maximum):
+    with app.test_request_context(path):
+        asyncio.run(view())
+    # One extra row tells whether there is a next page
+    assert fetched[0]._limit == app.config[maximum] + 1
@@ -0,0 +1,64 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from assets import BUNDLES, build, rebase_urls
+
+
+@pytest.fixture
+def built(app, tmp_path, monkeypatch):
+    """The bundles built from a copy of their source files, as after
+    `flask assets build`."""
+    static = tmp_path / 'static'
+    for path in {path for paths in BUNDLES.values() for path in paths}:
+        os.makedirs(static / os.path.dirname(path), exist_ok=True)
+        shutil.copy(os.path.join(app.static_folder, path), static / path)
+    monkeypatch.setattr(app, 'static_folder', str(static))
+    manifest = build(str(static), app.config['ASSETS_DIRECTORY'], app.config['ASSETS_COMPRESS_MIN_SIZE'])
+    monkeypatch.setitem(app.extensions, 'assets', manifest)
+    return manifest
+
+
+def test_pages_link_the_source_files_until_built(app, client, monkeypatch):
+    monkeypatch.setitem(app.extensions, 'assets', {})
+    body = client.get('/').get_data(as_text=True)
+    for paths in BUNDLES.values():
+        for path in paths:
+            assert '/static/%s' % path in body
+
+
+def test_pages_link_the_fingerprinted_bundles(app, client, built):
+    body = client.get('/').get_data(as_text=True)
+    for name, filename in built.items():
+        stem, extension = os.path.splitext(name)
+        assert filename.startswith('dist/%s.' % stem) and filename.endswith(extension)
+        assert '/static/%s' % filename in body
+    assert '/static/css/main.css' not in body
+
+
+def test_disabled_bundles_link_the_source_files(app, client, built, monkeypatch):
+    monkeypatch.setitem(app.config, 'ASSETS_ENABLED', False)
+    body = client.get('/').get_data(as_text=True)
+    assert '/static/css/main.css' in body
+    assert not any('/static/%s' % filename in body for filename in built.values())
+
+
+def test_bundles_are_served_immutable_and_precompressed(app, client, built):
+    url = '/static/%s' % built['main.css']
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert plain.status_code == 200 and 'Content-Encoding' not in plain.headers
+    assert 'immutable' in plain.headers['Cache-Control']
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    zipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.data) == plain.data
+
+
+def test_css_urls_point_from_the_bundle_folder():
+    source = 'a{background:url("../img/a.png")} b{background:url(/img/b.png)} c{background:url(data:x)}'
+    assert rebase_urls(source, 'css/main.css', 'dist') == \
+        'a{background:url("../img/a.png")} b{background:url(/img/b.png)} c{background:url(data:x)}'
+    assert rebase_urls('a{background:url(fonts/a.woff)}', 'css/main.css', 'dist') == \
+        'a{background:url(../css/fonts/a.woff)}'
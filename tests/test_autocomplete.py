@@ -0,0 +1,33 @@
+from autocomplete import Autocomplete, autocomplete, suggestions
+from models import Venue, db
+from tests.factories import add_artist, add_show, add_venue
+
+
+def test_suggests_rows_written_since_loading(app):
+    add_venue(1)
+    db.session.commit()
+    assert [item["name"] for item in suggestions('venues', 'ven')] == ['Venue 1']
+    add_venue(2, city='Boston', state='MA')
+    db.session.commit()
+    assert [item["name"] for item in suggestions('venues', 'ven')] == ['Venue 1', 'Venue 2']
+    assert [item["city"] for item in suggestions('cities', 'bos')] == ['Boston']
+
+
+def test_moved_show_touches_old_and_new_rows(app):
+    venues = [add_venue(index) for index in range(2)]
+    artists = [add_artist(index) for index in range(2)]
+    db.session.flush()
+    show = add_show(venues[0], artists[0], 3)
+    db.session.commit()
+    venue_ids, artist_ids = {venue.id for venue in venues}, {artist.id for artist in artists}
+    engine = autocomplete()
+    suggestions('venues', 'ven')
+    show.venue_id, show.artist_id = max(venue_ids), max(artist_ids)
+    db.session.commit()
+    assert engine.dirty == {'venues': venue_ids, 'artists': artist_ids}
+
+
+def test_engines_share_one_set_of_listeners(app):
+    listeners = len(Venue.__mapper__.dispatch.after_insert)
+    Autocomplete(60, 25, 100)
+    assert len(Venue.__mapper__.dispatch.after_insert) == listeners
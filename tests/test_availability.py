@@ -0,0 +1,97 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from availability import BookingConflict, IntervalTree, MemorySchedule, check_booking
+from bulk import import_rows
+from models import Show, db
+from tests.factories import add_artist, add_venue, csrf_token
+
+FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def brute_force(intervals, start, end):
+    return sorted(interval for interval in intervals if interval[0] < end and interval[1] > start)
+
+
+@pytest.mark.parametrize('size', [0, 1, 2, 7, 300])
+def test_interval_tree_matches_brute_force(size):
+    rng = random.Random(size)
+    intervals = []
+    for show_id in range(size):
+        start = rng.randint(0, 1000)
+        intervals.append((start, start + rng.randint(1, 50), show_id))
+    tree = IntervalTree(intervals)
+    for _ in range(500):
+        start = rng.randint(-20, 1050)
+        end = start + rng.randint(1, 80)
+        assert tree.overlapping(start, end) == brute_force(intervals, start, end)
+
+
+@pytest.fixture
+def booked(app):
+    # A venue booked from 20:00 to 22:00 a week from now
+    venue, artist = add_venue(1), add_artist(1)
+    db.session.flush()
+    start_time = (datetime.now() + timedelta(days=7)).replace(hour=20, minute=0, second=0, microsecond=0)
+    show = Show(show_title='Booked', venue_id=venue.id, artist_id=artist.id, start_time=start_time,
+                end_time=start_time + timedelta(hours=2))
+    db.session.add(show)
+    db.session.commit()
+    return venue.id, artist.id, show.id, start_time
+
+
+def test_check_booking_rejects_overlaps(booked):
+    venue_id, _, show_id, start_time = booked
+    with pytest.raises(BookingConflict):
+        check_booking(venue_id, start_time + timedelta(hours=1), start_time + timedelta(hours=3))
+    with pytest.raises(BookingConflict):
+        check_booking(venue_id, start_time - timedelta(hours=1), start_time + timedelta(hours=5))
+    # Back to back, or the show being edited itself, is fine
+    check_booking(venue_id, start_time + timedelta(hours=2), start_time + timedelta(hours=4))
+    check_booking(venue_id, start_time, start_time + timedelta(hours=2), show_id=show_id)
+
+
+def test_double_booked_show_is_not_listed(booked, client):
+    venue_id, artist_id, _, start_time = booked
+    form = {"title": 'Clash', "artist_id": str(artist_id), "venue_id": str(venue_id),
+            "start_time": (start_time + timedelta(hours=1)).strftime(FORMAT), "end_time": '',
+            "description": '', "register_link": '', "csrf_token": csrf_token(client, '/shows/create')}
+    body = client.post('/shows/create', data=form).get_data(as_text=True)
+    assert 'is already booked' in body
+    assert Show.query.count() == 1
+
+
+def test_import_rejects_overlapping_rows(booked):
+    venue_id, artist_id, _, start_time = booked
+
+    def row(hours):
+        return {"title": 'Imported', "venue_id": venue_id, "artist_id": artist_id,
+                "start_time": (start_time + timedelta(hours=hours)).strftime(FORMAT)}
+
+    # Clashes with the booked show, fits, clashes with the row before it
+    summary = import_rows('shows', enumerate([row(1), row(3), row(4)], 1))
+    assert summary["inserted"] == 1
+    assert [error["line"] for error in summary["errors"]] == [1, 3]
+    assert Show.query.count() == 2
+
+
+def test_availability_api(booked, client):
+    venue_id, _, show_id, start_time = booked
+    day = start_time.replace(hour=0)
+    response = client.get('/api/v1/availability', query_string={
+        "venue_ids": str(venue_id), "start": day.isoformat(), "end": (day + timedelta(days=1)).isoformat()})
+    assert response.status_code == 200
+    schedule, = response.get_json()["data"]
+    assert [busy["show_id"] for busy in schedule["busy"]] == [show_id]
+    assert [(free["start"][11:16], free["end"][11:16]) for free in schedule["free"]] == [('00:00', '20:00'),
+                                                                                      ('22:00', '00:00')]
+    assert client.get('/api/v1/availability?venue_ids=x').status_code == 400
+
+
+def test_schedules_share_one_set_of_listeners(app):
+    listeners = len(Show.__mapper__.dispatch.after_update)
+    for _ in range(5):
+        MemorySchedule()
+    assert len(Show.__mapper__.dispatch.after_update) == listeners
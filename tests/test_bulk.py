@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from bulk import import_rows
+from counters import check_counters
+from jobs import work
+from models import Job, Show, db
+from tests.factories import add_artist, add_venue
+
+
+def show_row(venue_id, artist_id, start_time, title='Imported show'):
+    return {"title": title, "venue_id": venue_id, "artist_id": artist_id,
+            "start_time": start_time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def seed():
+    venue, artist = add_venue(1), add_artist(1)
+    db.session.commit()
+    return venue.id, artist.id
+
+
+def test_imported_shows_roll_over(app, clock):
+    venue_id, artist_id = seed()
+    start_time = clock.now + timedelta(hours=1)
+    summary = import_rows('shows', enumerate([show_row(venue_id, artist_id, start_time)], 1))
+    assert summary["inserted"] == 1
+    assert [job.name for job in Job.query.all()] == ['counters.rollover']
+    clock.advance(timedelta(hours=2))
+    assert check_counters() != []
+    work(app, 'test', burst=True)
+    assert Job.query.one().status == 'done'
+    assert check_counters() == []
+
+
+def test_past_shows_queue_no_rollover(app, clock):
+    venue_id, artist_id = seed()
+    import_rows('shows', enumerate([show_row(venue_id, artist_id, clock.now - timedelta(days=1))], 1))
+    assert Show.query.count() == 1
+    assert Job.query.count() == 0
+    assert check_counters() == []
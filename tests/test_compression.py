@@ -0,0 +1,54 @@
+import gzip
+
+import pytest
+from werkzeug.http import parse_accept_header
+
+from compression import ENCODERS, negotiate
+from tests.factories import seed_venues
+
+PREFERRED = ['br', 'zstd', 'gzip']
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip', 'gzip'),
+    ('gzip, deflate', 'gzip'),
+    # The client's quality first, then the server's order
+    ('gzip;q=1.0, br;q=0.5', 'gzip'),
+    ('gzip, br', 'br' if 'br' in ENCODERS else 'gzip'),
+    ('*', 'br' if 'br' in ENCODERS else 'gzip'),
+    ('gzip;q=0', None),
+    ('identity', None),
+    ('', None),
+])
+def test_negotiate(header, expected):
+    assert negotiate(parse_accept_header(header), PREFERRED) == expected
+
+
+@pytest.fixture
+def seeded(app):
+    seed_venues(12, 2)
+
+
+def get(client, path, encoding, **headers):
+    return client.get(path, headers=dict(headers, **{'Accept-Encoding': encoding}))
+
+
+@pytest.mark.parametrize('path', ['/venues', '/shows'])
+def test_gzip_body_decompresses_to_the_plain_page(client, seeded, path):
+    plain = get(client, path, 'identity')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    zipped = get(client, path, 'gzip')
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    assert gzip.decompress(zipped.data) == plain.data
+
+
+def test_weak_etag_round_trip(client, seeded):
+    zipped = get(client, '/venues', 'gzip')
+    assert zipped.headers['ETag'].startswith('W/')
+    assert get(client, '/venues', 'gzip', **{'If-None-Match': zipped.headers['ETag']}).status_code == 304
+    # The plain page has the same ETag, strong
+    plain = get(client, '/venues', 'identity')
+    assert plain.headers['ETag'] == zipped.headers['ETag'][2:]
+    assert get(client, '/venues', 'identity', **{'If-None-Match': zipped.headers['ETag']}).status_code == 304
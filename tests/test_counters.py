@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from counters import check_counters
+from models import Show, db
+from tests.factories import add_artist, add_show, add_venue
+
+
+def seed():
+    venues = [add_venue(index) for index in range(2)]
+    artists = [add_artist(index) for index in range(2)]
+    db.session.flush()
+    return venues, artists
+
+
+def test_created_shows_are_counted(app):
+    venues, artists = seed()
+    add_show(venues[0], artists[0], 3)
+    add_show(venues[0], artists[1], -3)
+    db.session.commit()
+    assert check_counters() == []
+    assert (venues[0].upcoming_shows_count, venues[0].past_shows_count) == (1, 1)
+
+
+def test_moved_shows_are_recounted(app):
+    venues, artists = seed()
+    show = add_show(venues[0], artists[0], 3)
+    db.session.commit()
+    # Another venue and artist
+    show.venue_id, show.artist_id = venues[1].id, artists[1].id
+    db.session.commit()
+    assert check_counters() == []
+    # From upcoming to past, then moved back while past
+    show.start_time -= timedelta(days=6)
+    db.session.commit()
+    assert check_counters() == []
+    show.venue_id, show.artist_id = venues[0].id, artists[0].id
+    show.start_time += timedelta(days=6)
+    db.session.commit()
+    assert check_counters() == []
+
+
+def test_deleted_shows_are_uncounted(app):
+    venues, artists = seed()
+    shows = [add_show(venues[0], artists[0], days) for days in (-3, 3)]
+    db.session.commit()
+    for show in shows:
+        db.session.delete(show)
+        db.session.commit()
+        assert check_counters() == []
+    assert db.session.query(Show).count() == 0
@@ -0,0 +1,30 @@
+import pytest
+
+from tests.factories import query_count, seed_venues
+
+# The page itself, plus its past and upcoming shows in one query each
+DETAIL_QUERIES = 3
+
+
+@pytest.fixture
+def uncached(app):
+    app.config['HTTP_CACHE_ENABLED'] = False
+    yield app
+    app.config['HTTP_CACHE_ENABLED'] = True
+
+
+def detail_counts(client, statements, venue_id, artist_id):
+    return (query_count(client, statements, '/venues/%d' % venue_id),
+            query_count(client, statements, '/artists/%d' % artist_id))
+
+
+@pytest.mark.parametrize('shows_per_venue', [2, 20])
+def test_query_budget(uncached, client, statements, shows_per_venue):
+    venue_ids, artist_id = seed_venues(3, shows_per_venue)
+    assert detail_counts(client, statements, venue_ids[0], artist_id) == (DETAIL_QUERIES, DETAIL_QUERIES)
+
+
+def test_cached_page_runs_only_the_validator(app, client, statements):
+    venue_ids, artist_id = seed_venues(1, 2)
+    detail_counts(client, statements, venue_ids[0], artist_id)
+    assert detail_counts(client, statements, venue_ids[0], artist_id) == (1, 1)
@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from sqlalchemy import delete
+
+from models import Venue, db
+from tests.factories import add_artist, add_show, add_venue, seed_venues
+
+
+def etag(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def test_matching_etag_answers_304_from_the_validator_alone(app, client, statements):
+    seed_venues(2, 2)
+    tag = etag(client, '/venues')
+    statements.clear()
+    response = client.get('/venues', headers={'If-None-Match': tag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == tag
+    # Version lookups and the next show, no aggregate over the listed tables
+    assert len(statements) == 1
+    assert 'count(' not in statements[0].lower() and 'max(' not in statements[0].lower()
+
+
+def test_stale_etag_gets_the_page(app, client):
+    seed_venues(1, 1)
+    response = client.get('/venues', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    assert b'Venue 0' in response.data
+
+
+def test_no_last_modified(app, client):
+    seed_venues(1, 1)
+    response = client.get('/venues')
+    assert 'Last-Modified' not in response.headers
+    # If-Modified-Since alone cannot validate the page
+    assert client.get('/venues', headers={'If-Modified-Since': 'Sun, 18 Oct 2099 00:00:00 GMT'}).status_code == 200
+
+
+def test_etag_changes_after_an_insert(app, client):
+    seed_venues(1, 1)
+    before = etag(client, '/venues')
+    add_venue(1)
+    db.session.commit()
+    assert etag(client, '/venues') != before
+
+
+def test_etag_changes_after_a_bulk_delete(app, client):
+    venue = add_venue(0)
+    add_venue(1)
+    db.session.commit()
+    before = etag(client, '/venues')
+    # Leaves every remaining updated_at and no ORM event behind
+    db.session.execute(delete(Venue).where(Venue.id == venue.id))
+    db.session.commit()
+    assert etag(client, '/venues') != before
+
+
+def test_etag_changes_once_a_show_starts(app, client, clock):
+    venue, artist = add_venue(0), add_artist(0)
+    db.session.flush()
+    show = add_show(venue, artist, 1)
+    db.session.commit()
+    before = etag(client, '/shows')
+    assert etag(client, '/shows') == before
+    clock.advance(show.start_time.astimezone() - clock.now + timedelta(minutes=1))
+    assert etag(client, '/shows') != before
@@ -0,0 +1,121 @@
+import io
+import socket
+import uuid
+
+import pytest
+
+from images import CONNECTIONS, FetchError, http_fetcher, images, public_address, thumbnail_url
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def png(width=800, height=600):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(output, 'PNG')
+    return output.getvalue()
+
+
+@pytest.fixture
+def proxy(app, monkeypatch):
+    if images() is None:
+        pytest.skip('image proxy disabled')
+    fetched = []
+
+    def fetcher(url):
+        fetched.append(url)
+        return png()
+
+    monkeypatch.setattr(images(), 'fetcher', fetcher)
+    return fetched
+
+
+def signed(app, width=320):
+    # A source never fetched before, so nothing comes from the disk cache
+    src = 'https://example.com/%s.png' % uuid.uuid4().hex
+    with app.test_request_context():
+        return src, thumbnail_url(src, width)
+
+
+def test_signed_url_is_fetched_and_resized(app, client, proxy):
+    src, url = signed(app)
+    response = client.get(url)
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert Image.open(io.BytesIO(response.data)).size == (320, 240)
+    assert proxy == [src]
+
+
+def test_tampered_urls_are_rejected(app, client, proxy):
+    src, url = signed(app)
+    digest = url.split('/')[2]
+    assert client.get(url.replace(digest, '0' * len(digest))).status_code == 404
+    assert client.get(url.replace('.png', '.jpg')).status_code == 404
+    assert client.get(url.split('?')[0]).status_code == 404
+    # Only the configured widths
+    assert client.get(url.replace('/320.', '/321.')).status_code == 404
+    assert proxy == []
+
+
+def test_failed_fetch_redirects_to_the_source(app, client, proxy, monkeypatch):
+    def fetcher(url):
+        raise FetchError('Not a public address: example.com')
+
+    monkeypatch.setattr(images(), 'fetcher', fetcher)
+    src, url = signed(app)
+    response = client.get(url)
+    assert response.status_code == 302 and response.headers['Location'] == src
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+
+@pytest.mark.parametrize('host', ['127.0.0.1', '10.1.2.3', '192.168.0.10', '169.254.169.254', '::1', '0.0.0.0',
+                                  'localhost'])
+def test_private_addresses_are_refused(host):
+    with pytest.raises(FetchError):
+        public_address(host)
+
+
+def resolving(monkeypatch, addresses):
+    # host -> addresses for the names the test uses; IP literals resolve as usual
+    resolve = socket.getaddrinfo
+
+    def getaddrinfo(host, *args, **kwargs):
+        if host in addresses:
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, 0)) for address in addresses[host]]
+        return resolve(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+
+
+def test_a_name_with_any_private_address_is_refused(monkeypatch):
+    resolving(monkeypatch, {"public.example": ['93.184.216.34'], "mixed.example": ['93.184.216.34', '10.0.0.5']})
+    assert public_address('public.example') == '93.184.216.34'
+    with pytest.raises(FetchError):
+        public_address('mixed.example')
+
+
+def test_redirects_to_private_addresses_are_refused(monkeypatch):
+    resolving(monkeypatch, {"public.example": ['93.184.216.34'], "internal.example": ['10.0.0.5']})
+    connected = []
+
+    class Redirecting(object):
+        # Answers every request with a redirect to the internal host
+        def __init__(self, host, address, **kwargs):
+            connected.append(address)
+
+        def request(self, method, path, headers):
+            pass
+
+        def getresponse(self):
+            class Response(object):
+                status = 302
+
+                def getheader(self, name, default=None):
+                    return 'http://internal.example/metadata'
+            return Response()
+
+        def close(self):
+            pass
+
+    monkeypatch.setitem(CONNECTIONS, 'http', Redirecting)
+    with pytest.raises(FetchError, match='Not a public address'):
+        http_fetcher(timeout=1, max_bytes=1024)('http://public.example/a.png')
+    assert connected == ['93.184.216.34']
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from models import Venue
+
+VENUE = {"name": 'The Dive', "city": 'Austin', "state": 'TX', "phone": '123-123-1234', "genres": ['Jazz']}
+
+
+@pytest.fixture
+def token(app):
+    app.config['IMPORT_TOKEN'] = 'secret'
+    yield 'secret'
+    app.config['IMPORT_TOKEN'] = None
+
+
+def post(client, content_type, token=None):
+    headers = {'Authorization': 'Bearer %s' % token} if token else {}
+    return client.post('/api/v1/import/venues', data=json.dumps(VENUE) + '\n', content_type=content_type,
+                       headers=headers)
+
+
+def test_disabled_without_a_token(app, client):
+    assert post(client, 'application/x-ndjson').status_code == 404
+    assert Venue.query.count() == 0
+
+
+def test_requires_the_token(token, client):
+    assert post(client, 'application/x-ndjson').status_code == 401
+    assert post(client, 'application/x-ndjson', 'wrong').status_code == 401
+    assert Venue.query.count() == 0
+
+
+@pytest.mark.parametrize('content_type', ['text/plain', 'application/x-www-form-urlencoded', 'application/json'])
+def test_rejects_other_content_types(token, client, content_type):
+    assert post(client, content_type, token).status_code == 415
+    assert Venue.query.count() == 0
+
+
+def test_imports_json_lines(token, client):
+    response = post(client, 'application/x-ndjson', token)
+    assert response.status_code == 200
+    assert response.get_json()["inserted"] == 1
+    assert Venue.query.one().name == 'The Dive'
+
+
+def export(client, token=None):
+    headers = {'Authorization': 'Bearer %s' % token} if token else {}
+    return client.get('/api/v1/export/venues', headers=headers)
+
+
+def test_export_disabled_without_a_token(app, client):
+    assert export(client).status_code == 404
+
+
+def test_export_requires_the_token(token, client):
+    assert export(client).status_code == 401
+    assert export(client, 'wrong').status_code == 401
+
+
+def test_exports_json_lines(token, client):
+    post(client, 'application/x-ndjson', token)
+    response = export(client, token)
+    assert response.status_code == 200
+    assert [json.loads(line)["name"] for line in response.get_data(as_text=True).splitlines()] == ['The Dive']
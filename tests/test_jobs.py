@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+import pytest
+
+from counters import check_counters, rollover
+from jobs import claim, enqueue, task, work
+from models import Artist, Job, Venue, db
+from tests.factories import add_artist, add_show, add_venue
+
+calls = []
+failures = set()
+
+
+@task('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task('tests.fail_once')
+def fail_once(value):
+    if value not in failures:
+        failures.add(value)
+        raise RuntimeError('first attempt fails')
+    calls.append(value)
+
+
+@task('tests.fail')
+def fail(value):
+    raise RuntimeError('always fails')
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    calls.clear()
+    failures.clear()
+
+
+def job():
+    db.session.expire_all()
+    return Job.query.one()
+
+
+def test_claim_locks_the_job_for_one_worker(app, clock):
+    enqueue('tests.record', {"value": 1})
+    db.session.commit()
+    claimed = claim('first')
+    assert (claimed.status, claimed.attempts, claimed.locked_by) == ('running', 1, 'first')
+    assert claim('second') is None
+
+
+def test_stale_lock_is_taken_over(app, clock):
+    enqueue('tests.record', {"value": 1})
+    db.session.commit()
+    job_id = claim('first').id
+    clock.advance(timedelta(seconds=app.config['JOBS_LOCK_TIMEOUT'] + 1))
+    claimed = claim('second')
+    assert (claimed.id, claimed.attempts, claimed.locked_by) == (job_id, 2, 'second')
+
+
+def test_jobs_wait_for_their_run_at(app, clock):
+    enqueue('tests.record', {"value": 1}, run_at=clock.now + timedelta(hours=1))
+    db.session.commit()
+    work(app, 'test', burst=True)
+    assert calls == []
+    clock.advance(timedelta(hours=1))
+    work(app, 'test', burst=True)
+    assert calls == [1] and job().status == 'done'
+
+
+def test_failed_job_is_retried_after_a_backoff(app, clock):
+    enqueue('tests.fail_once', {"value": 1})
+    db.session.commit()
+    work(app, 'test', burst=True)
+    failed = job()
+    assert (failed.status, failed.attempts) == ('queued', 1)
+    assert 'first attempt fails' in failed.last_error
+    assert failed.run_at.astimezone() > clock.now
+    work(app, 'test', burst=True)
+    assert calls == []
+    clock.advance(timedelta(seconds=app.config['JOBS_BACKOFF_BASE'] * 2))
+    work(app, 'test', burst=True)
+    done = job()
+    assert (done.status, done.attempts, done.last_error) == ('done', 2, None)
+    assert calls == [1]
+
+
+def test_job_fails_after_max_attempts(app, clock):
+    enqueue('tests.fail', {"value": 1}, max_attempts=2)
+    db.session.commit()
+    for _ in range(3):
+        work(app, 'test', burst=True)
+        clock.advance(timedelta(seconds=app.config['JOBS_BACKOFF_MAX'] * 2))
+    failed = job()
+    assert (failed.status, failed.attempts) == ('failed', 2)
+
+
+def test_idempotency_key_queues_once(app, clock):
+    for _ in range(2):
+        enqueue('tests.record', {"value": 1}, key='record:1')
+    db.session.commit()
+    work(app, 'test', burst=True)
+    # Also once the job has run
+    enqueue('tests.record', {"value": 1}, key='record:1')
+    db.session.commit()
+    work(app, 'test', burst=True)
+    assert Job.query.count() == 1
+    assert calls == [1]
+
+
+def test_rollover_can_run_again(app, clock):
+    venue, artist = add_venue(0), add_artist(0)
+    db.session.flush()
+    show = add_show(venue, artist, 0)
+    show.start_time = clock.now + timedelta(hours=1)
+    db.session.commit()
+    venue_id, artist_id = venue.id, artist.id
+    clock.advance(timedelta(hours=2))
+    work(app, 'test', burst=True)
+    assert job().status == 'done' and check_counters() == []
+    # A retried or duplicate run recounts to the same values
+    rollover([venue_id], [artist_id])
+    assert check_counters() == []
+    assert db.session.execute(db.select(Venue.upcoming_shows_count, Venue.past_shows_count)).one() == (0, 1)
+    assert db.session.execute(db.select(Artist.upcoming_shows_count, Artist.past_shows_count)).one() == (0, 1)
@@ -0,0 +1,25 @@
+import pytest
+
+from tests.factories import seed_venues
+
+
+@pytest.fixture
+def token(app):
+    app.config['METRICS_TOKEN'] = 'secret'
+    yield 'secret'
+    app.config['METRICS_TOKEN'] = None
+
+
+def test_token_required_when_set(client, token):
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_no_statement_text_in_labels(app, client):
+    seed_venues(1, 1)
+    client.get('/venues')
+    body = client.get('/metrics').get_data(as_text=True)
+    slowest = [line for line in body.splitlines() if line.startswith('fyyur_slowest_query_seconds{')]
+    assert slowest and all(line.startswith('fyyur_slowest_query_seconds{endpoint=') for line in slowest)
+    assert 'statement=' not in body and 'SELECT' not in body
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+import pytest
+
+from cache import artist_key, venue_key
+from models import Show, db
+from tests.factories import add_artist, add_show, add_venue, csrf_token
+
+
+@pytest.fixture
+def booked(app):
+    venues = [add_venue(0), add_venue(1)]
+    artist = add_artist(0)
+    # The edit form expects one
+    artist.website = 'https://example.com'
+    db.session.flush()
+    show = add_show(venues[0], artist, 7)
+    db.session.commit()
+    return venues[0].id, venues[1].id, artist.id, show.id
+
+
+def cached_keys(app, client, venue_ids, artist_id):
+    for venue_id in venue_ids:
+        assert client.get('/venues/%d' % venue_id).status_code == 200
+    assert client.get('/artists/%d' % artist_id).status_code == 200
+    return set(app.extensions['cache'].entries)
+
+
+def edit(client, path, form):
+    return client.post(path, data=dict(form, csrf_token=csrf_token(client, path)))
+
+
+def test_venue_edit_drops_its_page_and_its_artists(app, client, booked):
+    venue_id, _, artist_id, _ = booked
+    assert {venue_key(venue_id), artist_key(artist_id)} <= cached_keys(app, client, [venue_id], artist_id)
+    edit(client, '/venues/%d/edit' % venue_id, {
+        "name": 'Renamed Venue', "city": 'Austin', "state": 'TX', "phone": '123-123-1234', "address": '',
+        "genres": 'Jazz', "facebook_link": '', "image_link": '', "seeking_description": ''})
+    assert not {venue_key(venue_id), artist_key(artist_id)} & set(app.extensions['cache'].entries)
+    assert 'Renamed Venue' in client.get('/artists/%d' % artist_id).get_data(as_text=True)
+
+
+def test_artist_edit_drops_its_page_and_its_venues(app, client, booked):
+    venue_id, _, artist_id, _ = booked
+    assert {venue_key(venue_id), artist_key(artist_id)} <= cached_keys(app, client, [venue_id], artist_id)
+    edit(client, '/artists/%d/edit' % artist_id, {
+        "name": 'Renamed Artist', "city": 'Austin', "state": 'TX', "phone": '123-123-1234', "address": '',
+        "genres": 'Jazz', "facebook_link": 'https://example.com/fb', "image_link": 'https://example.com/a.png',
+        "website": 'https://example.com', "seeking_description": ''})
+    assert not {venue_key(venue_id), artist_key(artist_id)} & set(app.extensions['cache'].entries)
+    assert 'Renamed Artist' in client.get('/venues/%d' % venue_id).get_data(as_text=True)
+
+
+def test_moving_a_show_drops_both_venues_and_the_artist(app, client, booked):
+    venue_id, other_venue_id, artist_id, show_id = booked
+    keys = {venue_key(venue_id), venue_key(other_venue_id), artist_key(artist_id)}
+    assert keys <= cached_keys(app, client, [venue_id, other_venue_id], artist_id)
+    start_time = db.session.get(Show, show_id).start_time + timedelta(days=1)
+    edit(client, '/shows/%d/edit' % show_id, {
+        "title": 'Moved show', "artist_id": artist_id, "venue_id": other_venue_id,
+        "start_time": start_time.strftime('%Y-%m-%d %H:%M:%S'), "end_time": '', "description": '',
+        "register_link": ''})
+    assert not keys & set(app.extensions['cache'].entries)
+    assert 'Moved show' in client.get('/venues/%d' % other_venue_id).get_data(as_text=True)
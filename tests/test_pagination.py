@@ -0,0 +1,73 @@
+from urllib.parse import urlsplit
+
+import pytest
+from sqlalchemy import select
+
+from models import Venue, db
+from pagination import encode_cursor, paginate
+from tests.factories import add_venue
+
+# Repeated names, so pages split runs of equal sort values
+NAMES = ['B', 'A', 'C', 'A', 'B', 'D', 'A', 'C']
+
+SORTS = {
+    'ascending': [(Venue.name, 'name', False), (Venue.id, 'id', False)],
+    'mixed': [(Venue.name, 'name', True), (Venue.id, 'id', False)],
+}
+
+
+@pytest.fixture
+def venues(app):
+    rows = [add_venue(index) for index in range(len(NAMES))]
+    for venue, name in zip(rows, NAMES):
+        venue.name = name
+    db.session.commit()
+    return sorted((venue.name, venue.id) for venue in rows)
+
+
+def expected(venues, sort):
+    if sort == 'mixed':
+        return [venue_id for _, venue_id in sorted(venues, key=lambda row: (-ord(row[0]), row[1]))]
+    return [venue_id for _, venue_id in venues]
+
+
+def page(app, sort_keys, url='/venues'):
+    with app.test_request_context(url):
+        result = paginate(select(Venue.id, Venue.name), sort_keys, 3)
+    return [row['id'] for row in result['items']], result['next_url'], result['prev_url']
+
+
+def path(url):
+    parts = urlsplit(url)
+    return '%s?%s' % (parts.path, parts.query)
+
+
+@pytest.mark.parametrize('sort', sorted(SORTS))
+def test_forward_and_back_walks_see_every_row_once(app, venues, sort):
+    pages = []
+    ids, next_url, prev_url = page(app, SORTS[sort])
+    assert prev_url is None
+    pages.append(ids)
+    while next_url:
+        ids, next_url, prev_url = page(app, SORTS[sort], path(next_url))
+        pages.append(ids)
+    assert [venue_id for ids in pages for venue_id in ids] == expected(venues, sort)
+    assert [len(ids) for ids in pages] == [3, 3, 2]
+
+    walked_back = [pages[-1]]
+    while prev_url:
+        ids, _, prev_url = page(app, SORTS[sort], path(prev_url))
+        walked_back.append(ids)
+    assert walked_back == pages[::-1]
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    encode_cursor({"name": 'A'}),
+    # One value for two sort keys
+    encode_cursor(['A']),
+    encode_cursor(['A', 'x']),
+])
+def test_tampered_cursor_is_rejected(app, client, venues, cursor):
+    assert client.get('/venues', query_string={"after": cursor}).status_code == 400
+    assert client.get('/shows', query_string={"before": cursor}).status_code == 400
@@ -0,0 +1,34 @@
+from models import Show, Venue, db
+from recommend import Recommender, recommendations, recommender
+from tests.factories import add_artist, add_show, add_venue
+
+
+def seed():
+    venues = [add_venue(index) for index in range(2)]
+    artists = [add_artist(index) for index in range(2)]
+    db.session.flush()
+    show = add_show(venues[0], artists[0], 3)
+    db.session.commit()
+    return [venue.id for venue in venues], [artist.id for artist in artists], show
+
+
+def test_recommends_the_other_kind(app):
+    venue_ids, artist_ids, _ = seed()
+    assert {match["id"] for match in recommendations('venues', venue_ids[0])} == set(artist_ids)
+    assert recommendations('venues', 999) is None
+
+
+def test_moved_show_touches_old_and_new_rows(app):
+    venue_ids, artist_ids, show = seed()
+    engine = recommender()
+    engine.recommend('venues', venue_ids[0], 5)
+    show.venue_id, show.artist_id = venue_ids[1], artist_ids[1]
+    db.session.commit()
+    assert engine.dirty == {'venues': set(venue_ids), 'artists': set(artist_ids)}
+
+
+def test_recommenders_share_one_set_of_listeners(app):
+    listeners = len(Venue.__mapper__.dispatch.after_insert), len(Show.__mapper__.dispatch.after_update)
+    for _ in range(5):
+        Recommender({}, 60)
+    assert (len(Venue.__mapper__.dispatch.after_insert), len(Show.__mapper__.dispatch.after_update)) == listeners
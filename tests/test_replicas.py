@@ -0,0 +1,63 @@
+import pytest
+from flask import Flask, request
+from sqlalchemy import insert, select
+
+from models import Venue, db
+from replicas import replica_setup
+
+VENUE = {"city": 'Austin', "state": 'TX', "phone": '123-123-1234', "genres": ['Jazz']}
+
+
+@pytest.fixture
+def routed(tmp_path):
+    """An app over two SQLite files, the second bound as its replica. They
+    hold different venues, so a page shows which one it read."""
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', SQLALCHEMY_DATABASE_URI='sqlite:///%s' % (tmp_path / 'primary.db'),
+                      SQLALCHEMY_BINDS={'replica_0': 'sqlite:///%s' % (tmp_path / 'replica.db')},
+                      REPLICA_CHECK_INTERVAL=30, REPLICA_RETRY_INTERVAL=5, REPLICA_MAX_LAG=0,
+                      REPLICA_STICKY_SECONDS=10)
+    db.init_app(app)
+    replica_setup(app, db)
+
+    @app.route('/venues', methods=['GET', 'POST'])
+    def venues():
+        if request.method == 'POST':
+            db.session.add(Venue(name=request.form['name'], **VENUE))
+            db.session.commit()
+        return ','.join(db.session.execute(select(Venue.name).order_by(Venue.name)).scalars())
+
+    with app.app_context():
+        for key, name in ((None, 'Primary'), ('replica_0', 'Replica')):
+            db.metadata.create_all(db.engines[key])
+            with db.engines[key].begin() as connection:
+                connection.execute(insert(Venue), [dict(VENUE, name=name)])
+    # Outside the app context, so each request gets its own g and session
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_reads_go_to_the_replica(routed):
+    assert routed.test_client().get('/venues').get_data(as_text=True) == 'Replica'
+
+
+def test_writes_go_to_the_primary_and_the_session_sticks_to_it(routed):
+    client = routed.test_client()
+    assert client.post('/venues', data={"name": 'Written'}).get_data(as_text=True) == 'Primary,Written'
+    assert client.get('/venues').get_data(as_text=True) == 'Primary,Written'
+    # Other clients still read the replica
+    assert routed.test_client().get('/venues').get_data(as_text=True) == 'Replica'
+
+
+def test_reads_return_to_the_replica_after_the_sticky_window(routed):
+    routed.config['REPLICA_STICKY_SECONDS'] = -1
+    client = routed.test_client()
+    client.post('/venues', data={"name": 'Written'})
+    assert client.get('/venues').get_data(as_text=True) == 'Replica'
+
+
+def test_reads_fall_back_to_the_primary_while_the_replica_is_down(routed):
+    routed.extensions['replicas'].mark_down('replica_0')
+    assert routed.test_client().get('/venues').get_data(as_text=True) == 'Primary'
@@ -0,0 +1,46 @@
+from sqlalchemy import true
+
+from models import Venue, db
+from search import MemorySearch, match
+from tests.factories import add_venue, seed_venues
+
+
+def test_empty_term_matches_every_row(app):
+    seed_venues(3, 0)
+    criterion, rank = match(Venue, '  ')
+    assert criterion.compare(true())
+    assert 'CASE' not in str(rank) and 'IN' not in str(criterion)
+
+
+def test_empty_search_lists_every_venue(app, client):
+    seed_venues(12, 0)
+    body = client.get('/venues/search?search_term=').get_data(as_text=True)
+    for index in range(12):
+        assert 'Venue %d<' % index in body
+
+
+def test_term_matches_names(app, client):
+    seed_venues(12, 0)
+    body = client.get('/venues/search?search_term=Venue 11').get_data(as_text=True)
+    assert 'Venue 11<' in body
+
+
+def test_short_terms_match_inside_words(app, client):
+    seed_venues(1, 0)
+    body = client.get('/artists/search?search_term=rt').get_data(as_text=True)
+    assert 'Artist 0<' in body
+
+
+def test_writes_reach_the_index(app, client):
+    seed_venues(1, 0)
+    assert 'Venue 0<' in client.get('/venues/search?search_term=Venue').get_data(as_text=True)
+    add_venue(7)
+    db.session.commit()
+    assert 'Venue 7<' in client.get('/venues/search?search_term=Venue').get_data(as_text=True)
+
+
+def test_backends_share_one_set_of_listeners(app):
+    listeners = len(Venue.__mapper__.dispatch.after_insert)
+    for _ in range(5):
+        MemorySearch()
+    assert len(Venue.__mapper__.dispatch.after_insert) == listeners
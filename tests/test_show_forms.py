@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Show, db
+from tests.factories import add_artist, add_venue, csrf_token
+
+FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+@pytest.fixture
+def booking(app):
+    venue, artist = add_venue(1), add_artist(1)
+    db.session.commit()
+    start_time = datetime.now().replace(microsecond=0) + timedelta(days=7)
+    return {"title": 'Late show', "artist_id": str(artist.id), "venue_id": str(venue.id),
+            "start_time": start_time.strftime(FORMAT), "end_time": '', "description": '', "register_link": ''}
+
+
+def create(client, form):
+    return client.post('/shows/create', data=dict(form, csrf_token=csrf_token(client, '/shows/create')))
+
+
+def test_valid_show_is_listed(client, booking):
+    body = create(client, booking).get_data(as_text=True)
+    assert 'was successfully listed' in body
+    assert Show.query.count() == 1
+
+
+def test_show_without_a_picked_artist_is_rejected(client, booking):
+    body = create(client, dict(booking, artist_id='')).get_data(as_text=True)
+    assert 'Choose an artist from the suggestions.' in body
+    assert 'successfully' not in body
+    assert Show.query.count() == 0
+
+
+def test_show_ending_before_it_starts_is_rejected(client, booking):
+    start_time = datetime.strptime(booking["start_time"], FORMAT)
+    body = create(client, dict(booking, end_time=(start_time - timedelta(hours=1)).strftime(FORMAT))) \
+        .get_data(as_text=True)
+    assert 'The show must end after it starts.' in body
+    assert 'successfully' not in body
+    assert Show.query.count() == 0
+
+
+def test_invalid_edit_returns_to_the_form(client, booking):
+    create(client, booking)
+    show_id = Show.query.one().id
+    path = '/shows/%d/edit' % show_id
+    start_time = datetime.strptime(booking["start_time"], FORMAT)
+    form = dict(booking, title='Renamed', end_time=(start_time - timedelta(hours=1)).strftime(FORMAT),
+                csrf_token=csrf_token(client, path))
+    response = client.post(path, data=form)
+    assert response.status_code == 302 and response.headers['Location'].endswith(path)
+    assert 'The show must end after it starts.' in client.get(path).get_data(as_text=True)
+    db.session.expire_all()
+    assert Show.query.one().show_title == 'Late show'
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+import pytest
+
+from helpers import is_upcoming
+from models import db
+from queries import artist_shows, venue_shows
+from tests.factories import add_artist, add_show, add_venue
+
+# Offsets from now: a show starting right now is upcoming until it has started
+OFFSETS = {'earlier': -timedelta(seconds=1), 'now': timedelta(0), 'later': timedelta(seconds=1)}
+
+
+@pytest.fixture
+def shows(app, clock):
+    venue, artist = add_venue(0), add_artist(0)
+    db.session.flush()
+    for title, offset in OFFSETS.items():
+        add_show(venue, artist, 0, title).start_time = clock.now + offset
+    db.session.commit()
+    return venue.id, artist.id
+
+
+def titles(venue_id, artist_id, upcoming):
+    found = [row['title'] for row in venue_shows(venue_id, upcoming)]
+    assert [row['title'] for row in artist_shows(artist_id, upcoming)] == found
+    return found
+
+
+def test_split_at_now(shows):
+    assert titles(*shows, upcoming=False) == ['earlier']
+    assert titles(*shows, upcoming=True) == ['now', 'later']
+
+
+def test_show_becomes_past_once_started(shows, clock):
+    clock.advance(timedelta(microseconds=1))
+    assert titles(*shows, upcoming=False) == ['earlier', 'now']
+    assert titles(*shows, upcoming=True) == ['later']
+
+
+def test_is_upcoming_matches_the_query(clock):
+    assert is_upcoming(clock.now)
+    assert not is_upcoming(clock.now - timedelta(microseconds=1))
+    # Naive values are local time
+    assert is_upcoming(clock.now.replace(tzinfo=None) + timedelta(seconds=1))
+    assert not is_upcoming(clock.now.replace(tzinfo=None) - timedelta(seconds=1))
@@ -0,0 +1,16 @@
+from tests.factories import query_count, seed_venues
+
+
+def test_query_count_is_constant(app, client, statements):
+    # Areas, venues and upcoming counts come from one grouped query
+    seed_venues(5, 2)
+    few = query_count(client, statements, '/venues')
+    seed_venues(45, 2)
+    assert query_count(client, statements, '/venues') == few
+
+
+def test_lists_every_venue_once(app, client):
+    seed_venues(12, 1)
+    body = client.get('/venues').get_data(as_text=True)
+    for index in range(12):
+        assert body.count('>Venue %d<' % index) == 1